@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Graphs migration: bulk conversion of the gpickle outputs of the vectorisation
+(networkx 1.x or 2.x, Python 2 or 3) into the compact npz format (cf
+nu.writeGraphNpz()), which is much faster to load and doesn't depend on the
+networkx or Python versions.
+
+- the source directory tree is walked for *.gpickle files, and the npz files
+are written with the same relative paths in the destination tree (next to the
+gpickles if both are the same)
+- the graphs are converted in parallel by a pool of worker processes
+- each npz file stores the checksum of its arrays, and is read back and
+verified against the checksum of the source graph before being accepted
+- a progress journal (one JSON line per converted file) is kept at the root of
+the destination tree: when the migration is interrupted and run again, the
+files already converted, and unchanged since, are skipped
+
+The gpickle files are left untouched. When the npz files are written next to
+them (dest_path empty, the default), the other stages read each slice once,
+from its npz file (cf nu.preloadGraphs()).
+"""
+
+# Standard imports
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import json
+import os
+import time
+
+# Custom functions
+import net_utilities as nu
+
+# Log of the migration, cf nu.startLog()
+log = nu.getLog('MIGRATE')
+
+
+def init():
+    """
+    Initializes parameters.
+
+    # General parameters
+    :param str source_path: absolute path of the directory tree containing
+        the gpickle files to convert
+    :param str dest_path: absolute path of the directory tree in which to
+        save the npz files. If empty, they are saved next to the gpickles, 
+        which the overlay and the tracking then ignore (cf 
+        nu.preloadGraphs()). If it doesn't exist, it will be created at 
+        runtime.
+    :param bool verbose: verbosity switch
+
+    # Migration parameters
+    :param int workers: the number of worker processes converting graphs in
+        parallel
+    :param bool compressed: True to compress the npz files (smaller but
+        slower to write and read), False otherwise
+    :param str journal_name: the name of the progress journal, at the root
+        of dest_path
+    """
+
+    # General parameters
+    source_path = '/home/hyphes/LAURA/tests/Conversion_gpickle' # root of the gpickles to convert
+    dest_path = '' # root of the npz files, next to the gpickles if empty
+    verbose = True
+    main_params = [source_path, dest_path, verbose]
+
+    # Migration parameters
+    workers = 4
+    compressed = True
+    journal_name = 'migration_journal.jsonl'
+    migration_params = [workers, compressed, journal_name]
+
+    return main_params, migration_params
+
+def findGpickles(source_path):
+    """
+    Walks a directory tree to find all the gpickle files, in natural order.
+
+    :param str source_path: the absolute path of the root of the tree
+
+    :return: the relative paths of the gpickle files
+    :rtype: list(str)
+    """
+
+    paths = []
+    for root, dirs, files in os.walk(source_path):
+        dirs.sort(key=nu.naturalKey)
+        for name in sorted(files, key=nu.naturalKey):
+            if nu.checkExtension(name, ['.gpickle']):
+                paths.append(os.path.relpath(os.path.join(root, name),
+                                             source_path))
+    return paths
+
+def readJournal(journal_path):
+    """
+    Reads the progress journal of a migration. A line cut by an interruption
+    is ignored.
+
+    :param str journal_path: the absolute path of the journal
+
+    :return: the last entry of each source file, by relative path
+    :rtype: dict{str: dict}
+    """
+
+    entries = {}
+    if not os.path.isfile(journal_path):
+        return entries
+    with open(journal_path) as journal:
+        for line in journal:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            entries[entry['source']] = entry
+    return entries
+
+def isMigrated(entry, source, dest):
+    """
+    Checks if a gpickle file was already converted by a previous run: its
+    journal entry is a success, it hasn't changed since and its npz file
+    still exists.
+
+    :param dict entry: the journal entry of the file, or None
+    :param str source: the absolute path of the gpickle file
+    :param str dest: the absolute path of its npz file
+
+    :return: True if the file can be skipped, False otherwise
+    :rtype: bool
+    """
+
+    if entry is None or entry['status'] != 'done' or not os.path.isfile(dest):
+        return False
+    stat = os.stat(source)
+    return entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime
+
+def migrateGraph(relative_path, source_path, dest_path, compressed):
+    """
+    Converts one gpickle file into a npz file, written under a temporary
+    name then verified against the checksum of the source graph before being
+    renamed, so that an interrupted conversion never leaves a truncated npz
+    file.
+
+    :param str relative_path: the path of the gpickle file, relative to
+        source_path
+    :param str source_path: the absolute path of the source tree
+    :param str dest_path: the absolute path of the destination tree
+    :param bool compressed: True to compress the npz file, False otherwise
+
+    :return: the journal entry of the file: its relative path, size and
+        modification time, the status ('done' or 'error'), the checksum of
+        the arrays, the number of nodes and edges, or the error message
+    :rtype: dict
+    """
+
+    source = os.path.join(source_path, relative_path)
+    dest = os.path.splitext(os.path.join(dest_path, relative_path))[0] + '.npz'
+    stat = os.stat(source)
+    entry = {'source':relative_path, 'size':stat.st_size,
+             'mtime':stat.st_mtime, 'dest':os.path.relpath(dest, dest_path)}
+    start = time.time()
+
+    try:
+        G = nu.readGpickle(source)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        part = dest + '.part'
+        with open(part, 'wb') as file:
+            checksum = nu.writeGraphNpz(G, file, compressed, checksum=True)
+        if not nu.verifyGraphNpz(part, checksum):
+            os.remove(part)
+            raise ValueError('checksum mismatch after writing')
+        os.replace(part, dest)
+    except Exception as e:
+        entry.update(status='error', error=repr(e))
+    else:
+        entry.update(status='done', checksum=checksum,
+                     nodes=G.number_of_nodes(), edges=G.number_of_edges())
+    entry['time'] = time.time()-start
+    return entry
+
+def convertGraphs(todo, source_path, dest_path, compressed, workers):
+    """
+    Converts gpickle files into npz files (cf migrateGraph()), either inline
+    (workers = 1) or on a pool of worker processes.
+
+    :param todo: the paths of the gpickle files to convert, relative to
+        source_path
+    :type todo: list(str)
+    :param str source_path: the absolute path of the source tree
+    :param str dest_path: the absolute path of the destination tree
+    :param bool compressed: True to compress the npz files, False otherwise
+    :param int workers: the number of worker processes
+
+    :return: a generator of the journal entries of the files, in order of
+        completion
+    :rtype: generator(dict)
+    """
+
+    if workers <= 1:
+        for path in todo:
+            yield migrateGraph(path, source_path, dest_path, compressed)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(migrateGraph, path, source_path, dest_path,
+                                   compressed) for path in todo]
+        for future in as_completed(futures):
+            yield future.result()
+
+def migrate(main_params, migration_params, manual_log_path='',
+            json_log_path=''):
+    """
+    Converts all the gpickle files of a directory tree into npz files, in
+    parallel, resuming an interrupted migration. Cf init() for more details
+    on the parameters.
+
+    :param main_params: a list of the main parameters
+    :type main_params: [str, str, bool]
+    :param migration_params: a list of the migration parameters
+    :type migration_params: [int, bool, str]
+    :param str manual_log_path: the absolute path of the log file. By default,
+        a file 'log.txt' will be created at the root of the dest_path directory.
+    :param str json_log_path: the absolute path of an optional second log
+        file, written as JSON lines (cf nu.startLog())
+
+    :return: the journal entries of the files converted by this run
+    :rtype: list(dict)
+    """
+
+    source_path, dest_path, verbose = main_params
+    workers, compressed, journal_name = migration_params
+    if not dest_path:
+        dest_path = source_path
+
+    # Log path determination
+    if manual_log_path:
+        log_path = manual_log_path
+    else:
+        log_path = os.path.join(dest_path, 'log.txt')
+
+    # Creation of the dest directory if it doesn't exist
+    if not os.path.exists(dest_path):
+        os.makedirs(dest_path)
+
+    nu.startLog(log_path, verbose, json_log_path)
+
+    if not os.path.isdir(source_path):
+        txt = ('The source_path given as parameter does not refer to '
+               'an existing directory.')
+        log.error(txt)
+        raise FileNotFoundError(txt)
+
+    start = time.time()
+    txt = 'Listing the gpickle files...'
+    log.info(txt)
+
+    journal_path = os.path.join(dest_path, journal_name)
+    journal = readJournal(journal_path)
+    paths = findGpickles(source_path)
+    todo = [path for path in paths
+            if not isMigrated(journal.get(path),
+                              os.path.join(source_path, path),
+                              os.path.splitext(os.path.join(dest_path,
+                                                            path))[0] + '.npz')]
+
+    txt = ('...{} gpickle file(s) found, {} already converted.'
+           .format(len(paths), len(paths)-len(todo)))
+    log.info(txt)
+    txt = 'Converting with {} worker(s)...'.format(workers)
+    log.info(txt)
+
+    results = convertGraphs(todo, source_path, dest_path, compressed, workers)
+
+    # The journal is appended as the files are done, one line each, so that
+    # an interruption loses the files in progress only
+    entries = []
+    with open(journal_path, 'a') as journal:
+        for entry in nu.tqdm(results, total=len(todo), unit='graph',
+                             desc='Migration', disable=not verbose):
+            journal.write(json.dumps(entry) + '\n')
+            journal.flush()
+            entries.append(entry)
+            if entry['status'] == 'done':
+                txt = ('   {} converted in {:.4f} s ({} nodes, {} edges).'
+                       .format(entry['source'], entry['time'],
+                               entry['nodes'], entry['edges']))
+                log.info(txt, extra=nu.quiet_log)
+            else:
+                txt = ('   ERROR: {} could not be converted ({}).'
+                       .format(entry['source'], entry['error']))
+                log.error(txt)
+
+    failed = sum(entry['status'] != 'done' for entry in entries)
+    end = time.time()-start
+    txt = ('DONE in {:.0f} min {:.4f} s: {} file(s) converted, {} error(s).'
+           .format(end // 60, end % 60, len(entries)-failed, failed))
+    log.info(txt)
+    nu.stopLog()
+
+    return entries
+
+
+if __name__ == '__main__':
+
+    main_params, migration_params = init()
+    migrate(main_params, migration_params)
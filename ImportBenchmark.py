@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This program measures the startup time of the entry points of the pipeline:
+vectorize (Vectorisation.py), overlay (Superposition.py) and tracking
+(TrackNodes.py). Their heavy dependencies (cv2, matplotlib, pandas, scipy,
+skimage, trackpy...) are only imported at their first use (cf
+nu.LazyImport), so that the worker processes and the short runs don't pay
+for the ones they don't need.
+
+Each entry point is imported in a fresh interpreter, several times, and the
+median time is reported twice:
+    - lazy: the import of the module alone, as done now
+    - eager: the import of the module followed by the import of all its
+    deferred dependencies, as done when they were imported at the top of the
+    modules
+"""
+
+# Standard imports
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+# Program run in a fresh interpreter for each measure, prints a json line
+child_program = '''
+import importlib
+import json
+import sys
+import time
+
+start = time.perf_counter()
+importlib.import_module({module!r})
+lazy = time.perf_counter() - start
+
+import net_utilities as nu
+deferred = sorted(nu.lazy_modules)
+loaded = [name for name in deferred if name in sys.modules]
+for name in deferred:
+    importlib.import_module(name)
+eager = time.perf_counter() - start
+
+print(json.dumps({{'lazy': lazy, 'eager': eager, 'deferred': deferred,
+                  'loaded': loaded}}))
+'''
+
+
+def init():
+    """
+    Initializes parameters.
+
+    :param entry_points: the entry points to measure, among 'vectorize',
+        'overlay' and 'tracking'
+    :type entry_points: list(str)
+    :param int runs: the number of fresh interpreters started for each entry
+        point, the median time is reported
+    :param bool verbose: verbosity switch, prints the deferred dependencies
+        of each entry point
+    """
+
+    entry_points = ['vectorize', 'overlay', 'tracking']
+    runs = 5
+    verbose = True
+
+    return entry_points, runs, verbose
+
+def measureImport(module, runs):
+    """
+    Measures the import time of a module, in fresh interpreters started from
+    the directory of this program.
+
+    :param str module: the name of the module to import
+    :param int runs: the number of measures
+
+    :return: the median lazy and eager import times in seconds, the names of
+        the deferred dependencies and the ones that were loaded anyway by the
+        lazy import
+    :rtype: (float, float, list(str), list(str))
+    """
+
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    measures = []
+    for run in range(runs):
+        output = subprocess.run([sys.executable, '-c',
+                                 child_program.format(module=module)],
+                                cwd=cwd, stdout=subprocess.PIPE, check=True,
+                                universal_newlines=True).stdout
+        measures.append(json.loads(output.splitlines()[-1]))
+
+    return (statistics.median(m['lazy'] for m in measures),
+            statistics.median(m['eager'] for m in measures),
+            measures[-1]['deferred'], measures[-1]['loaded'])
+
+def benchmark(entry_points, runs, verbose):
+    """
+    Prints the lazy and eager import times of the entry points. Cf init() for
+    more details on the parameters.
+
+    :return: the lazy and eager import times in seconds by entry point
+    :rtype: dict(str: (float, float))
+    """
+
+    modules = {'vectorize': 'Vectorisation', 'overlay': 'Superposition',
+               'tracking': 'TrackNodes'}
+    times = {}
+
+    print('{:<10} {:<14} {:>9} {:>9} {:>9}'
+          .format('entry', 'module', 'lazy (s)', 'eager (s)', 'speedup'))
+    for entry in entry_points:
+        lazy, eager, deferred, loaded = measureImport(modules[entry], runs)
+        times[entry] = (lazy, eager)
+        print('{:<10} {:<14} {:>9.3f} {:>9.3f} {:>8.1f}x'
+              .format(entry, modules[entry], lazy, eager, eager / lazy))
+        if verbose:
+            print('    deferred: {}'.format(', '.join(deferred)))
+            if loaded:
+                print('    loaded anyway: {}'.format(', '.join(loaded)))
+
+    return times
+
+
+if __name__ == '__main__':
+
+    entry_points, runs, verbose = init()
+    benchmark(entry_points, runs, verbose)
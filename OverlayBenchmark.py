@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This program checks and measures the batched drawing of the overlays against
+the cv2 loops it replaced, on synthetic graphs (hyphae drawn as random walks,
+with nodes partly out of the image):
+    - overlay: Superposition.createImgOverlay(), the edges drawn with one
+    cv2.polylines() call and the nodes stamped by nu.stampDisks(), against
+    one cv2.line() per edge and one cv2.circle() per node
+    - tracking: nu.drawNodesBatch() against one cv2.circle() per tagged node,
+    graph after graph
+    - disks: the stamping of nu.stampDisks() against its own cv2.circle()
+    loop, whichever it would choose, to set the number of nodes below which
+    it draws the disks one by one ('loop_nodes')
+
+Both versions draw on the same image, and the results must be identical
+pixel for pixel. The median times of several runs are reported.
+"""
+
+# Standard imports
+import statistics
+import time
+
+# Dependencies
+import numpy as np
+
+# Custom functions
+import net_utilities as nu
+import Superposition as sup
+
+
+def init():
+    """
+    Initializes parameters.
+
+    :param image_size: the size (height, width) of the images to draw on
+    :type image_size: (int, int)
+    :param nodes_numbers: the numbers of nodes of the graphs to draw
+    :type nodes_numbers: list(int)
+    :param int graphs_nb: the number of tracked graphs drawn together on one
+        image for the tracking benchmark
+    :param int runs: the number of runs of each drawing, the median time is
+        reported
+    :param int seed: the seed of the random graphs
+    """
+
+    image_size = (2000, 2000)
+    nodes_numbers = [1000, 10000, 30000, 100000]
+    graphs_nb = 5
+    runs = 3
+    seed = 0
+
+    return image_size, nodes_numbers, graphs_nb, runs, seed
+
+def randomGraph(rng, nodes_nb, image_size, tagged=False):
+    """
+    Creates a synthetic graph: a random walk whose successive nodes are
+    linked, except at a few random breaks, and whose nodes may go out of the
+    image by a few pixels.
+
+    :param np.random.Generator rng: the random generator
+    :param int nodes_nb: the number of nodes
+    :param image_size: the size (height, width) of the image
+    :type image_size: (int, int)
+    :param bool tagged: True to tag about half of the nodes, among 50 tags
+
+    :return: a view of the arrays of the graph
+    :rtype: nu.GraphArrays
+    """
+
+    height, width = image_size
+    walk = np.cumsum(rng.normal(0, 2, (nodes_nb, 2)), axis=0)
+    x = walk[:, 0] % (width+20) - 10
+    y = walk[:, 1] % (height+20) - 10
+    links = np.flatnonzero(rng.random(nodes_nb-1) < 0.98)
+    arrays = {'x':x, 'y':y, 'conductivity':np.ones(nodes_nb),
+              'edges':np.stack([links, links+1], axis=1)}
+    if tagged:
+        arrays['tag'] = np.where(rng.random(nodes_nb) < 0.5,
+                                 rng.integers(0, 50, nodes_nb), -1)
+    return nu.GraphArrays(arrays)
+
+def drawOverlayLoop(sli, graph, drawing_params):
+    """
+    Reference drawing of an overlay, one cv2 call per edge and per node, cf
+    Superposition.createImgOverlay() for the parameters.
+
+    :return: an array representing the image of the overlay
+    :rtype: 3-dim ndarray
+    """
+
+    (line, line_color, line_size, apex_color, apex_size, node_color,
+     node_size, body_color, body_size) = drawing_params
+    sli_ovl = np.repeat(sli[:, :, np.newaxis], 3, axis=2)
+    x_node = graph.x.astype(int).tolist()
+    y_node = graph.y.astype(int).tolist()
+    if line:
+        for n1, n2 in graph.edges.tolist():
+            nu.cv2.line(sli_ovl, (x_node[n1], y_node[n1]),
+                        (x_node[n2], y_node[n2]), line_color, line_size)
+    for x, y, degree in zip(x_node, y_node, graph.degree.tolist()):
+        if degree == 1: # apex points
+            color, size = apex_color, apex_size
+        elif degree == 2: # body/hypha points
+            color, size = body_color, body_size
+        else: # branching/node points
+            color, size = node_color, node_size
+        nu.cv2.circle(sli_ovl, (x, y), size, color, thickness=-1)
+    return sli_ovl
+
+def drawNodesLoop(graphs, img, size, colors):
+    """
+    Reference drawing of the tagged nodes of several graphs, one
+    cv2.circle() per node, cf nu.drawNodesBatch() for the parameters. All
+    the tags must already have a color.
+    """
+
+    for graph in graphs:
+        tagged = np.flatnonzero(graph.tag >= 0)
+        for x, y, tag in zip(graph.x[tagged].astype(int).tolist(),
+                             graph.y[tagged].astype(int).tolist(),
+                             graph.tag[tagged].tolist()):
+            nu.cv2.circle(img, (x, y), size, colors[tag], thickness=-1)
+
+def measure(function, runs):
+    """
+    Measures the execution time of a drawing.
+
+    :param function: the drawing, without arguments
+    :param int runs: the number of measures
+
+    :return: the median time in seconds and the result of the last run
+    :rtype: (float, object)
+    """
+
+    times = []
+    for run in range(runs):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+def benchmark(image_size, nodes_numbers, graphs_nb, runs, seed):
+    """
+    Checks that the batched drawings give the same images as the cv2 loops
+    and prints their times. Cf init() for more details on the parameters.
+
+    :return: the loop and batched times in seconds, by drawing and number of
+        nodes
+    :rtype: dict((str, int): (float, float))
+
+    :raises AssertionError: if the images differ
+    """
+
+    rng = np.random.default_rng(seed)
+    sli = rng.integers(0, 256, image_size, dtype=np.uint8)
+    drawing_params = [True, (0, 255, 0), 1, (0, 0, 255), 5, (255, 0, 0), 5,
+                      (0, 254, 0), 3]
+    times = {}
+
+    print('{:<10} {:>8} {:>9} {:>12} {:>9}'
+          .format('drawing', 'nodes', 'loop (s)', 'batched (s)', 'speedup'))
+    for nodes_nb in nodes_numbers:
+        graph = randomGraph(rng, nodes_nb, image_size)
+        loop, expected = measure(
+            lambda: drawOverlayLoop(sli, graph, drawing_params), runs)
+        batched, result = measure(
+            lambda: sup.createImgOverlay(sli, graph, drawing_params, True),
+            runs)
+        assert np.array_equal(expected, result), \
+            'overlay of {} nodes differs from the cv2 loop'.format(nodes_nb)
+        times['overlay', nodes_nb] = (loop, batched)
+        print('{:<10} {:>8} {:>9.3f} {:>12.3f} {:>8.1f}x'
+              .format('overlay', nodes_nb, loop, batched, loop / batched))
+
+        graphs = [randomGraph(rng, nodes_nb, image_size, tagged=True)
+                  for i in range(graphs_nb)]
+        colors = {tag:tuple(rng.integers(0, 256, 3).tolist())
+                  for tag in range(50)}
+        img = np.repeat(sli[:, :, np.newaxis], 3, axis=2)
+        expected, result = img.copy(), img.copy()
+        loop, _ = measure(lambda: drawNodesLoop(graphs, expected, 4, colors),
+                          runs)
+        batched, _ = measure(
+            lambda: nu.drawNodesBatch(graphs, result, 4, colors), runs)
+        assert np.array_equal(expected, result), \
+            'tracking of {} nodes differs from the cv2 loop'.format(nodes_nb)
+        times['tracking', nodes_nb] = (loop, batched)
+        print('{:<10} {:>8} {:>9.3f} {:>12.3f} {:>8.1f}x'
+              .format('tracking', nodes_nb, loop, batched, loop / batched))
+
+        x_node = graph.x.astype(int)
+        y_node = graph.y.astype(int)
+        classes = rng.integers(0, 3, nodes_nb)
+        table = [(0, 0, 255), (0, 254, 0), (255, 0, 0)]
+        expected, result = img.copy(), img.copy()
+        loop, _ = measure(lambda: nu.stampDisks(expected, x_node, y_node,
+                                                classes, table, [5, 3, 5],
+                                                loop_nodes=nodes_nb+1), runs)
+        batched, _ = measure(lambda: nu.stampDisks(result, x_node, y_node,
+                                                   classes, table, [5, 3, 5],
+                                                   loop_nodes=0), runs)
+        assert np.array_equal(expected, result), \
+            'disks of {} nodes differ from the cv2 loop'.format(nodes_nb)
+        times['disks', nodes_nb] = (loop, batched)
+        print('{:<10} {:>8} {:>9.3f} {:>12.3f} {:>8.1f}x'
+              .format('disks', nodes_nb, loop, batched, loop / batched))
+
+    return times
+
+
+if __name__ == '__main__':
+
+    image_size, nodes_numbers, graphs_nb, runs, seed = init()
+    benchmark(image_size, nodes_numbers, graphs_nb, runs, seed)
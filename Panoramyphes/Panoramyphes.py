@@ -38,6 +38,7 @@ Look for examples in the code below.
 
 # Standard imports
 import datetime
+import heapq
 import locale
 import operator
 import os
@@ -53,7 +54,7 @@ import cv2
 import numpy as np
 import pause
 import serial.tools.list_ports
-from natsort import natsorted, ns
+from natsort import natsort_keygen, natsorted, ns
 from pipython import GCSDevice, pitools
 
 # PyGOject
@@ -121,6 +122,7 @@ class TisCameraWindow(Gtk.ApplicationWindow):
         self.d_pause_pano = 600 # time between 2 pano
         self.d_nb_pano = 250 # number of pano to do
         self.end_capture = False # flag for interrupting a capture
+        self.tile_indexes = {} # per folder: (mtime, sorted PNG tiles), cf reduce_images
 
         # Current settings
         self.lx = self.d_lx
@@ -1546,6 +1548,10 @@ class TisCameraWindow(Gtk.ApplicationWindow):
         Scans the directory 'folder' for PNG files, sorts them by name and then
         reduces the images comprised in 'index' and 'index' + 'nb_img'.
 
+        The sorted list of the tiles of each folder is kept between calls: the
+        folder is only listed again if it changed, and the new tiles are merged
+        into the list instead of sorting the whole folder again.
+
         :param str folder: path of the folder to scan for PNG images
         :param int index: start index of the images to reduce
         :param int nb_img: number of images to reduce
@@ -1553,14 +1559,21 @@ class TisCameraWindow(Gtk.ApplicationWindow):
         """
 
         pause.seconds(5) # gives time for the last image(s) to be written to disk
-        images = []
+        mtime, images = self.tile_indexes.get(folder, (None, []))
         try:
-            with os.scandir(folder) as dirIt:
-                for entry in dirIt:
-                    file_format = os.path.splitext(entry)[1]
-                    if file_format == '.png':
-                        images.append(entry.path)
-            images = natsorted(images) # sorting the list by file name
+            folder_mtime = os.stat(folder).st_mtime_ns
+            if folder_mtime != mtime:
+                present = set()
+                with os.scandir(folder) as dirIt:
+                    for entry in dirIt:
+                        file_format = os.path.splitext(entry)[1]
+                        if file_format == '.png':
+                            present.add(entry.path)
+                known = set(images)
+                images = [img for img in images if img in present]
+                new = natsorted(present - known) # sorting the new tiles by file name
+                images = list(heapq.merge(images, new, key=natsort_keygen()))
+                self.tile_indexes[folder] = (folder_mtime, images)
         except IOError as e:
             print('IOError when scanning folder {}: {}'.format(folder, e))
 
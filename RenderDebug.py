@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This program renders the debugging figures of a vectorisation made with the
+'debug' switch on. During the vectorisation, only the raw data of each slice
+(contours, triangles and graph) is saved as [slicename]_debug.npz, which is
+cheap. The figures, that take quite long to plot and save with matplotlib,
+are produced here afterwards, for the selected slices only and in parallel.
+The figures that can be rendered are:
+    - the contours ([slicename]_contours.[format])
+    - the triangulation ([slicename]_triangulation.[format])
+    - the graph over the triangulation and the distance map
+    ([slicename]_graph_and_triangulation.[format])
+"""
+
+# Standard imports
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
+import time
+
+# Custom functions
+import net_utilities as nu
+
+# Heavy dependencies, imported at their first use (cf nu.LazyImport)
+ndi = nu.LazyImport('scipy.ndimage')
+binary_opening = nu.LazyImport('skimage.morphology', 'binary_opening')
+binary_closing = nu.LazyImport('skimage.morphology', 'binary_closing')
+disk = nu.LazyImport('skimage.morphology', 'disk')
+
+# Log of the rendering, cf nu.startLog()
+log = nu.getLog('DEBUG')
+
+
+def init():
+    """
+    Initializes parameters.
+
+    # General parameters
+    :param str vect_path: absolute path of the directory containing the
+        [slicename]_debug.npz files written by Vectorisation.py in debug mode
+    :param str dest_path: absolute path of the directory in which to save the
+        figures. If empty, the figures are saved in 'vect_path', next to the
+        other outputs of the vectorisation. If it doesn't exist, it will be
+        created at runtime.
+    :param slices: the names of the slices to render, as in
+        [slicename]_debug.npz. If empty, all the slices are rendered.
+    :type slices: list(str)
+    :param bool verbose: verbosity switch
+
+    # Rendering parameters
+    :param figures: the figures to render, among 'contours', 'triangulation'
+        and 'graph_triangulation'
+    :type figures: list(str)
+    :param str figure_format: the output format of the figures (pdf, png,
+        jpg, tif...)
+    :param int dpi: the resolution of the figures
+    :param int workers: the number of worker processes rendering slices in
+        parallel
+    """
+
+    # General parameters
+    vect_path = '/home/hyphes/LAURA/tests/1705_1_6_quatro' # directory of the debug files
+    dest_path = '' # output directory, vect_path if empty
+    slices = [] # names of the slices to render, all if empty
+    verbose = True
+    main_params = [vect_path, dest_path, slices, verbose]
+
+    # Rendering parameters
+    figures = ['contours', 'triangulation', 'graph_triangulation']
+    figure_format = 'png'
+    dpi = 1500
+    workers = 4
+    render_params = [figures, figure_format, dpi, workers]
+
+    return main_params, render_params
+
+def renderSlice(artifacts_path, dest_path, render_params):
+    """
+    Renders the debugging figures of one slice from its debug file.
+
+    :param str artifacts_path: the absolute path of the [slicename]_debug.npz
+        file
+    :param str dest_path: the output directory
+    :param render_params: a list of the rendering parameters
+    :type render_params: [list(str), str, int, int]
+
+    :return: the slice name and its rendering time
+    :rtype: (str, float)
+    """
+
+    figures, figure_format, dpi, workers = render_params
+    start = time.time()
+
+    sli_name = os.path.basename(artifacts_path)[:-len('_debug.npz')]
+    artifacts = nu.loadDebugArtifacts(artifacts_path)
+
+    if 'contours' in figures:
+        nu.drawContours(artifacts['height'], artifacts['contours'], sli_name,
+                        dest_path, figure_format, dpi)
+
+    if 'triangulation' in figures:
+        nu.drawTriangulation(artifacts['triangle_points'],
+                             artifacts['triangle_types'], sli_name, dest_path,
+                             figure_format, dpi)
+
+    if 'graph_triangulation' in figures:
+
+        # The distance map is not saved because it is heavy, it is rebuilt
+        # from the source slice the same way Vectorisation.py does
+        sli = nu.readSlice(artifacts['source'], artifacts['index'],
+                           artifacts['invert'])
+        smoothing = artifacts['smoothing']
+        if smoothing:
+            sli = binary_opening(sli, disk(smoothing))
+            sli = binary_closing(sli, disk(smoothing))
+        distance_map = ndi.distance_transform_edt(sli).astype(int)
+
+        nu.drawGraphTriangulation(artifacts['graph'],
+                                  artifacts['triangle_points'],
+                                  artifacts['triangle_types'], sli_name,
+                                  dest_path, distance_map, figure_format, dpi)
+
+    return sli_name, time.time()-start
+
+def renderSlices(files, dest_path, render_params):
+    """
+    Renders the debugging figures of several slices (cf renderSlice()),
+    either inline (workers = 1) or on a pool of worker processes.
+
+    :param files: the debug files to render, cf nu.preloadFiles()
+    :type files: list((str, str))
+    :param str dest_path: the output directory
+    :param render_params: a list of the rendering parameters
+    :type render_params: [list(str), str, int, int]
+
+    :return: a generator of the slice names and their rendering times, in
+        order of completion
+    :rtype: generator((str, float))
+    """
+
+    workers = render_params[3]
+
+    if workers <= 1:
+        for f in files:
+            yield renderSlice(f[0], dest_path, render_params)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(renderSlice, f[0], dest_path, render_params)
+                   for f in files]
+        for future in as_completed(futures):
+            yield future.result()
+
+def renderDebug(main_params, render_params, manual_log_path='',
+                json_log_path=''):
+    """
+    Renders the debugging figures of the selected slices, in parallel. Cf
+    init() for more details on the parameters.
+
+    :param main_params: a list of the main parameters
+    :type main_params: [str, str, list(str), bool]
+    :param render_params: a list of the rendering parameters
+    :type render_params: [list(str), str, int, int]
+    :param str manual_log_path: the absolute path of the log file. By default,
+        a file 'log.txt' will be created at the root of the dest_path directory.
+    :param str json_log_path: the absolute path of an optional second log
+        file, written as JSON lines (cf nu.startLog())
+    """
+
+    vect_path, dest_path, slices, verbose = main_params
+    workers = render_params[3]
+    if not dest_path:
+        dest_path = vect_path
+
+    # Log path determination
+    if manual_log_path:
+        log_path = manual_log_path
+    else:
+        log_path = os.path.join(dest_path, 'log.txt')
+
+    # Creation of the dest directory if it doesn't exist
+    if not os.path.exists(dest_path):
+        os.mkdir(dest_path)
+
+    nu.startLog(log_path, verbose, json_log_path)
+
+    start = time.time()
+    txt = 'Selecting slices...'
+    log.info(txt)
+
+    files = [f for f in nu.preloadFiles(vect_path, ['.npz'])
+             if f[1].endswith('_debug')]
+    if slices:
+        files = [f for f in files if f[1][:-len('_debug')] in slices]
+
+    txt = '...{} slice(s) to render.'.format(len(files))
+    log.info(txt)
+    txt = 'Rendering with {} worker(s)...'.format(workers)
+    log.info(txt)
+
+    results = renderSlices(files, dest_path, render_params)
+    for i, (sli_name, elapsed) in enumerate(results):
+        txt = ('   {} rendered in {:.4f} s ({} of {}).'
+               .format(sli_name, elapsed, i+1, len(files)))
+        log.info(txt)
+
+    end = time.time()-start
+    txt = 'DONE in {:.0f} min {:.4f} s.'.format(end // 60, end % 60)
+    log.info(txt)
+    nu.stopLog()
+
+
+if __name__ == '__main__':
+
+    main_params, render_params = init()
+    renderDebug(main_params, render_params)
@@ -14,19 +14,24 @@ and 'doVideo' are disabled.
 """
 
 # Standard imports
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import os
 import time
 
 # Dependencies
-import cv2
-import networkx as nx
 import numpy as np
-import tifffile
-from tqdm import tqdm
 
 # Custom classes and functions
 import net_utilities as nu
 
+# Heavy dependencies, imported at their first use (cf nu.LazyImport)
+cv2 = nu.cv2
+tqdm = nu.tqdm
+
+# Log of the superposition, cf nu.startLog()
+log = nu.getLog('SUP')
+
 
 def init():
     """
@@ -36,9 +41,12 @@ def init():
     :param str exp_path: absolute path of the experimental (grayscale) tif 
         stack file. The drawing will be done on these images.
     :param str bin_path: absolute path of the binarized tif stack file. These 
-        images are used to identify those without mycelium. 
+        images are used to identify those without mycelium, through the 
+        occupancy manifest saved in 'vect_path' by the vectorisation (it is 
+        created if missing). 
     :param str vect_path: absolute path of the directory containing the gpickle 
-        (graphs) matching the binarized and grayscale images to process    
+        or npz files (graphs) matching the binarized and grayscale images to 
+        process    
     :param str dest_path: absolute path of the directory in which to save the 
         video and/or images. If it doesn't exist, it will be created at runtime.
     :param bool verbose: verbosity switch
@@ -61,6 +69,15 @@ def init():
         Range: 0-9: 
             0 => fast & no compression, 
             9 => very slow and compressed (3 is a good compromise)
+    :param bool concurrent: True to compress and write the frames of the tif 
+        stack in a background thread while the next ones are drawn, False 
+        to write each frame once drawn (cf nu.StackWriter)
+    :param bool crop: True to crop the overlay to the window holding the 
+        mycelium of the whole stack (union of the bounding boxes of the 
+        binarized slices, read in the occupancy manifest), instead of cropping 
+        the black borders by hand beforehand. The graphs are drawn at their 
+        place in this window. False (the default) keeps the whole image: set 
+        it to True to turn the crop on.
             
     # Drawing options
     :param bool line: True to enable the edges drawing, False to disable. 
@@ -77,6 +94,18 @@ def init():
     :param body_color: color for body nodes (degree 2)
     :type body_color: (int, int, int)
     :param int body_size: circle radius for body nodes, in pixel
+    
+    # Video options (cf nu.VideoWriter)
+    :param str codec: codec of the video encoded by ffmpeg, 'h264', 'h265' 
+        or 'vp9'. With 'mjpg', or if ffmpeg is not installed, the video is 
+        written by OpenCV as a MJPG avi file (fast but huge).
+    :param float fps: number of frames per second of the video
+    :param int crf: constant rate factor of the encoder, the lower the better 
+        the quality and the bigger the file
+    :param str preset: speed preset of the H.264 and H.265 encoders, from 
+        'ultrafast' to 'veryslow'
+    :param float scale: downscaling factor of the video frames, 1 to keep 
+        the size of the overlay
     """
     
     # General parameters
@@ -94,7 +123,9 @@ def init():
     doStack = False 
     doVideo = False 
     compress = 3 # advice: no more than 5
-    output_params = [doImg, doStack, doVideo, compress]
+    crop = False # True to auto-crop to the mycelium
+    concurrent = True # background writing of the tif stack
+    output_params = [doImg, doStack, doVideo, compress, crop, concurrent]
     
     # Drawing options (colors as BGR)
     line = True # edges drawing
@@ -109,16 +140,31 @@ def init():
     drawing_params = [line, line_color, line_size, apex_color, apex_size,
                       node_color, node_size, body_color, body_size]
     
-    return main_params, output_params, drawing_params
+    # Video options
+    codec = 'h264' # 'h264', 'h265', 'vp9' (ffmpeg) or 'mjpg' (OpenCV)
+    fps = 4
+    crf = 23 # advice: 23 for h264, 28 for h265, 31 for vp9
+    preset = 'medium'
+    scale = 1 # e.g. 0.5 to halve the width and height
+    video_params = [codec, fps, crf, preset, scale]
+    
+    return main_params, output_params, drawing_params, video_params
 
-def createImgOverlay(sli, graph, drawing_params, notAnEmptySlice):
+def createImgOverlay(sli, graph, drawing_params, notAnEmptySlice, 
+                     offset=(0, 0)):
     """
     Creates an overlay of an image and its associated graph by drawing on the 
     image the nodes and edges of the graph using the given drawing parameters.
+    The drawing is batched: all the edges are drawn by one cv2.polylines() 
+    call and the disks of the nodes are stamped at once (cf nu.stampDisks()), 
+    with the same result as one cv2.line() call per edge then one 
+    cv2.circle() call per node.
     
     :param ndarray sli: an array representing the image (slice) on which to 
         draw the graph
-    :param nx.Graph graph: the graph to draw
+    :param graph: the graph to draw, as a view on its arrays (only the 
+        coordinates, edges and degrees are loaded)
+    :type graph: nu.GraphArrays
     :param drawing_params: the parameters to use when drawing the graph (color, 
         radius, thickness...)
     :type drawing_params: [bool, (int, int, int), int, (int, int, int), int, 
@@ -126,18 +172,17 @@ def createImgOverlay(sli, graph, drawing_params, notAnEmptySlice):
     :param bool notAnEmptySlice: True when the image 'sli' is not empty, False
         otherwise. If the image is empty, no drawing is done and a 3-dim (RGB)
         copy of the original image is returned.
+    :param offset: the position (x, y) of the image 'sli' in the image space 
+        of the graph, when 'sli' is a cropped image
+    :type offset: (int, int)
         
     :return: an array representing the image of the overlay
     :rtype: 3-dim ndarray
     """
     
-    (Y, X) = sli.shape
-        
     # Creation of the superposition file (3 dimensions because RGB for the graph drawing)
-    sli_ovl = np.zeros([Y, X, 3], np.uint8)
-    sli_ovl[:, :, 0] = sli
-    sli_ovl[:, :, 1] = sli
-    sli_ovl[:, :, 2] = sli
+    sli_ovl = np.repeat(sli[:, :, np.newaxis], 3, axis=2).astype(np.uint8, 
+                                                                copy=False)
     
     if notAnEmptySlice:
         line = drawing_params[0]
@@ -150,47 +195,112 @@ def createImgOverlay(sli, graph, drawing_params, notAnEmptySlice):
         body_color = drawing_params[7]
         body_size = drawing_params[8]
         
-        graph = nx.convert_node_labels_to_integers(graph, first_label=0, 
-                                                   ordering='default', 
-                                                   label_attribute=None)
-    
-        # Creation of arrays from graph elements     
-        x_node = np.fromiter(nx.get_node_attributes(graph, 'x').values(), 
-                             dtype=int)        
-        y_node = np.fromiter(nx.get_node_attributes(graph, 'y').values(), 
-                             dtype=int)       
-        degrees = np.array([degree for node, degree in nx.degree(graph)], 
-                            dtype=int)   
-        edges = np.array(graph.edges())
+        # Arrays of the graph elements     
+        x_node = graph.x.astype(int) - offset[0]
+        y_node = graph.y.astype(int) - offset[1]
+        degrees = graph.degree
+        edges = graph.edges
         
-        # Lists of edges coordinates
-        x1 = x_node[edges[:, 0]]
-        y1 = y_node[edges[:, 0]]
-        x2 = x_node[edges[:, 1]]
-        y2 = y_node[edges[:, 1]]
-    
-        # Edges drawing
-        if line:
-            for i in range(len(x1)):
-                cv2.line(sli_ovl, (x1[i], y1[i]), (x2[i], y2[i]), 
-                         line_color, line_size)
+        # Edges drawing, as 2-point polylines: (edges number, 2, (x, y))
+        if line and len(edges):
+            segments = np.stack([x_node[edges], y_node[edges]], axis=-1)
+            cv2.polylines(sli_ovl, segments.astype(np.int32), False, 
+                          line_color, line_size)
     
-        # Nodes drawing
-        for i in range(len(x_node)):
-            if degrees[i] == 1: # apex points
-                color = apex_color
-                size = apex_size
-            elif degrees[i] == 2: # body/hypha points
-                color = body_color
-                size = body_size
-            else: # branching/node points
-                color = node_color
-                size = node_size
-            cv2.circle(sli_ovl, (x_node[i], y_node[i]), size, color, 
-                       thickness=-1)
+        # Nodes drawing, by class: apex points (degree 1), body/hypha points 
+        # (degree 2) and branching/node points (other degrees)
+        classes = np.where(degrees == 1, 0, np.where(degrees == 2, 1, 2))
+        nu.stampDisks(sli_ovl, x_node, y_node, classes, 
+                      [apex_color, body_color, node_color], 
+                      [apex_size, body_size, node_size])
 
     return sli_ovl
 
+def renderSlice(sli, graph_path, drawing_params, notAnEmptySlice, window):
+    """
+    Crops a grayscale slice to the window of the overlay and draws its graph 
+    on it, cf createImgOverlay().
+
+    :param ndarray sli: the whole grayscale slice
+    :param str graph_path: the absolute path of the graph file of the slice
+    :param drawing_params: the drawing parameters, cf createImgOverlay()
+    :type drawing_params: list
+    :param bool notAnEmptySlice: True when the slice is not empty, False 
+        otherwise
+    :param window: the window of the overlay (y_min, y_max, x_min, x_max), 
+        cf nu.cropWindow()
+    :type window: (int, int, int, int)
+
+    :return: the overlay of the slice
+    :rtype: 3-dim ndarray
+    """
+
+    image = sli[window[0]:window[1], window[2]:window[3]] # crop, no copy
+    DG = nu.GraphArrays(graph_path) # lazy view on the graph file
+    return createImgOverlay(image, DG, drawing_params, notAnEmptySlice, 
+                            (window[2], window[0]))
+
+def _renderSliceFromFile(exp_path, index, graph_path, drawing_params, 
+                         notAnEmptySlice, window):
+    """
+    Reads a grayscale slice and renders its overlay, cf renderSlice(). Run 
+    by the worker processes, so that the slices and graphs are loaded in 
+    parallel too.
+    """
+
+    sli = nu.readSlice(exp_path, index, False)
+    return renderSlice(sli, graph_path, drawing_params, notAnEmptySlice, 
+                       window)
+
+def renderOverlays(exp_path, rangeN, graphs, thalle, drawing_params, window,
+                   workers=1):
+    """
+    Renders the overlays of the selected slices, one at a time or by a pool 
+    of worker processes. The overlays are yielded in the order of 'rangeN' 
+    in both cases, so that the caller can feed the tif stack and the video 
+    with them directly. With several workers, at most 2*workers slices are 
+    rendered ahead of the one awaited, which bounds the memory used.
+
+    :param str exp_path: the absolute path of the grayscale tif stack
+    :param rangeN: the indices of the slices to render (backward indexing 
+        supported)
+    :type rangeN: list(int)
+    :param graphs: the graph file of each slice, as (path, name), cf 
+        nu.preloadGraphs()
+    :type graphs: list((str, str))
+    :param thalle: the number of foreground pixels of each binarized slice
+    :type thalle: ndarray
+    :param drawing_params: the drawing parameters, cf createImgOverlay()
+    :type drawing_params: list
+    :param window: the window of the overlay, cf renderSlice()
+    :type window: (int, int, int, int)
+    :param int workers: the number of worker processes
+
+    :return: a generator of couples (slice index, overlay)
+    :rtype: generator((int, ndarray))
+    """
+
+    if workers <= 1:
+        exp_slices = nu.iterSlices(exp_path, False, rangeN)
+        for iSli, sli in zip(rangeN, exp_slices):
+            yield iSli, renderSlice(sli, graphs[iSli][0], drawing_params, 
+                                    thalle[iSli], window)
+        return
+
+    slices_nb = len(thalle)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque() # futures in frame order
+        for iSli in rangeN:
+            in_flight.append((iSli, executor.submit(
+                _renderSliceFromFile, exp_path, int(iSli) % slices_nb,
+                graphs[iSli][0], drawing_params, thalle[iSli], window)))
+            if len(in_flight) > 2*workers: # bounding the frames in memory
+                index, future = in_flight.popleft()
+                yield index, future.result()
+        while in_flight:
+            index, future = in_flight.popleft()
+            yield index, future.result()
+
 def _computeIndex(value, slices_nb):
     """
     Computes the slice index for log output. The slice index is not the same 
@@ -208,7 +318,8 @@ def _computeIndex(value, slices_nb):
     else:
         return value % (slices_nb+1)
 
-def overlay(main_params, output_params, drawing_params, manual_log_path=''):
+def overlay(main_params, output_params, drawing_params, manual_log_path='',
+            json_log_path='', workers=1, video_params=None):
     """
     Creates an overlay output from a tif stack and its associated graphs.
     The output can be an image from a specified slice, a tif stack or a video
@@ -217,14 +328,22 @@ def overlay(main_params, output_params, drawing_params, manual_log_path=''):
     :param main_params: a list of the main parameters
     :type main_params: [str, str, str, str, bool, bool, bool]
     :param output_params: a list of the output parameters
-    :type output_params: [int, bool, bool, int]
+    :type output_params: [int, bool, bool, int, bool, bool]
     :param drawing_params: a list of the drawing parameters
     :type drawing_params: [bool, (int, int, int), int, (int, int, int), int, 
                                  (int, int, int), int, (int, int, int), int,]             
     :param str manual_log_path: the absolute path of the log file. By default,
         a file 'log.txt' will be created at the root of the dest_path directory.
+    :param str json_log_path: the absolute path of an optional second log
+        file, written as JSON lines (cf nu.startLog())
+    :param int workers: the number of worker processes loading the graphs 
+        and rendering the overlays in parallel. The frames are still written 
+        in order by the main process (cf renderOverlays()).
+    :param video_params: a list of the video parameters, by default an H.264 
+        video at 4 fps
+    :type video_params: [str, float, int, str, float]
     """
-    
+
     global doImg, doStack, doVideo
     
     exp_path = main_params[0]
@@ -234,7 +353,11 @@ def overlay(main_params, output_params, drawing_params, manual_log_path=''):
     verbose = main_params[4]
     debug = main_params[5]
     invert = main_params[6]
-    doImg, doStack, doVideo, compress = output_params
+    doImg, doStack, doVideo, compress, crop = output_params[:5]
+    concurrent = output_params[5] if len(output_params) > 5 else False
+    if video_params is None:
+        video_params = ['h264', 4, 23, 'medium', 1]
+    codec, fps, crf, preset, scale = video_params
     
     if debug:
         verbose = True
@@ -244,75 +367,78 @@ def overlay(main_params, output_params, drawing_params, manual_log_path=''):
         log_path = manual_log_path
     else:    
         log_path = os.path.join(dest_path, 'log.txt')
-    log_txt = ''
-    
+
     # Creation of the dest directory if it doesn't exist
     if not os.path.exists(dest_path):
         os.mkdir(dest_path)
+
+    nu.startLog(log_path, verbose, json_log_path, debug)
         
     start = time.time()
     previous_step = start
-    txt = 'SUP> Loading binarized stack...'
-    log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
+    txt = 'Loading binarized stack occupancy...'
+    log.info(txt)
         
-    # Binarized stack loading
-    bin_stack = tifffile.imread(bin_path) # loading the image as a numpy array
-    bin_stack = np.array(bin_stack, dtype=np.uint8) # dtype safeguard
-    if invert:
-        bin_stack = np.invert(bin_stack)    
+    # Occupancy of the binarized stack, from the manifest written by the 
+    # vectorisation (it is computed in one streaming pass if missing)
+    occupancy = nu.getOccupancy(bin_path, invert, vect_path)
+    thalle = occupancy['count']
+    slices_nb_bin = len(thalle)
     if debug:
-        txt = 'SUP>    Binarized stack shape: {}'.format(bin_stack.shape)
-        log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-    slices_nb_bin = bin_stack.shape[0]    
+        txt = '   Binarized stack slices: {}'.format(slices_nb_bin)
+        log.debug(txt)
     
     # To differentiate slices with mycelium from those without
-    empty = []
-    thalle = np.zeros(slices_nb_bin)
-    for iSli in range(slices_nb_bin):
-        sli = bin_stack[iSli, :, :].astype(np.uint8)
-        thalle[iSli] = np.sum(sli)
-        
-        if thalle[iSli] <= 0: # empty slice
-            empty.append(iSli)
-    del bin_stack # not used anymore, del to free memory for the experimental stack
+    empty = list(np.flatnonzero(~occupancy['foreground']))
                     
     if debug:
-        txt = 'SUP>    Number of empty slices: {}'.format(len(empty))
-        log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
+        txt = '   Number of empty slices: {}'.format(len(empty))
+        log.debug(txt)
            
     timer = time.time()
-    txt = 'SUP> ...done in {:.4f} s.'.format(timer-previous_step)
-    log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
+    txt = '...done in {:.4f} s.'.format(timer-previous_step)
+    log.info(txt)
     previous_step = timer
-    txt = 'SUP> Loading grayscale stack...'
-    log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
+    txt = 'Reading grayscale stack header...'
+    log.info(txt)
     
-    # Experimental stack loading (grayscale)    
-    exp_stack = tifffile.imread(exp_path) # loading the image as a numpy array
-    exp_stack = np.array(exp_stack, dtype=np.uint8) # dtype safeguard
+    # Experimental stack (grayscale): only its shape is read here, its slices 
+    # are streamed one by one when drawing the overlay
+    slices_nb_exp, exp_shape = nu.countSlices(exp_path)
     if debug:
-        txt = 'SUP>    Grayscale stack shape: {}'.format(exp_stack.shape)
-        log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-    slices_nb_exp, height, width = exp_stack.shape
+        txt = '   Grayscale stack shape: {}'.format(exp_shape)
+        log.debug(txt)
+    height, width = exp_shape[-2:]
+    
+    # Window of the overlay, the drawings of the nodes being kept whole
+    window = (0, height, 0, width)
+    if crop:
+        margin = max(drawing_params[4], drawing_params[6], 
+                     drawing_params[8]) + drawing_params[2]
+        window = nu.cropWindow(occupancy, (height, width), margin) or window
+        if debug:
+            txt = ('   Crop window: rows {}-{}, columns {}-{}'
+                   .format(window[0], window[1]-1, window[2], window[3]-1))
+            log.debug(txt)
    
     timer = time.time()
-    txt = 'SUP> ...done in {:.4f} s.'.format(timer-previous_step)
-    log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
+    txt = '...done in {:.4f} s.'.format(timer-previous_step)
+    log.info(txt)
     previous_step = timer
-    txt = 'SUP> Loading graphs and checking alignment...'
-    log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
+    txt = 'Loading graphs and checking alignment...'
+    log.info(txt)
     
     # graphs loading and sorting
-    graphs = nu.preloadFiles(vect_path, ['.gpickle'], debug)
+    graphs = nu.preloadGraphs(vect_path, debug) # gpickle or npz
     
     # Adding elements in 'graphs' for lists alignment if not already aligned
     if slices_nb_exp != len(graphs):
         for index in empty:
             graphs.insert(index, ('empty','empty'))        
         if debug:
-            txt = ('SUP>    Length of graph list after alignment: {}'
+            txt = ('   Length of graph list after alignment: {}'
                   .format(len(graphs)))
-            log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
+            log.debug(txt)
     
     # Checking that all the lenghts are aligned    
     if slices_nb_bin == slices_nb_exp and slices_nb_exp == len(graphs):
@@ -321,14 +447,15 @@ def overlay(main_params, output_params, drawing_params, manual_log_path=''):
         txt = ('ERROR: the number of slices in the binarized stack ({}), in '
               'the grayscale one({}), and the number of graphs ({}) are not '
               'equal.'.format(slices_nb_bin, slices_nb_exp, len(graphs)))
-        nu.writeLogAndExit(log_path, log_txt, txt)
+        log.error(txt)
+        raise ValueError(txt)
         
     timer = time.time()
-    txt = 'SUP> ...done in {:.4f} s.'.format(timer-previous_step)
-    log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
+    txt = '...done in {:.4f} s.'.format(timer-previous_step)
+    log.info(txt)
     previous_step = timer
-    txt = 'SUP> Preparing output...'
-    log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
+    txt = 'Preparing output...'
+    log.info(txt)
              
     # Definition of the range of images to browse and process   
     rangeN = np.array([])
@@ -340,45 +467,65 @@ def overlay(main_params, output_params, drawing_params, manual_log_path=''):
     
     if doVideo or doStack: # stack or video creation: all the slices must be processed
         rangeN = range(slices_nb_exp)
-        frames = [] # list to save the frames of the stack tif
+        
+        if doStack:
+            # Tif stack output creation, the frames are written as soon as 
+            # they are drawn
+            stack_path = os.path.join(dest_path, 'superpose.tif')
+            stack = nu.StackWriter(stack_path, (window[1]-window[0], 
+                                                window[3]-window[2], 3),
+                                   slices_nb_exp, compress, concurrent)
+            if debug:
+                txt = '   Tif stack: {}, BigTIFF: {}'.format(stack_path, 
+                                                             stack.bigtiff)
+                log.debug(txt)
         
         if doVideo:
-            # Video output creation
-            fourcc = cv2.VideoWriter_fourcc(*'MJPG')
-            video = cv2.VideoWriter('video.avi', fourcc, 4, (width, height))
+            # Video output creation, written directly in dest_path
+            video = nu.VideoWriter(os.path.join(dest_path, 'superpose'), 
+                                   (window[3]-window[2], window[1]-window[0]),
+                                   fps, codec, crf, preset, scale)
+            txt = '   Video: {} ({})'.format(video.path, video.backend)
+            log.info(txt)
+            if video.backend == 'opencv' and codec != 'mjpg':
+                txt = ('   WARNING: ffmpeg not found, the video is written '
+                       'by OpenCV in MJPG.')
+                log.warning(txt)
     
     if debug:
-        txt = 'SUP>    rangeN: {}'.format(rangeN)
-        log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
+        txt = '   rangeN: {}'.format(rangeN)
+        log.debug(txt)
           
     timer = time.time()
-    txt = 'SUP> ...done in {:.4f} s.'.format(timer-previous_step)
-    log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
+    txt = '...done in {:.4f} s.'.format(timer-previous_step)
+    log.info(txt)
     time.sleep(1) # dirty hack to wait for the console output
     previous_step = timer
     start_process = timer
-    txt = 'SUP> Processing images...'
-    log_txt += txt + '\n'
+    txt = 'Processing images...'
+    log.info(txt, extra=nu.quiet_log)
     
-    # Slices processing, one by one
+    # Slices processing, each grayscale slice being read only when it is 
+    # drawn on, the overlays coming back in order whatever the workers
     desc = 'SUP> Creating overlay'
-    for iSli in tqdm(rangeN, desc=desc, unit='slice', disable=not verbose):
+    overlays = renderOverlays(exp_path, rangeN, graphs, thalle, 
+                              drawing_params, window, workers)
+    for iSli, ovl in tqdm(overlays, total=len(rangeN), desc=desc, 
+                          unit='slice', disable=not verbose):
 
-        txt = ('SUP>    Image {} of {}...'
+        txt = ('   Image {} of {}...'
               .format(_computeIndex(iSli, slices_nb_exp), slices_nb_exp))
-        log_txt += txt + '\n'
-        
-        image = exp_stack[iSli, :, :].astype(np.uint8) # gets the slice and converts it    
-        DG = nx.read_gpickle(graphs[iSli][0]) # loading the graph
-        ovl = createImgOverlay(image, DG, drawing_params, thalle[iSli])        
+        log.info(txt, extra=nu.quiet_log)
         
         if not thalle[iSli]:
-            txt = 'SUP>      This slice is empty.'.format(iSli+1, iSli)
-            log_txt += txt + '\n'
+            txt = '     This slice is empty.'.format(iSli+1, iSli)
+            log.info(txt, extra=nu.quiet_log)
 
         if doStack or doVideo:
             if doStack:
-                frames.append(ovl)
+                txt = '     writing frame {} of {}'.format(iSli+1, slices_nb_exp)
+                log.info(txt, extra=nu.quiet_log)
+                stack.write(cv2.cvtColor(ovl, cv2.COLOR_BGR2RGB)) # color conversion for saving without cv2
             if doVideo:
                 video.write(ovl)
         else:
@@ -387,66 +534,47 @@ def overlay(main_params, output_params, drawing_params, manual_log_path=''):
             cv2.imwrite(img_path, ovl)
             
         timer = time.time()
-        txt = 'SUP>    ...done in {:.4f} s.'.format(timer-previous_step)
-        log_txt += txt + '\n'
+        txt = '   ...done in {:.4f} s.'.format(timer-previous_step)
+        log.info(txt, extra=nu.quiet_log)
         previous_step = timer
             
     timer = time.time()
-    txt = 'SUP> ...done in {:.4f} s.'.format(timer-start_process)
-    log_txt += txt + '\n'
+    txt = '...done in {:.4f} s.'.format(timer-start_process)
+    log.info(txt, extra=nu.quiet_log)
     previous_step = timer
 
     if doStack:         
 
-        txt = 'SUP> Creating tif stack...'
-        log_txt += txt + '\n'
-            
-        # Writing tif stack
-        destination = os.path.join(dest_path, 'superpose.tif')
-        with tifffile.TiffWriter(destination) as tiff:
-            desc = 'SUP> Creating tif stack'
-            for i, frame in enumerate(tqdm(frames, total=len(frames), desc=desc,
-                                           unit='frame', disable=not verbose)):
-                txt = ('SUP>    writing frame {} of {}'
-                      .format(i+1, len(frames)))
-                log_txt += txt + '\n'
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) # color conversion for saving without cv2 
-                tiff.save(frame, compress=compress)
-                frames[i] = 0 # cleaning the frame once written to free up memory
+        txt = 'Closing tif stack...'
+        log.info(txt, extra=nu.quiet_log)
+        stack.close() # writing the frames still queued
         
         timer = time.time()
-        txt = 'SUP> ...done in {:.4f} s.'.format(timer-previous_step)
-        log_txt += txt + '\n'
+        txt = '...done in {:.4f} s.'.format(timer-previous_step)
+        log.info(txt, extra=nu.quiet_log)
         previous_step = timer
     
     if doVideo:
         time.sleep(1) # dirty hack to wait for the console output
-        txt = 'SUP> Cleaning video output...'
-        log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-            
-        #cv2.destroyAllWindows()
-        video.release()
-        source = 'video.avi'
-        destination = os.path.join(dest_path, 'superpose.avi')
-        os.rename(source, destination)
+        txt = 'Closing video output...'
+        log.info(txt)
+        video.close() # waiting for the encoding of the last frames
         
         timer = time.time()
-        txt = 'SUP> ...done in {:.4f} s.'.format(timer-previous_step)
-        log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
+        txt = '...done in {:.4f} s.'.format(timer-previous_step)
+        log.info(txt)
         previous_step = timer
    
     timer = time.time()
     end = timer-start 
     time.sleep(1) # dirty hack to wait for the console output       
-    txt = 'SUP> DONE in {:.0f} min {:.4f} s.'.format(end // 60, end % 60)
-    log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-    
-    # Writing the log    
-    with open(log_path, 'a+') as log:
-        log.write(log_txt)
+    txt = 'DONE in {:.0f} min {:.4f} s.'.format(end // 60, end % 60)
+    log.info(txt)
+    nu.stopLog()
 
 
 if __name__ == '__main__':
     
-    main_params, output_params, drawing_params = init()
-    overlay(main_params, output_params, drawing_params)    
\ No newline at end of file
+    main_params, output_params, drawing_params, video_params = init()
+    overlay(main_params, output_params, drawing_params, 
+            video_params=video_params)
\ No newline at end of file
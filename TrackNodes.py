@@ -3,10 +3,12 @@
 """
 Created on Fri Jun 21 14:20:51 2019
 
-This program first creates a csv file from a set of gpickle files (graphs).
+This program first creates a csv file from a set of gpickle or npz files 
+(graphs).
 The data extracted from the graphs and written in the csv are:
     - the coordinates ('x', 'y') of the nodes of degree 3
     - the frame number ('t') in which these nodes have been found
+    - their degree ('degree')
 If you already have a correct csv file, it is possible to jump this step with 
 the 'createCSV' switch.
 Once the csv file is reated or loaded, the program does a basic tracking of the 
@@ -27,16 +29,18 @@ from math import isclose
 import os
 import time
 
-# Dependencies
-import networkx as nx
-import pandas as pd
-from tqdm import tqdm
-import trackpy as tp
-from skimage import io, color
-
 # Custom functions
 import net_utilities as nu
 
+# Heavy dependencies, imported at their first use (cf nu.LazyImport)
+tqdm = nu.tqdm
+tp = nu.LazyImport('trackpy')
+io = nu.LazyImport('skimage.io')
+color = nu.LazyImport('skimage.color')
+
+# Log of the tracking, cf nu.startLog()
+log = nu.getLog('TRACK')
+
 
 def init():
     """
@@ -44,8 +48,9 @@ def init():
     
     # General parameters
     :param str vect_path: absolute path of the directory containing the gpickle 
-        (graphs) to process
-    :param str csv_path: absolute path of the csv file to create and/or load
+        or npz files (graphs) to process
+    :param str csv_path: absolute path of the csv file to create and/or load 
+        (a .npz path stores the same table in a faster binary file)
     :param str dest_path: absolute path of the directory in which to save the 
         updated graphs and the check image. If it doesn't exist, it will be 
         created at runtime.
@@ -98,7 +103,7 @@ def init():
     return main_params, link_params, check_params
     
     
-def matchAndInsert(df, graphs, verbose, forced_matching, log_path, log_txt):
+def matchAndInsert(df, graphs, verbose, forced_matching):
     """
     Matches the coordinates in the csv file and those in the graphs in order 
     to insert the track ID of each node as a node tag in the graphs.
@@ -135,8 +140,8 @@ def matchAndInsert(df, graphs, verbose, forced_matching, log_path, log_txt):
                       '{} matches found, exactly one must be found. Still '
                       'affecting a tag for each node.'
                       .format(frame+1, row.Index, len(nodes)))
-                log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-                
+                log.warning(txt)
+
                 for i, node in enumerate(nodes):
                     graphs[frame].node[nodes[i]]['tag'] = getattr(row, 
                                                                    'particle')
@@ -144,17 +149,20 @@ def matchAndInsert(df, graphs, verbose, forced_matching, log_path, log_txt):
                 txt = ('Non matching coordinates at frame {}, row index {}: '
                          '{} matches found, exactly one must be found.'
                          .format(frame+1, row.Index, len(nodes)))
-                nu.writeLogAndExit(log_path, log_txt, txt)
+                log.error(txt)
+                raise ValueError(txt)
         
         else:
             txt = ('Non matching coordinates at frame {}, row index {}: '
                      '{} matche(s) found, exactly one must be found.'
                      .format(frame+1, row.Index, len(nodes)))
-            nu.writeLogAndExit(log_path, log_txt, txt)
+            log.error(txt)
+            raise ValueError(txt)
             
     return graphs
    
-def tracking(main_params, link_params, check_params, manual_log_path=''):
+def tracking(main_params, link_params, check_params, manual_log_path='',
+             workers=1, json_log_path=''):
     """
     Creates a csv file from a set of gpickle files (optional), performs a basic
     tracking on degree 3 nodes, injects the result of the tracking in the 
@@ -168,6 +176,10 @@ def tracking(main_params, link_params, check_params, manual_log_path=''):
     :type check_params: [bool, str, int]
     :param str manual_log_path: the absolute path of the log file. By default,
         a file 'log.txt' will be created at the root of the dest_path directory.
+    :param int workers: the number of worker processes extracting the nodes 
+        from the graphs when creating the csv file
+    :param str json_log_path: the absolute path of an optional second log
+        file, written as JSON lines (cf nu.startLog())
     """
     
     vect_path, csv_path, dest_path, verbose = main_params
@@ -180,84 +192,86 @@ def tracking(main_params, link_params, check_params, manual_log_path=''):
         log_path = manual_log_path
     else:    
         log_path = os.path.join(dest_path, 'log.txt')
-    log_txt = ''
-    
+
     # Creation of the dest directory if it doesn't exist
     if not os.path.exists(dest_path):
         os.mkdir(dest_path)
+
+    nu.startLog(log_path, verbose, json_log_path)
     
     start = time.time()
     previous_step = start
-    txt = 'TRACK> Preparing the data...'
-    log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
+    txt = 'Preparing the data...'
+    log.info(txt)
     time.sleep(1) # dirty hack to wait for the console output
     
     # Loading graphs
-    files = nu.preloadFiles(vect_path, ['.gpickle'], debug=False) # finding all the gpickles
-    graphs = [nx.read_gpickle(graph[0]) for graph in files] # creation of a list containing all the graphs, in order
+    files = nu.preloadGraphs(vect_path, debug=False) # finding all the gpickles (or npz)
+    graphs = [nu.readGraph(graph[0]) for graph in files] # creation of a list containing all the graphs, in order
         
     # Creation of the csv if necessary, and loading as DataFrame
     if createCSV:
-        nu.createNodesCSVForTracking(files, csv_path, verbose)
-    df = pd.read_csv(csv_path)
+        nu.createNodesCSVForTracking(files, csv_path, verbose, workers)
+    df = nu.readNodesTable(csv_path)
     
     timer = time.time()
-    txt = 'TRACK> ...done in {:.4f} s.'.format(timer-previous_step)
-    log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
+    txt = '...done in {:.4f} s.'.format(timer-previous_step)
+    log.info(txt)
     time.sleep(1) # dirty hack to wait for the console output
     previous_step = timer
-    txt = 'TRACK> Tracking...'
-    log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
+    txt = 'Tracking...'
+    log.info(txt)
        
     # Tracking   
     df_track = tp.link(df, search_range, memory=memory, t_column='t', 
                           adaptive_stop=adaptive_stop)
 
     timer = time.time()
-    txt = 'TRACK> ...done in {:.4f} s.'.format(timer-previous_step)
-    log_txt += txt + '\n'
+    txt = '...done in {:.4f} s.'.format(timer-previous_step)
+    log.info(txt, extra=nu.quiet_log)
     time.sleep(1) # dirty hack to wait for the console output
     previous_step = timer
-    txt = 'TRACK> Updating graphs...'.format(timer-previous_step)
-    log_txt += txt + '\n'
+    txt = 'Updating graphs...'.format(timer-previous_step)
+    log.info(txt, extra=nu.quiet_log)
         
     # Adding nodes ID to the graphs        
-    graphs = matchAndInsert(df_track, graphs, verbose, forced_matching, 
-                             log_path, log_txt)
+    graphs = matchAndInsert(df_track, graphs, verbose, forced_matching)
     
     timer = time.time()
     end = timer-previous_step
-    txt = ('TRACK> ...done in {:.0f} min {:.4f} s.'
+    txt = ('...done in {:.0f} min {:.4f} s.'
            .format(end // 60, end % 60))
-    log_txt += txt + '\n'
+    log.info(txt, extra=nu.quiet_log)
     time.sleep(1) # dirty hack to wait for the console output
     previous_step = timer
-    txt = 'TRACK> Saving graphs...'.format(timer-previous_step)
-    log_txt += txt + '\n'    
+    txt = 'Saving graphs...'.format(timer-previous_step)
+    log.info(txt, extra=nu.quiet_log)    
     
     # Saving the updated graphs
     desc = 'TRACK> Saving graphs'
     for i, graph in enumerate(tqdm(graphs, total=len(graphs), desc=desc,
                                            unit='graph', disable=not verbose)):       
         
-        txt = 'TRACK>    graph {} / {}'.format(i+1, len(graphs))
-        log_txt += txt + '\n'
+        txt = '   graph {} / {}'.format(i+1, len(graphs))
+        log.info(txt, extra=nu.quiet_log)
         
         # New graph name: [old name]_track_r[search_range]_m[memory].gpickle'
+        # (or .npz, the graphs being saved in the format they were read in)
         graph_name = files[i][1] + '_track'
         for key, value in params.items():
             graph_name += '_' + key + str(value)
             
-        path = os.path.join(dest_path, graph_name + '.gpickle')       
-        nx.write_gpickle(graph, path, protocol=2) 
+        extension = os.path.splitext(files[i][0])[1]
+        path = os.path.join(dest_path, graph_name + extension)       
+        nu.saveGraph(graph, path) 
 
     timer = time.time()
-    txt = 'TRACK> ...done in {:.4f} s.'.format(timer-previous_step)
-    log_txt += txt + '\n'
+    txt = '...done in {:.4f} s.'.format(timer-previous_step)
+    log.info(txt, extra=nu.quiet_log)
     time.sleep(1) # dirty hack to wait for the console output
     previous_step = timer
-    txt = 'TRACK> Processing check image...'.format(timer-previous_step)
-    log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
+    txt = 'Processing check image...'.format(timer-previous_step)
+    log.info(txt)
     time.sleep(1) # dirty hack to wait for the console output
         
     # Saving an image to check the results   
@@ -265,29 +279,25 @@ def tracking(main_params, link_params, check_params, manual_log_path=''):
         img = color.gray2rgb(io.imread(img_path)) # loading the image as rgb
         colors = {} # dictionary in which we save the colors by node tag
         
-        # Drawing each node with a random color for each node tag
-        desc = 'TRACK>    drawing graphs nodes'
-        for i, graph in enumerate(tqdm(graphs, total=len(graphs), desc=desc,
-                                           unit='graph', disable=not verbose)):
-            txt = 'TRACK>    drawing nodes from graph {}'.format(files[i][1])
-            log_txt += txt + '\n'
-            nu.drawNodesRandomColors(graph, img, size, colors)      
+        # Drawing the nodes of all the graphs at once, with a random color 
+        # for each node tag
+        txt = '   drawing the nodes of {} graphs'.format(len(graphs))
+        log.info(txt, extra=nu.quiet_log)
+        nu.drawNodesBatch(graphs, img, size, colors)
             
-        txt = 'TRACK>    writing image...'
-        log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
+        txt = '   writing image...'
+        log.info(txt)
         io.imsave(os.path.join(dest_path, 'tracking_check.png'), img)
 
     timer = time.time()
     end = timer-start
-    txt = 'TRACK> ...done in {:.4f} s.'.format(timer-previous_step)
-    log_txt += txt + '\n'
-    txt = ('TRACK> DONE in {:.0f} min {:.4f} s.'
+    txt = '...done in {:.4f} s.'.format(timer-previous_step)
+    log.info(txt, extra=nu.quiet_log)
+    txt = ('DONE in {:.0f} min {:.4f} s.'
           .format(end // 60, end % 60))
-    log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
+    log.info(txt)
     
-    # Writing the log    
-    with open(log_path, 'a+') as log:
-        log.write(log_txt)
+    nu.stopLog()
     
     
 if __name__ == '__main__':
@@ -59,6 +59,9 @@ save_distance_map = False # enables saving of the euclidean distance map
 vect_params = [smoothing, plot, figure_format,
                graph_format, dpi, node_size, save_distance_map, pruning, 
                redundancy]
+workers = 1 # number of worker processes sharing the queue of slices to vectorize
+pyramid = False # enables the coarse-to-fine vectorisation of wide hyphae
+crop = '' # no crop (''), or auto-crop to the foreground of the whole stack ('movie') or of each slice ('slice')
 
 ## Superposition parameters ##
 
@@ -67,7 +70,8 @@ doImg = -1 # int value to create an image of a specific slice, if 0 no image is
 doStack = True # True to create a stack (slow)
 doVideo = True # True to create a video of the superposition
 compress = 3 # level of compression 0-9: 0 => fast & no compression, 9 => very slow and compressed (3 is a good compromise)
-sup_output_params = [doImg, doStack, doVideo, compress]
+sup_crop = False # True to crop the overlay to the mycelium of the whole stack
+sup_output_params = [doImg, doStack, doVideo, compress, sup_crop]
 
 # Drawing options (colors as BGR)
 line = True # True to enable the drawing of the edges
@@ -102,7 +106,8 @@ tr_check_params = [check, img_path, size]
 
 ## External calls
 
-vc.vectorize(vect_main_params, vect_params, manual_log_path=log_path)
+vc.vectorize(vect_main_params, vect_params, manual_log_path=log_path, 
+             workers=workers, pyramid=pyramid, crop=crop)
 sp.overlay(sup_main_params, sup_output_params, sup_drawing_params, 
            manual_log_path=log_path)
 
@@ -51,22 +51,39 @@
 """
 
 # Standard imports
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import as_completed
+import math
+import multiprocessing
 import os
 import time
 import operator
+try:
+    import resource
+except ImportError: # not available on Windows, no memory budget there
+    resource = None
 
 # Dependencies
-import tifffile
-from scipy import ndimage as ndi
 import networkx as nx
-import numpy as np	
-import meshpy.triangle as triangle
-from skimage.morphology import binary_opening, binary_closing, disk
+import numpy as np
 from PIL import Image
-	
+
 # Custom functions
 import net_utilities as nu
 
+# Heavy dependencies, imported at their first use (cf nu.LazyImport)
+cv2 = nu.cv2
+tifffile = nu.tifffile
+ndi = nu.LazyImport('scipy.ndimage')
+cKDTree = nu.LazyImport('scipy.spatial', 'cKDTree')
+triangle = nu.LazyImport('meshpy.triangle')
+binary_opening = nu.LazyImport('skimage.morphology', 'binary_opening')
+binary_closing = nu.LazyImport('skimage.morphology', 'binary_closing')
+disk = nu.LazyImport('skimage.morphology', 'disk')
+skeletonize = nu.LazyImport('skimage.morphology', 'skeletonize')
+
+# Log of the vectorisation, cf nu.startLog()
+log = nu.getLog('VECT')
 
 def init():
     """
@@ -81,13 +98,17 @@ def init():
         
     dest_path str: absolute path of the directory in which to save the 
         results (gpickle files, graph images...). If it doesn't exist, it will
-        be created at runtime.
+        be created at runtime. An occupancy manifest of each stack 
+        ([stackname]_occupancy.csv: emptiness, foreground pixel count and 
+        bounding box of every slice) is also saved there and reused by the 
+        later stages instead of scanning the stack again.
         
     unstack bool: if enabled, the program will save every slice of the 
         tif stacks encountered in [dest_path]/unstacked_slices/. If this 
         directory does not exist, it will be created at runtime. The slices 
         will be name like this: stackname_slicenumber.png.The slice number is 
-        left padded with 0 to ease later processing.
+        left padded with 0 to ease later processing. The slices are written 
+        in the background, concurrently with the vectorisation.
         
     verbose bool: verbosity switch. If set to True, the program will 
         then print its current processing step as  well as the time it needed 
@@ -96,10 +117,11 @@ def init():
         detail to be able to trace the program's progress.
         
     debug bool: debugging switch. If set to True, turns on additional 
-        debug output. Also saves additional visualizations of the processing 
-        like a plot of the contours and the triangulation. May consume a 
-        considerable additional amount of time because the additional figures 
-        take quite long to plot and save.
+        debug output. Also saves the raw data of the processing (contours, 
+        triangles and graph) as [slicename]_debug.npz. These files are cheap 
+        to write: the visualizations of the processing (plots of the contours, 
+        the triangulation and the graph over the triangulation) are rendered 
+        afterwards, for the selected slices only, by RenderDebug.py.
         
     invert bool: inverts the images. Must be switched on if background 
         pixels are white (255). Otherwise in case of empty slices they won't be 
@@ -150,10 +172,14 @@ def init():
         resolution). This saves time and yields acceptable results.
         
     graph_format str: sets the output format of graphs to the desired 
-        format. Supported formats are [gpickle, adjlist, gml, graphml, yaml,
-        edgelist, weighted_edgelist, multiline_adjlist, gexf, pajek]. Have a 
-        look at the different networkx.write_ ... functions for an in detail 
-        explanation. Only the gpickle output has been tested in Python 3.7.
+        format. Supported formats are [gpickle, npz, adjlist, gml, graphml, 
+        yaml, edgelist, weighted_edgelist, multiline_adjlist, gexf, pajek]. 
+        Have a look at the different networkx.write_ ... functions for an in 
+        detail explanation. Only the gpickle and npz outputs have been tested 
+        in Python 3.7. The npz format is a compact binary format (node and 
+        edge arrays, cf nu.writeGraphNpz()), faster to write and load than 
+        gpickle, safe to load and independent of the networkx and Python 
+        versions. It is read by Superposition.py and TrackNodes.py as well.
         
     dpi int: sets the resolution (dots per inch) for plots (networks or 
         debugging plots). High resolutions take longer to save and create 
@@ -165,6 +191,102 @@ def init():
         
     save_distance_map bool: enables saving of the euclidean distance map 
         created during the network extraction process. 
+    
+    
+    # Performance parameters
+    
+    workers int: number of worker processes. All the slices of all the 
+        images found in 'source_path' are gathered into one global queue, 
+        ordered by estimated cost (number of foreground pixels), which the 
+        workers then consume. An overall ETA is reported after each slice. 
+        With workers = 1, the slices are processed one after another in the 
+        main process.
+        
+    pyramid bool: enables the coarse-to-fine vectorisation. For wide 
+        colonies, hyphae are many pixels wide and a full resolution 
+        triangulation is wasteful. The slice is then downsampled, vectorized 
+        to get the topology of the network, and the nodes positions and radii 
+        are refined at full resolution in local windows of the distance map. 
+        The downsampling factor is chosen automatically for each slice from 
+        the radius distribution of its hyphae (slices with thin hyphae are 
+        processed at full resolution).
+        
+    pyramid_check bool: if enabled, the slices vectorized coarse-to-fine are 
+        also vectorized at full resolution, and the speedup and topology 
+        agreement (junctions, apexes, total length) are reported. Only meant 
+        for tuning as it makes the run slower than a plain full resolution one.
+        
+    components int: number of connected components of each graph to save, 
+        starting with the largest one. Defaults to 1 (only the largest 
+        component is kept). 0 keeps all of them.
+        
+    min_component_size int: minimum number of nodes of a saved component.
+        
+    crop str: auto-crop of the slices to their foreground, the background 
+        borders (e.g. the black borders of a registered movie) being then 
+        skipped. With 'movie', one window holding the foreground of all the 
+        slices of a stack is used (the union of their bounding boxes, read in 
+        the occupancy manifest). With 'slice', each slice is cropped to its 
+        own foreground. '' (the default) disables the crop: set 'movie' or 
+        'slice' to turn it on. The graphs are always saved in
+        the original image space, the crop window being recorded in their 
+        'crop' attribute as [y_min, y_max, x_min, x_max] (max excluded).
+        
+    preview bool: quick preview mode, to check whether the binarization 
+        gives sensible graphs before a full run. Only one slice out of 
+        'preview_stride' is processed, downsampled by 'preview_scale', and 
+        no graph or figure is saved. Instead, a summary of the graphs 
+        (nodes, edges and total length per sampled slice) is written in 
+        [dest_path]/preview_summary.csv, and a contact sheet of the graphs 
+        over the slices in [dest_path]/preview_contact_sheet.png.
+        
+    preview_stride int: one slice out of 'preview_stride' is previewed.
+    
+    preview_scale int: downsampling factor of the previewed slices.
+    
+    npz_compressed bool: compression of the graph files saved in the npz 
+        format (smaller files, but slower to write and load).
+        
+    graph_movie bool: if enabled, the graphs of all the slices of a stack 
+        are also gathered into a single container file, 
+        [dest_path]/[stackname]_graphs.gmov (cf nu.writeGraphMovie()), 
+        holding the node and edge arrays of all the frames back to back, 
+        with an offset table and the node count, edge count, total length 
+        and bounding box of each frame. It is memory-mapped when opened with 
+        nu.openGraphMovie(), so that accessing a frame or scanning a metric 
+        across the whole movie does not require to open hundreds of files. 
+        Only for the gpickle and npz graph formats.
+        
+    graph_movie_keyframes int: interval between two keyframes of the graph 
+        movie containers. The consecutive graphs of a growing colony share 
+        most of their nodes and edges: in between two keyframes, only the 
+        nodes and edges added and removed since the previous frame are 
+        saved, nodes being matched by their (quantised) coordinates. This 
+        shrinks the container by a large factor, at the cost of a slightly 
+        slower random access (frames are rebuilt from their keyframe) and of 
+        a loss of precision on the coordinates of the kept nodes (at most 
+        half a pixel along each axis). 0 disables the delta encoding.
+        
+    slice_timeout float: time budget of a slice, in seconds. Some 
+        pathological slices (noise bursts, focus loss) make the triangulation 
+        and the pruning run for many minutes. With a budget, each slice is 
+        vectorized in a child process which is stopped when it exceeds its 
+        budget, and the slice is retried with the cheaper 'fallbacks' 
+        strategies. These slices are flagged at the end of the log. 0 
+        disables the time budget.
+        
+    slice_memory int: memory budget of a slice, in MB (Unix only). 0 
+        disables the memory budget.
+        
+    fallbacks tuple(str): the strategies tried in turn for a slice that 
+        exceeds its budget:
+        - 'simplify': the contours are simplified (2 pixels tolerance) 
+        before the triangulation.
+        - 'downsample': the slice is vectorized coarse-to-fine, as in the 
+        pyramid mode, with at least a factor 2.
+        - 'skeleton': the graph is built from the skeleton of the slice, 
+        without triangulation. Much faster but less accurate.
+        If the last strategy also fails, no graph is saved for the slice.
     """
     
     # General parameters        
@@ -190,45 +312,67 @@ def init():
                    graph_format, dpi, node_size, save_distance_map, pruning, 
                    redundancy]                                              
     
-    return main_params, vect_params
+    # Performance parameters
+    workers = 1
+    pyramid = False
+    pyramid_check = False
+    components = 1
+    min_component_size = 0
+    slice_timeout = 0 # s
+    slice_memory = 0 # MB
+    fallbacks = ('simplify', 'downsample', 'skeleton')
+    crop = '' # no crop, 'movie' or 'slice' to auto-crop
+    preview = False
+    preview_stride = 10
+    preview_scale = 4
+    npz_compressed = True
+    graph_movie = False
+    graph_movie_keyframes = 0
+    perf_params = {'workers':workers, 'pyramid':pyramid, 
+                   'pyramid_check':pyramid_check, 'components':components, 
+                   'min_component_size':min_component_size, 
+                   'slice_timeout':slice_timeout, 'slice_memory':slice_memory,
+                   'fallbacks':fallbacks, 'crop':crop, 'preview':preview,
+                   'preview_stride':preview_stride, 
+                   'preview_scale':preview_scale, 
+                   'npz_compressed':npz_compressed, 'graph_movie':graph_movie,
+                   'graph_movie_keyframes':graph_movie_keyframes}
+    
+    return main_params, vect_params, perf_params
 
-def createContours(image, img_name, height, debug, dest_path, figure_format, 
-                   dpi, verbose):
+def createContours(image, debug, verbose, epsilon=0):
     """
     - Finds the contours of the features present in the image : these contours 
     are approximated using the Teh-Chin-dominant-point detection-algorithm 
     (see Teh, C.H. and Chin, R.T., On the Detection of Dominant Pointson 
     Digital Curve. PAMI 11 8, pp 859-872 (1989)).
+    - Optionally simplifies them further with the Douglas-Peucker algorithm, 
+    which gives fewer points to triangulate.
     - Finds the longest contour within the set of contours.
     
     :param ndarray image: the image (distance_map) from which to find contours
-    :param str img_name: the image name
-    :param int height: the image height in pixel        
     :param bool debug: debugging switch        
-    :param str dest_path: absolute path of the output directory       
-    :param str figure_format: plots and figures saving format
-    :param int dpi: plots and figures resolution
+    :param bool verbose: verbosity switch
+    :param float epsilon: the maximum distance (in pixel) between a contour 
+        and its simplified version. 0 to keep the contours as they are.
 
     :return: the index of the longuest contour and a list of the flattened 
         contours
     :rtype: (int, list([int, int]))
     """
     
-    global log_txt
-    
     raw_contours = nu.getContours(image) # extracts raw contours
+    if epsilon:
+        raw_contours = [cv2.approxPolyDP(c, epsilon, True) 
+                        for c in raw_contours]
     flattened_contours = nu.flattenContours(raw_contours) # flattens nested contour list
     
     if debug:
-        txt = ('VECT>        Contours converted, we have {} contour(s).'
+        txt = ('       Contours converted, we have {} contour(s).'
               .format(len(flattened_contours)))
-        log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
+        log.debug(txt)
     													                
     flattened_contours = nu.thresholdContours(flattened_contours, 3) # filters out contours smaller than 3 in case there are any left
-    
-    if debug:
-        nu.drawContours(height, flattened_contours, img_name, dest_path,
-                        figure_format, dpi)
     											                 
     longuest_length = 0	# length of longuest contour
     
@@ -325,8 +469,6 @@ def triangleClassification(triangulation, debug, verbose):
     :rtype: (list(CshapeTriangle), list())
     """
     
-    global log_txt
-    
     triangles = nu.buildTriangles(triangulation)	 # builds triangles                                                                 
     junction = 0
     normal = 0
@@ -347,39 +489,30 @@ def triangleClassification(triangulation, debug, verbose):
     triangles = list(np.delete(np.asarray(triangles), isolated_indices)) # removes isolated triangles from the list of triangles
     
     if debug:
-        txt = ('VECT>         Triangle types:')
-        log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-        txt = ('VECT>           junction: {}, normal: {}, end: {}, isolated: {}'
+        txt = ('        Triangle types:')
+        log.debug(txt)
+        txt = ('          junction: {}, normal: {}, end: {}, isolated: {}'
               .format(junction, normal, end, len(isolated_indices)))
-        log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
+        log.debug(txt)
         
     return triangles, isolated_indices
 
-def graphPruning(triangles, height, distance_map, verbose, debug, 
-                 dest_path, img_name, figure_format, dpi, pruning):
+def graphPruning(triangles, distance_map, verbose, debug, pruning):
     """
     Prunes away the outermost branches to avoid surplus branches due to 
     noisy contours.
     
     :param triangles: a list of triangles found in the image
     :type triangles: list(CshapeTriangle)
-    :param int height: image height
     :param ndarray distance_map: the distance map of the image
     :param bool verbose: verbosity switch
     :param bool debug: debugging switch
-    :param str dest_path: the output directory 
-    :param str img_name: the name of the image currently being worked on
-    :param str figure_format: the wanted format for the triangulation figure 
-        output 
-    :param int dpi: the wanted resolution for the figure
     :param int pruning: branches pruning threshold  
 
     :return: a list of the remaining triangles after pruning
     :rtype: list(CshapeTriangle)
     """
     
-    global log_txt
-    
     triangles = nu.bruteforcePruning(triangles, pruning, verbose) # prunes away the 'pruning' number of triangles at the ends of the network
     
     default_triangles = 0
@@ -402,22 +535,20 @@ def graphPruning(triangles, height, distance_map, verbose, debug,
             isolated += 1
     
     if debug:
-        nu.drawTriangulation(triangles, img_name, dest_path, 
-                             distance_map, figure_format, dpi)
-        txt = ('VECT>         Triangles defaulted to zero: {}'
+        txt = ('        Triangles defaulted to zero: {}'
               .format(default_triangles))
-        log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-        txt = ('VECT>         Triangle types:')
-        log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-        txt = ('VECT>           junction: {}, normal: {}, end: {}, isolated: {}'
+        log.debug(txt)
+        txt = ('        Triangle types:')
+        log.debug(txt)
+        txt = ('          junction: {}, normal: {}, end: {}, isolated: {}'
               .format(junction, normal, end, isolated))
-        log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
+        log.debug(txt)
         
     return triangles
 
-def cleanAndSaveGraph(G, triangles, distance_map, img_name, dest_path, verbose, 
-                      debug, params, plot, figure_format, dpi, graph_format, 
-                      node_size, height):   
+def cleanAndSaveGraph(G, img_name, dest_path, verbose, params, plot, 
+                      figure_format, dpi, graph_format, node_size, height, 
+                      components=1, min_component_size=0, compressed=True):   
     """
     - If so specified, removes half the redundant nodes (i.e. nodes with
     degree 2), draws and saves the graph.
@@ -425,22 +556,23 @@ def cleanAndSaveGraph(G, triangles, distance_map, img_name, dest_path, verbose,
     graph.
         
     :param nx.Graph G: the graph currently being worked on
-    :param triangles: the list of triangles found in the image
-    :type triangles: list(CshapeTriangle)
-    :param ndarray distance_map: the distance map of the image
     :param str img_name: the name of the image currently being worked on
     :param str dest_path: the output directory 
     :param bool verbose: verbosity switch
-    :param bool debug: debugging switch
     :param params: a dictionnary matching parameters name with their values
     :type params: dict{str : int}
-    :param bool plot: enables the writing of the graph and triangulation figure
-    :param str figure_format: the wanted format for the graph and triangulation 
-        figure output 
+    :param bool plot: enables the writing of the graph figure
+    :param str figure_format: the wanted format for the graph figure output 
     :param int dpi: the wanted resolution for the figure and the graph image
     :param graph_format: the wanted format for the graph image output 
     :param int node_size: the size of the nodes in the graph image
     :param int height: the image height
+    :param int components: the number of connected components to keep, 
+        starting with the largest one. 0 to keep all of them.
+    :param int min_component_size: the minimum number of nodes of a kept 
+        component
+    :param bool compressed: True to compress the graph files in the npz 
+        format
     """
         
     redundancy = params['r']
@@ -448,41 +580,306 @@ def cleanAndSaveGraph(G, triangles, distance_map, img_name, dest_path, verbose,
     # Draws and saves graph with redundant nodes
     if redundancy == 2: 
         nu.drawAndSave(G, img_name, dest_path, params, verbose, plot, 
-                       figure_format, dpi, graph_format, node_size, height)                                                   
-    if debug:
-        nu.drawGraphTriangulation(G, triangles, img_name, dest_path, 
-                                  distance_map, figure_format, dpi)
+                       figure_format, dpi, graph_format, node_size, height, 
+                       components, min_component_size, compressed)                                                   
     
     # Draws and saves graph with half redundant nodes
     if redundancy == 1:                                                            
         G = nu.removeRedundantNodes(G, verbose, 1)
         nu.drawAndSave(G, img_name, dest_path, params, verbose, plot, 
-                       figure_format, dpi, graph_format, node_size, height)
+                       figure_format, dpi, graph_format, node_size, height, 
+                       components, min_component_size, compressed)
     
     # Draws and saves graph without redundant nodes
     if redundancy == 0:   
         G = nu.removeRedundantNodes(G, verbose, 0) 
         nu.drawAndSave(G, img_name, dest_path, params, verbose, plot, 
-                       figure_format, dpi, graph_format, node_size, height)			
+                       figure_format, dpi, graph_format, node_size, height, 
+                       components, min_component_size, compressed)			
+
+
+def extractGraph(sli, distance_map, debug, verbose, pruning, epsilon=0):
+    """
+    Extracts the graph of a (prepared) binary slice: contours, mesh, 
+    triangulation, triangles classification, pruning and graph creation.
+    
+    :param ndarray sli: the binary slice
+    :param ndarray distance_map: the distance map of the slice, as int
+    :param bool debug: debugging switch
+    :param bool verbose: verbosity switch
+    :param int pruning: branches pruning threshold  
+    :param float epsilon: the contours simplification tolerance, cf 
+        createContours()
+    
+    :return: the graph (with all its redundant nodes), the contours and the 
+        triangles it was built from
+    :rtype: (nx.Graph, list([int, int]), list(CshapeTriangle))
+    """
+    
+    extra = None if verbose else nu.quiet_log # printed if verbose only
+    
+    previous_step = time.time()
+    txt = '      Contour extraction and thresholding...'
+    log.info(txt, extra=extra)
+        
+    longuest_index, flattened_contours = createContours(sli, debug, verbose,
+                                                        epsilon)
+        
+    timer = time.time()
+    txt = ('      ...done in {:.4f} s.'
+           .format(timer-previous_step))
+    log.info(txt, extra=extra)
+    previous_step = timer
+    txt = '      Mesh creation...'
+    log.info(txt, extra=extra)
+        
+    mesh_points, mesh_facets, hole_points = createMesh(longuest_index,
+                                                       flattened_contours)
+
+    timer = time.time()
+    txt = ('      ...done in {:.4f} s.'
+          .format(timer-previous_step))
+    log.info(txt, extra=extra)
+    previous_step = timer
+    txt = '      Triangulation...'
+    log.info(txt, extra=extra)
+        
+    triangulation = createTriangulation(mesh_points, mesh_facets, 
+                                        hole_points)    
+    
+    timer = time.time()
+    txt = ('      ...done in {:.4f} s.'
+          .format(timer-previous_step))
+    log.info(txt, extra=extra)
+    previous_step = timer
+    txt = ('      Setup of triangles and neighborhood '
+          'relations...')
+    log.info(txt, extra=extra)
+
+    triangles, isolated_indices = triangleClassification(triangulation,
+                                                         debug, verbose)
+
+    timer = time.time()
+    txt = ('      ...done in {:.4f} s.'
+          .format(timer-previous_step))
+    log.info(txt, extra=extra)
+    previous_step = timer
+    txt = '      Pruning...'
+    log.info(txt, extra=extra)
+        
+    triangles = graphPruning(triangles, distance_map, verbose, debug, 
+                             pruning)
+
+    timer = time.time()
+    txt = ('      ...done in {:.4f} s.'
+          .format(timer-previous_step))
+    log.info(txt, extra=extra)
+    previous_step = timer
+    txt = '      Graph creation...'
+    log.info(txt, extra=extra)
+
+    adjacency_matrix = nu.createTriangleAdjacencyMatrix(triangles)
+    G = nu.createGraph(adjacency_matrix, triangles)
+
+    timer = time.time()
+    txt = ('      ...done in {:.4f} s.'
+          .format(timer-previous_step))
+    log.info(txt, extra=extra)
+    
+    return G, flattened_contours, triangles
+
+def skeletonGraph(sli, distance_map):
+    """
+    Extracts the graph of a (prepared) binary slice from its skeleton, 
+    without any triangulation. It is much cheaper but less accurate than 
+    extractGraph() (the junctions are less well placed and small spurs are 
+    kept), and is only used as a last resort for the slices that exceed 
+    their budget. Each skeleton pixel is a node, linked to its 8-neighbours 
+    (a diagonal link is skipped when the two pixels are already linked 
+    through a common neighbour, to avoid small cycles). The nodes and edges 
+    have the same attributes as in createGraph().
+    
+    :param ndarray sli: the binary slice
+    :param ndarray distance_map: the distance map of the slice, as int
+    
+    :return: the graph (with all its redundant nodes)
+    :rtype: nx.Graph
+    """
+    
+    skeleton = skeletonize(sli > 0)
+    height, width = skeleton.shape
+    rows, cols = np.nonzero(skeleton)
+    labels = -np.ones((height+2, width+2), dtype=np.int64) # padded, -1 outside
+    labels[rows+1, cols+1] = np.arange(len(rows))
+    
+    G = nx.Graph()
+    conductivity = distance_map[rows, cols].astype(float)
+    G.add_nodes_from((i, {'x':float(cols[i]), 'y':float(rows[i]), 
+                          'conductivity':conductivity[i]}) 
+                     for i in range(len(rows)))
+    
+    for dy, dx in ((0, 1), (1, 0), (1, 1), (1, -1)):
+        neighbours = labels[rows+1+dy, cols+1+dx]
+        linked = neighbours >= 0
+        if dy and dx: # diagonal: skipped if there is a 4-connected path
+            linked &= ((labels[rows+1, cols+1+dx] < 0) & 
+                       (labels[rows+1+dy, cols+1] < 0))
+        sources = np.flatnonzero(linked)
+        targets = neighbours[linked]
+        G.add_edges_from((s, t, {'conductivity':(conductivity[s] + 
+                                                 conductivity[t]) / 2.0,
+                                 'weight':math.hypot(dx, dy)}) 
+                         for s, t in zip(sources.tolist(), targets.tolist()))
+    return G
 
+def pyramidScale(distance_map):
+    """
+    Chooses the downsampling factor of the pyramid mode from the radius 
+    distribution of the hyphae, read on the ridges (local maxima) of the 
+    distance map. The factor is chosen so that the thinnest hyphae (10th 
+    percentile of the radii) are still about 3 pixels wide once downsampled.
+    
+    :param ndarray distance_map: the distance map of the slice
+    
+    :return: the downsampling factor, 1 if downsampling is not worth it
+    :rtype: int
+    """
+    
+    ridges = ((distance_map > 0) & 
+              (distance_map == ndi.maximum_filter(distance_map, size=3)))
+    if not np.any(ridges):
+        return 1
+    radius = np.percentile(distance_map[ridges], 10)
+    return max(1, int(2*radius // 3))
 
-def vectorize(main_params, vect_params, manual_log_path=''):
+def downsampleSlice(sli, scale):
+    """
+    Downsamples a binary slice by an integer factor. A coarse pixel is 
+    foreground if at least half of the pixels it covers are.
+    
+    :param ndarray sli: the binary slice
+    :param int scale: the downsampling factor
+    
+    :return: the downsampled binary slice (0 or 255)
+    :rtype: ndarray
     """
-    Vectorizes binarized images with the given parameters.
     
+    height, width = sli.shape
+    small = cv2.resize((sli > 0).astype(np.uint8)*255, 
+                       (max(1, width // scale), max(1, height // scale)), 
+                       interpolation=cv2.INTER_AREA)
+    return np.where(small >= 128, 255, 0).astype(np.uint8)
+
+def refineGraph(G, distance_map, scale):
+    """
+    Brings a graph extracted from a downsampled slice back to full 
+    resolution. Each node is moved, within a local window around its 
+    upscaled position, to the highest value of the full resolution distance 
+    map (i.e. onto the medial axis of the hypha), which also gives its radius. 
+    Edge lengths and conductivities are then updated like in createGraph().
+    
+    :param nx.Graph G: the graph extracted from the downsampled slice
+    :param ndarray distance_map: the full resolution distance map
+    :param int scale: the downsampling factor
+    
+    :return: the refined graph
+    :rtype: nx.Graph
+    """
+    
+    height, width = distance_map.shape
+    nodes = list(G.nodes())
+    x = np.array([G.nodes[n]['x'] for n in nodes])*scale + (scale-1) / 2
+    y = np.array([G.nodes[n]['y'] for n in nodes])*scale + (scale-1) / 2
+    x = np.clip(np.round(x).astype(int), 0, width-1)
+    y = np.clip(np.round(y).astype(int), 0, height-1)
+    
+    # Gathering all the windows at once: one row of candidates per node
+    offsets = np.arange(-scale, scale+1)
+    dy, dx = [o.ravel() for o in np.meshgrid(offsets, offsets, indexing='ij')]
+    ys = np.clip(y[:, None] + dy, 0, height-1)
+    xs = np.clip(x[:, None] + dx, 0, width-1)
+    values = distance_map[ys, xs]
+    best = np.argmax(values, axis=1)
+    
+    for i, n in enumerate(nodes):
+        G.nodes[n]['x'] = float(xs[i, best[i]])
+        G.nodes[n]['y'] = float(ys[i, best[i]])
+        G.nodes[n]['conductivity'] = float(values[i, best[i]])
+    
+    for n1, n2, data in G.edges(data=True):
+        data['conductivity'] = (G.nodes[n1]['conductivity'] + 
+                                G.nodes[n2]['conductivity']) / 2.0
+        data['weight'] = math.hypot(G.nodes[n1]['x']-G.nodes[n2]['x'], 
+                                    G.nodes[n1]['y']-G.nodes[n2]['y'])
+    return G
+
+def compareTopology(G, G_ref, tolerance):
+    """
+    Measures the topology agreement of a graph with a reference graph: 
+    number of junctions (degree >= 3) and apexes (degree 1), total length, 
+    and the fraction of the reference junctions that have a junction of G 
+    closer than 'tolerance'.
+    
+    :param nx.Graph G: the graph to assess
+    :param nx.Graph G_ref: the reference graph
+    :param float tolerance: the matching distance for junctions, in pixel
+    
+    :return: the agreement measures
+    :rtype: dict{str: float}
+    """
+    
+    def junctionsAndApexes(graph):
+        degrees = dict(graph.degree())
+        junctions = np.array([(graph.nodes[n]['x'], graph.nodes[n]['y']) 
+                              for n, d in degrees.items() if d >= 3])
+        apexes = sum([1 for d in degrees.values() if d == 1])
+        return junctions.reshape(-1, 2), apexes
+    
+    junctions, apexes = junctionsAndApexes(G)
+    junctions_ref, apexes_ref = junctionsAndApexes(G_ref)
+    
+    if len(junctions_ref) and len(junctions):
+        distances = cKDTree(junctions).query(junctions_ref)[0]
+        matched = np.mean(distances <= tolerance)
+    else:
+        matched = float(len(junctions_ref) == len(junctions))
+        
+    return {'junctions':len(junctions), 'junctions_ref':len(junctions_ref),
+            'apexes':apexes, 'apexes_ref':apexes_ref, 
+            'length':G.size(weight='weight'), 
+            'length_ref':G_ref.size(weight='weight'),
+            'junctions_matched':matched}
+
+def vectorizeSlice(task, main_params, vect_params, options):
+    """
+    Vectorizes one slice of the global work queue and saves its graph(s). 
+    This function is run either inline or in a worker process of the 
+    scheduler, so the slice is loaded from disk here rather than passed along.
+    
+    :param task: the slice to process: (absolute path of the image, slice 
+        index, slice name, slice label for the log, estimated cost, crop 
+        window or None, cf nu.cropWindow())
+    :type task: (str, int, str, str, int, tuple)
     :param main_params: a list of the main parameters
     :type main_params: [str, str, bool, bool, bool, bool]
     :param vect_params: a list of the vectorisation parameters
     :type vect_params: [bool, bool, str, str, int, int, bool, int, int]
-    :param str manual_log_path: the absolute path of the log file. By default,
-        a file 'log.txt' will be created at the root of the dest_path directory.
-    """
+    :param options: the processing options of vectorize(): 'pyramid', 
+        'pyramid_check', 'components', 'min_component_size', 
+        'npz_compressed', the budget options, 'start_method' (the start 
+        method of the worker processes, None for the default one) and 
+        'strategy', the vectorisation strategy ('' for the 
+        normal one, or one of the fallbacks 'simplify', 'downsample' and 
+        'skeleton', cf init())
+    :type options: dict{str: bool or int or str}
     
-    global log_txt
-    
-    source_path = main_params[0]
+    :return: the slice name, its processing time and a report of the
+        processing (pyramid scale and check results, fallback strategy)
+    :rtype: (str, float, dict)
+    """
+
+    img_path, index, sli_name, label, cost, window = task
     dest_path = main_params[1]
-    unstack = main_params[2]
     verbose = main_params[3]
     debug = main_params[4]      
     invert = main_params[5]
@@ -496,22 +893,486 @@ def vectorize(main_params, vect_params, manual_log_path=''):
     pruning = vect_params[7]
     redundancy = vect_params[8]
     params = {'r':redundancy, 'p':pruning}
+    report = {}
+
+    start_sli = time.time()
+    previous_step = start_sli        
+    txt = '   Vectorization of {}...'.format(label)
+    log.info(txt)
+    txt = ('      Slice preparation...')
+    log.info(txt)
+    
+    sli = nu.readSlice(img_path, index, invert)
+    shape = sli.shape
+    height, width = shape
+    
+    # Only the window holding the foreground is processed, the graph being 
+    # brought back to the original image space afterwards
+    if window is not None:
+        sli = sli[window[0]:window[1], window[2]:window[3]]
+        report['crop'] = window
+    else:
+        window = (0, height, 0, width)
+    
+    if smoothing: # standard binary image noise-removal with opening followed by closing
+        sli = binary_opening(sli, disk(smoothing)) # maybe remove this processing step if depicted structures are really tiny
+        sli = binary_closing(sli, disk(smoothing))
+        
+    if debug:
+        slimage = Image.fromarray(nu.uncropArray(sli, window, shape), mode='L')
+        slimage.save(os.path.join(dest_path, sli_name + 
+                                  '_processed.png'))
+    
+    # Creation of the distance_map
+    distance_map = ndi.distance_transform_edt(sli)
+    
+    if save_distance_map:
+        dist_map = nu.uncropArray(distance_map.astype(np.uint32), window, 
+                                  shape)
+        dist_map = Image.fromarray(dist_map, mode='I')
+        dist_map.save(os.path.join(dest_path, sli_name + '_dm.png')) # saves the distance map in case we need it later
+    
+    distance_map = distance_map.astype(np.int) # conversion to int for C_net_functions compatibility
+    
+    strategy = options['strategy']
+    if strategy == 'downsample': # always coarse-to-fine, even thin hyphae
+        scale = max(2, pyramidScale(distance_map))
+    elif options['pyramid'] and strategy != 'skeleton':
+        scale = pyramidScale(distance_map)
+    else:
+        scale = 1
+    epsilon = 2 if strategy == 'simplify' else 0 # in pixel
+    if strategy:
+        report['fallback'] = strategy
+
+    timer = time.time()            
+    txt = ('      ...done in {:.4f} s.'
+          .format(timer-previous_step))
+    log.info(txt)
+    previous_step = timer
+    
+    if strategy == 'skeleton':
+        txt = '      Vectorization from the skeleton...'
+        log.info(txt)
+        
+        G = skeletonGraph(sli, distance_map)
+        
+        timer = time.time()
+        txt = ('      ...done in {:.4f} s.'
+               .format(timer-previous_step))
+        log.info(txt)
+        
+    elif scale > 1: # coarse-to-fine: topology at low resolution, then refinement
+        txt = ('      Coarse vectorization at scale 1/{}...'
+               .format(scale))
+        log.info(txt)
+        
+        small = downsampleSlice(sli, scale)
+        small_distance_map = ndi.distance_transform_edt(small).astype(np.int)
+        G, flattened_contours, triangles = extractGraph(small, 
+                                                        small_distance_map, 
+                                                        debug, verbose, 
+                                                        pruning, epsilon)
+        G = refineGraph(G, distance_map, scale)
+        report['pyramid_scale'] = scale
+        
+        timer = time.time()
+        txt = ('      ...coarse vectorization and refinement done in '
+               '{:.4f} s.'.format(timer-previous_step))
+        log.info(txt)
+        
+        # Full resolution run for comparison (not for a fallback strategy)
+        if options['pyramid_check'] and not strategy:
+            txt = '      Full resolution vectorization for checking...'
+            log.info(txt)
+            G_ref = extractGraph(sli, distance_map, False, False, pruning)[0]
+            check_timer = time.time()
+            report.update(compareTopology(G, G_ref, scale))
+            report['pyramid_speedup'] = ((check_timer-timer) / 
+                                         max(timer-previous_step, 1e-6))
+            txt = ('      ...speedup x{:.2f}, junctions {} (full '
+                   'resolution: {}, {:.1%} matched), apexes {} ({}), length '
+                   '{:.0f} ({:.0f}).'
+                   .format(report['pyramid_speedup'], report['junctions'],
+                           report['junctions_ref'], 
+                           report['junctions_matched'], report['apexes'], 
+                           report['apexes_ref'], report['length'],
+                           report['length_ref']))
+            log.info(txt)
+    else:
+        G, flattened_contours, triangles = extractGraph(sli, distance_map, 
+                                                        debug, verbose, 
+                                                        pruning, epsilon)
+    previous_step = time.time()
+    
+    offset = np.array([window[2], window[0]]) # (x, y) of the crop window
+    if 'crop' in report: # the window is recorded with the graph
+        nu.shiftGraph(G, offset[0], offset[1])
+        G.graph['crop'] = list(window)
+    
+    # Raw data for the debugging figures, rendered later by RenderDebug.py
+    if debug and strategy != 'skeleton':
+        triangle_points, triangle_types = nu.trianglesToArrays(triangles)
+        artifacts = {'source':img_path, 'index':index, 'invert':invert, 
+                     'smoothing':smoothing, 'height':height, 
+                     'contours':[np.asarray(c)*scale + offset
+                                 for c in flattened_contours],
+                     'triangle_points':triangle_points*scale + offset,
+                     'triangle_types':triangle_types,
+                     'graph':G.copy()} # before the removal of redundant nodes
+        nu.saveDebugArtifacts(os.path.join(dest_path, sli_name + '_debug.npz'),
+                              artifacts)
+
+    txt = ('      Removal of redundant nodes, drawing and '
+           'saving of the graph...')
+    log.info(txt)
+
+    cleanAndSaveGraph(G, sli_name, dest_path, verbose, params, plot, 
+                      figure_format, dpi, graph_format, node_size, height, 
+                      options['components'], options['min_component_size'],
+                      options['npz_compressed'])
+
+    timer = time.time()
+    txt = ('      ...done in {:.4f} s.'
+           .format(timer-previous_step))
+    log.info(txt)
+    txt = ('   ...{} done in {:.4f} s.'
+           .format(label, timer-start_sli))   
+    log.info(txt)
+    
+    return sli_name, timer-start_sli, report
+
+def previewSlice(task, main_params, vect_params, options):
+    """
+    Vectorizes one slice quickly for the preview mode: the slice is 
+    downsampled by the 'preview_scale' factor of 'options', and nothing is 
+    saved (no graph, no figure). Only a summary of the graph and a small 
+    image of the graph over the slice are returned.
+    
+    :param task: the slice to process, cf vectorizeSlice()
+    :type task: (str, int, str, str, int, tuple)
+    :param main_params: a list of the main parameters
+    :type main_params: [str, str, bool, bool, bool, bool]
+    :param vect_params: a list of the vectorisation parameters
+    :type vect_params: [bool, bool, str, str, int, int, bool, int, int]
+    :param options: the processing options, cf vectorizeSlice()
+    :type options: dict{str: bool or int or str}
+    
+    :return: the slice name, its processing time and its report: number of
+        nodes (junctions and apexes) and edges between them, total length in
+        pixel of the original image, and the thumbnail of the slice
+    :rtype: (str, float, dict)
+    """
+
+    img_path, index, sli_name, label, cost, window = task
+    invert = main_params[5]
+    smoothing = vect_params[0]
+    pruning = vect_params[7]
+    scale = options['preview_scale']
+    
+    start_sli = time.time()
+    txt = '   Preview of {}...'.format(label)
+    log.info(txt)
+    
+    sli = nu.readSlice(img_path, index, invert)
+    if window is not None:
+        sli = sli[window[0]:window[1], window[2]:window[3]]
+    if smoothing:
+        sli = binary_opening(sli, disk(smoothing))
+        sli = binary_closing(sli, disk(smoothing))
+    if scale > 1:
+        sli = downsampleSlice(sli, scale)
+    
+    report = {'nodes':0, 'edges':0, 'length':0.0}
+    thumbnail = cv2.cvtColor(np.where(sli > 0, 96, 0).astype(np.uint8), 
+                             cv2.COLOR_GRAY2BGR)
+    
+    if np.any(sli):
+        distance_map = ndi.distance_transform_edt(sli).astype(np.int)
+        G = extractGraph(sli, distance_map, False, False, pruning)[0]
+        G = nu.largestComponents(G, options['components'], 
+                                 options['min_component_size'])
+        
+        # Counts of the graph without redundant nodes, without building it
+        degrees = np.array([d for n, d in G.degree()], dtype=np.int64)
+        report['nodes'] = int(np.count_nonzero(degrees != 2))
+        report['edges'] = int(degrees[degrees != 2].sum() // 2)
+        report['length'] = G.size(weight='weight') * scale
+        
+        arrays = nu.graphToArrays(G)
+        points = np.stack((arrays['x'], arrays['y']), axis=1)
+        lines = np.round(points[arrays['edges']]).astype(np.int32)
+        cv2.polylines(thumbnail, list(lines), False, (0, 255, 0), 1)
+    report['thumbnail'] = thumbnail
+    
+    elapsed = time.time()-start_sli
+    txt = ('   ...{} nodes, {} edges, length {:.0f}, done in {:.4f} s.'
+           .format(report['nodes'], report['edges'], report['length'], 
+                   elapsed))
+    log.info(txt)
+    
+    return sli_name, elapsed, report
+
+def budgetedAttempt(connection, task, main_params, vect_params, options):
+    """
+    Runs vectorizeSlice() in a child process started by budgetedSlice(), 
+    under the memory budget, and sends back its result through 'connection':
+    ('done', result, log records), ('memory', message, log records) if it 
+    ran out of memory, or ('error', exception, log records) if it failed 
+    for another reason. The log records are captured rather than written, 
+    cf nu.capturedLog().
+    
+    :param multiprocessing.Connection connection: the sending end of the 
+        pipe to budgetedSlice()
+    :param task: the slice to process, cf vectorizeSlice()
+    :type task: (str, int, str, str, int, tuple)
+    :param main_params: a list of the main parameters
+    :type main_params: [str, str, bool, bool, bool, bool]
+    :param vect_params: a list of the vectorisation parameters
+    :type vect_params: [bool, bool, str, str, int, int, bool, int, int]
+    :param options: the processing options, cf vectorizeSlice()
+    :type options: dict{str: bool or int or str}
+    """
+    
+    if options['slice_memory'] and resource is not None:
+        limit = options['slice_memory'] * 1024**2
+        resource.setrlimit(resource.RLIMIT_AS, 
+                           (limit, resource.getrlimit(resource.RLIMIT_AS)[1]))
+    with nu.capturedLog() as records:
+        try:
+            outcome = ('done', vectorizeSlice(task, main_params, vect_params,
+                                              options))
+        except MemoryError:
+            outcome = ('memory', 'out of memory')
+        except Exception as e:
+            outcome = ('error', e)
+    try:
+        connection.send(outcome + (records,))
+    except Exception: # exception that can't be pickled
+        connection.send(('error', RuntimeError(repr(outcome[1])), records))
+    connection.close()
+
+def budgetedSlice(task, main_params, vect_params, options):
+    """
+    Vectorizes one slice within the time and memory budget given in 
+    'options'. Each attempt is run in a child process, which is killed if it 
+    exceeds the time budget. A slice that exceeds its budget (time, memory, 
+    or crash of the attempt, e.g. killed by the system) is retried with the 
+    next (cheaper) fallback strategy, until one succeeds. Any other error is 
+    not a budget matter: it is raised again as is, without fallback. Without 
+    budget, the slice is simply vectorized in the current process.
+    
+    :param task: the slice to process, cf vectorizeSlice()
+    :type task: (str, int, str, str, int, tuple)
+    :param main_params: a list of the main parameters
+    :type main_params: [str, str, bool, bool, bool, bool]
+    :param vect_params: a list of the vectorisation parameters
+    :type vect_params: [bool, bool, str, str, int, int, bool, int, int]
+    :param options: the processing options, cf vectorizeSlice()
+    :type options: dict{str: bool or int or str}
+    
+    :return: the result of vectorizeSlice() for the successful attempt,
+        with the time of all the attempts. Its report flags the fallback
+        strategy used ('fallback') and the failed attempts
+        ('budget_failures'). If all the attempts failed, no graph is saved
+        and 'fallback' is 'failed'.
+    :rtype: (str, float, dict)
+    
+    :raises Exception: the error raised by vectorizeSlice() in an attempt, 
+        if it is not out of memory
+    """
+
+    if not options['slice_timeout'] and not options['slice_memory']:
+        return vectorizeSlice(task, main_params, vect_params, options)
+    
+    label = task[3]
+    timeout = options['slice_timeout'] or None
+    start = time.time()
+    failures = []
+    
+    strategies = [''] + list(options['fallbacks'])
+    context = multiprocessing.get_context(options['start_method'])
+    for strategy in strategies:
+        
+        receiver, sender = context.Pipe(duplex=False)
+        attempt = context.Process(target=budgetedAttempt, 
+                                  args=(sender, task, main_params, 
+                                        vect_params, 
+                                        dict(options, strategy=strategy)))
+        attempt.start()
+        sender.close() # so that a crash of the attempt is seen as EOF
+        
+        try:
+            if receiver.poll(timeout):
+                outcome, result, records = receiver.recv()
+                nu.replayLog(records) # log of the attempt
+            else:
+                outcome, result = 'time', 'over {} s'.format(timeout)
+        except EOFError: # killed, e.g. by the system when out of memory
+            outcome, result = 'crash', 'exit code {}'.format(attempt.exitcode)
+        
+        if attempt.is_alive():
+            attempt.terminate()
+        attempt.join()
+        receiver.close()
+        
+        if outcome == 'done':
+            sli_name, elapsed, report = result
+            report['budget_failures'] = failures
+            return sli_name, time.time()-start, report
+        if outcome == 'error': # not a budget overrun, no fallback
+            txt = ('   ERROR: the {} vectorization of {} failed ({!r}).'
+                   .format(strategy or 'normal', label, result))
+            log.error(txt)
+            raise result
+        
+        failures.append((strategy or 'normal', outcome))
+        txt = ('   The {} vectorization of {} failed ({}: {}).'
+               .format(strategy or 'normal', label, outcome, result))
+        log.warning(txt)
+        if strategy != strategies[-1]:
+            txt = ('   Retrying with the {} strategy...'
+                   .format(strategies[strategies.index(strategy)+1]))
+            log.info(txt)
+    
+    txt = '   ERROR: no graph could be extracted from {}.'.format(label)
+    log.error(txt)
+
+    return (task[2], time.time()-start,
+            {'fallback':'failed', 'budget_failures':failures})
+
+def scheduleSlices(tasks, workers, main_params, vect_params, options):
+    """
+    Runs the slices of the global work queue, within their budget (cf 
+    budgetedSlice()) or in preview mode (cf previewSlice()), either inline (workers = 1) or on a pool of worker 
+    processes. In the latter case, the most expensive slices are started 
+    first so that one huge slice or stack does not end up serialising the 
+    end of the run.
+    
+    :param tasks: the global work queue, cf vectorizeSlice()
+    :type tasks: list((str, int, str, str, int, tuple))
+    :param int workers: the number of worker processes
+    :param main_params: a list of the main parameters
+    :type main_params: [str, str, bool, bool, bool, bool]
+    :param vect_params: a list of the vectorisation parameters
+    :type vect_params: [bool, bool, str, str, int, int, bool, int, int]
+    :param options: the processing options, cf vectorizeSlice()
+    :type options: dict{str: bool or int or str}
+    
+    :return: a generator of couples (task, result of budgetedSlice() or
+        previewSlice()), in order of completion. The log of the slices
+        processed by the workers is written by the main process when they
+        are done (cf nu.loggedCall()).
+    :rtype: generator(((str, int, str, str, int, tuple), (str, float, dict)))
+    """
+    
+    process = previewSlice if options['preview'] else budgetedSlice
+    
+    if workers <= 1:
+        for task in tasks:
+            yield task, process(task, main_params, vect_params, options)
+        return
+    
+    tasks = sorted(tasks, key=operator.itemgetter(4), reverse=True) # longest first
+    context = multiprocessing.get_context(options['start_method'])
+    with ProcessPoolExecutor(max_workers=workers, 
+                             mp_context=context) as executor:
+        futures = {executor.submit(nu.loggedCall, process, task, main_params,
+                                   vect_params, options): task
+                   for task in tasks}
+        for future in as_completed(futures):
+            result, records = future.result()
+            nu.replayLog(records)
+            yield futures[future], result
+
+def vectorize(main_params, vect_params, manual_log_path='', workers=1, 
+              pyramid=False, pyramid_check=False, components=1, 
+              min_component_size=0, slice_timeout=0, slice_memory=0, 
+              fallbacks=('simplify', 'downsample', 'skeleton'), crop='', 
+              preview=False, preview_stride=10, preview_scale=4, 
+              npz_compressed=True, graph_movie=False, graph_movie_keyframes=0,
+              json_log_path=''):
+    """
+    Vectorizes binarized images with the given parameters. All the slices of 
+    all the images are first gathered into one global work queue, which is 
+    then processed by 'workers' processes.
+    
+    :param main_params: a list of the main parameters
+    :type main_params: [str, str, bool, bool, bool, bool]
+    :param vect_params: a list of the vectorisation parameters
+    :type vect_params: [bool, bool, str, str, int, int, bool, int, int]
+    :param str manual_log_path: the absolute path of the log file. By default,
+        a file 'log.txt' will be created at the root of the dest_path directory.
+    :param int workers: the number of worker processes used to vectorize the 
+        slices. 1 processes them one after another in the main process.
+    :param bool pyramid: True to vectorize the slices coarse-to-fine, cf 
+        init() for more details
+    :param bool pyramid_check: True to also vectorize at full resolution the 
+        slices processed coarse-to-fine, to report the speedup and the 
+        topology agreement
+    :param int components: the number of connected components of each graph 
+        to save, starting with the largest one. 0 to keep all of them.
+    :param int min_component_size: the minimum number of nodes of a saved 
+        component
+    :param float slice_timeout: the time budget of a slice, in seconds. 0 
+        for no time budget.
+    :param int slice_memory: the memory budget of a slice, in MB. 0 for no 
+        memory budget.
+    :param fallbacks: the strategies tried in turn for the slices exceeding 
+        their budget, cf init()
+    :type fallbacks: tuple(str)
+    :param str crop: '' to process the whole slices, 'movie' to process only 
+        the window holding the foreground of the whole stack, 'slice' to 
+        crop each slice to its own foreground
+    :param bool preview: True for a quick preview instead of the 
+        vectorisation, cf init()
+    :param int preview_stride: the preview processes one slice out of 
+        'preview_stride'
+    :param int preview_scale: the downsampling factor of the slices in the 
+        preview
+    :param bool npz_compressed: True to compress the graph files when 
+        'graph_format' is 'npz'
+    :param bool graph_movie: True to also gather the graphs of each stack 
+        into a graph movie container, cf init()
+    :param int graph_movie_keyframes: the interval between two keyframes of
+        the delta-encoded graph movie containers, 0 for no delta encoding
+    :param str json_log_path: the absolute path of an optional second log
+        file, written as JSON lines (cf nu.startLog())
+    """
+
+    source_path = main_params[0]
+    dest_path = main_params[1]
+    unstack = main_params[2]
+    verbose = main_params[3]
+    debug = main_params[4]      
+    invert = main_params[5]
+    smoothing = vect_params[0]
+    graph_format = vect_params[3]
+    pruning = vect_params[7]
+    redundancy = vect_params[8]
+    params = {'r':redundancy, 'p':pruning}
+    margin = 2 + int(smoothing) # background kept around the cropped foreground
     
     if debug:
         verbose = True
+    if preview: # nothing is saved but the summary and the contact sheet
+        unstack = False
     
     # Log path determination
     if manual_log_path:
         log_path = manual_log_path
-    else:    
+    else:
         log_path = os.path.join(dest_path, 'log.txt')
-    log_txt = ''
-    
-        
+
+    # Creation of the dest directory if it doesn't exist
+    if not os.path.exists(dest_path):
+        os.mkdir(dest_path)
+
+    nu.startLog(log_path, verbose, json_log_path, debug)
     start = time.time()
     previous_step = start
-    txt = 'VECT> Initialization...'
-    log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
+    txt = 'Initialization...'
+    log.info(txt)
     
     # Creation of a list of the images to vectorize
     images = []
@@ -529,234 +1390,270 @@ def vectorize(main_params, vect_params, manual_log_path=''):
     else:
         txt = ('The source_path given as parameter does not refer to '
                'an existing path.')
-        log_txt += txt
-        nu.writeLogAndExit(log_path, log_txt, txt)
+        log.error(txt)
+        raise FileNotFoundError(txt)
     
     if debug:
-        txt = 'VECT>     Number of images to vectorize: {}'.format(len(images))
-        log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
+        txt = '    Number of images to vectorize: {}'.format(len(images))
+        log.debug(txt)
         for img in images:
-            txt = 'VECT>     {}'.format(img)
-            log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
+            txt = '    {}'.format(img)
+            log.debug(txt)
     
-    # Creation of the dest directory if it doesn't exist
-    if not os.path.exists(dest_path):
-        os.mkdir(dest_path)
-    
-    # Creation of slices directory if necessary
+    # Creation of slices directory if necessary. The unstacking is done in 
+    # the background, concurrently with the vectorisation.
     if unstack:
         slices_path = os.path.join(dest_path, 'unstacked_slices')
         if not os.path.exists(slices_path):
             os.mkdir(slices_path)
+        unstacker = ThreadPoolExecutor(max_workers=1)
+        unstacked = []
+    
+    # The worker processes are not forked while the unstacking threads run, 
+    # as a lock held by one of them (e.g. the one of the log) would stay 
+    # locked forever in the child: they are started by a fork server instead
+    start_method = None # default one
+    if unstack and 'forkserver' in multiprocessing.get_all_start_methods():
+        start_method = 'forkserver'
    
     timer = time.time()
-    txt = 'VECT> ...done in {:.4f} s.'.format(timer-previous_step)
-    log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
+    txt = '...done in {:.4f} s.'.format(timer-previous_step)
+    log.info(txt)
     previous_step = timer
+    txt = 'Building the queue of slices to vectorize...'
+    log.info(txt)
     
-    current_img = 1           
+    # Graph movie containers to pack at the end, one per stack
+    graph_extension = '.npz' if graph_format == 'npz' else '.gpickle'
+    graph_movie = (graph_movie and graph_format in ('gpickle', 'npz') and 
+                   not preview)
+    movies = []
+    
+    # Expansion of the images into one global queue of (image, slice) tasks,
+    # the number of foreground pixels of a slice being its estimated cost. 
+    # The per-slice occupancy is read from the manifest shared with the other
+    # stages, the stack being scanned only if there is no valid manifest yet.
+    tasks = []
     for img in images:
         
-        start_vect = time.time()
-        txt = ('VECT> Vectorization of image {} ({} of {})...'
-              .format(img[1], current_img, len(images)))
-        log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-        txt = 'VECT>    Image loading and slicing...'
-        log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-        
-        im = tifffile.imread(img[0]) # loading the image as a numpy array
-        im = np.array(im, dtype=np.uint8) # dtype safeguard
+        slices_nb, shape = nu.countSlices(img[0])
         
         if debug:            
-            txt = 'VECT>      Image number of dimensions: {}'.format(im.ndim)
-            log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-            txt = 'VECT>      Image shape: {}'.format(im.shape)
-            log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-                                             
-        if invert:
-            im = np.invert(im) # inverting the image so as to have a black background
-                
-        if im.ndim == 2: # if the image is a simple tif and not a stack
-            slices = [im]        
-        else: # if the image is a tif stack or RGB/RGBA                        
-            if im.shape[-1] == 3 or im.shape[-1] == 4: # RGB/RGBA          
-                txt = ('ERROR: the stack to vectorize must be binarized or '
-                         'grayscale. RGB and RGBA are not supported.')
-                nu.writeLogAndExit(log_path, log_txt, txt)
-            else:  # stack 
-                slices = [im[i] for i in range(im.shape[0])]
+            txt = ('     Image {}: {} slice(s), shape {}'
+                   .format(img[1], slices_nb, shape))
+            log.debug(txt)
         
-        timer = time.time()
-        txt = 'VECT>    ...done in {:.4f} s.'.format(timer-previous_step)
-        log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-        previous_step = timer
+        if len(shape) > 2 and (shape[-1] == 3 or shape[-1] == 4): # RGB/RGBA          
+            txt = ('ERROR: the stack to vectorize must be binarized or '
+                   'grayscale. RGB and RGBA are not supported.')
+            log.error(txt)
+            raise ValueError(txt)
         
-        # Iterating over the slices (1 if simple tif, more if tif stack )
-        for i, sli in enumerate(slices):
+        occupancy = nu.getOccupancy(img[0], invert, dest_path)
+        
+        if crop == 'movie':
+            window = nu.cropWindow(occupancy, shape[-2:], margin)
+            if window is not None:
+                txt = ('     Image {}: cropped to rows {}-{} and columns '
+                       '{}-{} ({:.1%} of the pixels).'
+                       .format(img[1], window[0], window[1]-1, window[2], 
+                               window[3]-1, 
+                               (window[1]-window[0])*(window[3]-window[2]) / 
+                               (shape[-2]*shape[-1])))
+                log.info(txt)
+        else:
+            window = None
+        
+        movie_frames = [] # (graph file, slice name) of each slice
+        if graph_movie and slices_nb > 1:
+            movies.append((img[1], movie_frames))
+        
+        filling = len(str(slices_nb))
+        for i in range(slices_nb):
             
-            if len(slices) == 1: # if simple tif
+            if preview and i % preview_stride:
+                continue
+            
+            if slices_nb == 1: # if simple tif
                 sli_name = img[1]
+                label = 'image {}'.format(img[1])
                 
             else: # if tif stack
-                filling = len(str(len(slices)))
                 sli_name = img[1] + '_' + str(i+1).zfill(filling)
-                
-                # Saving the slice as a png file for later use
-                if unstack:
-                    slimage = Image.fromarray(sli, mode='L')
-                    slimage.save(os.path.join(slices_path, sli_name + '.png'))
-                   
+                label = 'slice {} of {} of image {}'.format(i+1, slices_nb, 
+                                                            img[1])
+            
+            graph_name = sli_name + '_graph'
+            for key, value in params.items():
+                graph_name += '_' + key + str(value)
+            movie_frames.append((os.path.join(dest_path, graph_name + 
+                                              graph_extension), sli_name))
+            
             # If there's no white pixel in the slice, saving empty graph and jumping directly to the next slice
-            if np.sum(sli) <= 0:
-                txt = ('VECT>    The slice {} of {} is empty, saving empty ' 
+            if not occupancy['foreground'][i] and not preview:
+                txt = ('   The slice {} of {} is empty, saving empty ' 
                       'graph and jumping to the next one.'.format(i+1, img[1]))
-                log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
+                log.info(txt)
                 G = nx.Graph()
                 
-                sli_name += '_graph'
-                for key, value in params.items():
-                    sli_name += '_' + key + str(value)
-                nx.write_gpickle(G, os.path.join(dest_path, sli_name + '.gpickle'))
+                if graph_format == 'npz':
+                    nu.writeGraphNpz(G, os.path.join(dest_path, 
+                                                     graph_name + '.npz'), 
+                                     npz_compressed)
+                else:
+                    nx.write_gpickle(G, os.path.join(dest_path, graph_name + '.gpickle'))
                 continue
-
-            start_sli = time.time()
-            previous_step = start_sli        
-            txt = ('VECT>    Vectorization of slice {} of {}...'
-                  .format(i+1, len(slices)))
-            log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-            txt = ('VECT>       Slice preparation...')
-            log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-            
-            if smoothing: # standard binary image noise-removal with opening followed by closing
-                sli = binary_opening(sli, disk(smoothing)) # maybe remove this processing step if depicted structures are really tiny
-                sli = binary_closing(sli, disk(smoothing))
-                
-            if debug:
-                slimage = Image.fromarray(sli, mode='L')
-                slimage.save(os.path.join(dest_path, sli_name + 
-                                          '_processed.png'))
-            
-            # Creation of the distance_map
-            distance_map = ndi.distance_transform_edt(sli)
-            height, width = distance_map.shape    
-            
-            if save_distance_map:
-                dist_map = distance_map.astype(np.uint32)
-                dist_map = Image.fromarray(dist_map, mode='I')
-                dist_map.save(os.path.join(dest_path, sli_name + '_dm.png')) # saves the distance map in case we need it later
-            
-            distance_map = distance_map.astype(np.int) # conversion to int for C_net_functions compatibility
-
-            timer = time.time()            
-            txt = ('VECT>       ...done in {:.4f} s.'
-                  .format(timer-previous_step))
-            log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-            previous_step = timer
-            txt = 'VECT>       Contour extraction and thresholding...'
-            log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-                
-            longuest_index, flattened_contours = createContours(sli, sli_name, 
-                                                                height, debug, 
-                                                                dest_path, 
-                                                                figure_format, 
-                                                                dpi, verbose)
-                
-            timer = time.time()
-            txt = ('VECT>       ...done in {:.4f} s.'
-                   .format(timer-previous_step))
-            log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-            previous_step = timer
-            txt = 'VECT>       Mesh creation...'
-            log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-                
-            mesh_points, mesh_facets, hole_points = createMesh(longuest_index,
-                                                               flattened_contours)
-
-            timer = time.time()
-            txt = ('VECT>       ...done in {:.4f} s.'
-                  .format(timer-previous_step))
-            log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-            previous_step = timer
-            txt = 'VECT>       Triangulation...'
-            log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-                
-            triangulation = createTriangulation(mesh_points, mesh_facets, 
-                                                hole_points)    
-            
-            timer = time.time()
-            txt = ('VECT>       ...done in {:.4f} s.'
-                  .format(timer-previous_step))
-            log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-            previous_step = timer
-            txt = ('VECT>       Setup of triangles and neighborhood '
-                  'relations...')
-            log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-        
-            triangles, isolated_indices = triangleClassification(triangulation,
-                                                                 debug, verbose)
-
-            timer = time.time()
-            txt = ('VECT>       ...done in {:.4f} s.'
-                  .format(timer-previous_step))
-            log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-            previous_step = timer
-            txt = 'VECT>       Pruning...'
-            log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-                
-            triangles = graphPruning(triangles, height, distance_map, verbose, 
-                                     debug, dest_path, sli_name, figure_format, 
-                                     dpi, pruning)
-
-            timer = time.time()
-            txt = ('VECT>       ...done in {:.4f} s.'
-                  .format(timer-previous_step))
-            log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-            previous_step = timer
-            txt = 'VECT>       Graph creation...'
-            log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-    
-            adjacency_matrix = nu.createTriangleAdjacencyMatrix(triangles)
-            G = nu.createGraph(adjacency_matrix, triangles)
-    
-            timer = time.time()
-            txt = ('VECT>       ...done in {:.4f} s.'
-                  .format(timer-previous_step))
-            log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-            previous_step = timer
-            txt = ('VECT>       Removal of redundant nodes, drawing and '
-                   'saving of the graph...')
-            log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-    
-            cleanAndSaveGraph(G, triangles, distance_map, sli_name, dest_path, 
-                              verbose, debug, params, plot, figure_format, dpi, 
-                              graph_format, node_size, height)
-
-            timer = time.time()
-            txt = ('VECT>       ...done in {:.4f} s.'
-                   .format(timer-previous_step))
-            log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-            txt = ('VECT>    ...slice {} of {} done in {:.4f} s.'
-                   .format(i+1, len(slices), timer-start_sli))   
-            log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)    								
             
+            if crop == 'slice':
+                window = nu.cropWindow(occupancy, shape[-2:], margin, i)
+            tasks.append((img[0], i, sli_name, label, occupancy['count'][i], 
+                          window))
+        
+        # Saving the slices as png files for later use
+        if unstack and slices_nb > 1:
+            unstacked.append(unstacker.submit(nu.unstackSlices, img[0], 
+                                              slices_path, '.png', invert, 
+                                              False))
+    
+    total_cost = sum([task[4] for task in tasks])
+    
+    timer = time.time()
+    txt = ('...{} slice(s) to vectorize, done in {:.4f} s.'
+           .format(len(tasks), timer-previous_step))
+    log.info(txt)
+    previous_step = timer
+    txt = ('Vectorization of the slices with {} worker(s)...'
+           .format(workers))
+    log.info(txt)
+    
+    # With several workers, the workers stay quiet and their log is written
+    # by the main process once the slice is done to avoid interleaved output
+    slice_main_params = list(main_params)
+    slice_main_params[3] = verbose and workers <= 1
+    options = {'pyramid':pyramid, 'pyramid_check':pyramid_check, 
+               'components':components, 
+               'min_component_size':min_component_size, 
+               'slice_timeout':slice_timeout, 'slice_memory':slice_memory,
+               'fallbacks':fallbacks, 'strategy':'', 'preview':preview,
+               'preview_scale':preview_scale, 
+               'npz_compressed':npz_compressed, 'start_method':start_method}
+    
+    done_cost = 0
+    reports = []
+    flagged = [] # slices that exceeded their budget
+    previews = {} # preview mode: summary of each slice
+    for done, (task, result) in enumerate(scheduleSlices(tasks, workers, 
+                                                         slice_main_params, 
+                                                         vect_params, 
+                                                         options)):
+        reports.append(result[2])
+        if 'fallback' in result[2]:
+            flagged.append((result[0], result[2]['fallback']))
+        if preview:
+            previews[result[0]] = (result[1], result[2])
+        
+        # Overall ETA, assuming the time spent is proportional to the cost
+        done_cost += task[4]
+        elapsed = time.time()-previous_step
+        eta = elapsed * (total_cost-done_cost) / max(done_cost, 1)
+        txt = ('{} of {} slice(s) done, ETA {:.0f} min {:.0f} s.'
+               .format(done+1, len(tasks), eta // 60, eta % 60))
+        log.info(txt)
+        nu.flushLog() # the log is written as the slices are done
+        
+    timer = time.time()
+    txt = '...done in {:.4f} s.'.format(timer-previous_step)
+    log.info(txt)
+    
+    if unstack:
+        previous_step = time.time()
+        txt = 'Waiting for the unstacking of the slices...'
+        log.info(txt)
+        slices_nb = sum([future.result() for future in unstacked])
+        unstacker.shutdown()
         timer = time.time()
-        txt = ('VECT> ...image {} done in {:.4f} s.'
-               .format(img[1], timer-start_vect))
-        log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-            
-        current_img += 1   
+        txt = ('...{} slice(s) saved in {}, done in {:.4f} s.'
+               .format(slices_nb, slices_path, timer-previous_step))
+        log.info(txt)
+    
+    # Packing of the graphs of each stack into one graph movie container
+    for img_name, movie_frames in movies:
+        previous_step = time.time()
+        txt = 'Packing the graphs of {}...'.format(img_name)
+        log.info(txt)
+        
+        movie_path = os.path.join(dest_path, img_name + '_graphs.gmov')
+        missing = nu.packGraphMovie(movie_frames, movie_path, 
+                                    graph_movie_keyframes)
+        
+        timer = time.time()
+        txt = ('...{} frame(s) saved in {} ({} empty frame(s) for '
+               'missing graphs), done in {:.4f} s.'
+               .format(len(movie_frames), movie_path, missing, 
+                       timer-previous_step))
+        log.info(txt)
+    
+    # Preview outputs: summary of the sampled slices and contact sheet
+    if preview:
+        previous_step = time.time()
+        txt = 'Writing the preview summary and contact sheet...'
+        log.info(txt)
+        
+        names = [task[2] for task in tasks] # in the order of the stacks
+        summary_path = os.path.join(dest_path, 'preview_summary.csv')
+        with open(summary_path, 'w') as summary:
+            summary.write('slice,nodes,edges,length,time\n')
+            for sli_name in names:
+                elapsed, report = previews[sli_name]
+                summary.write('{},{},{},{:.1f},{:.3f}\n'
+                              .format(sli_name, report['nodes'], 
+                                      report['edges'], report['length'], 
+                                      elapsed))
+        sheet_path = os.path.join(dest_path, 'preview_contact_sheet.png')
+        nu.drawContactSheet([previews[n][1]['thumbnail'] for n in names], 
+                            names, sheet_path)
+        
+        timer = time.time()
+        txt = ('...{} and {} saved in {:.4f} s.'
+               .format(summary_path, sheet_path, timer-previous_step))
+        log.info(txt)
+    
+    # Summary of the coarse-to-fine vectorisation
+    pyramid_reports = [r for r in reports if 'pyramid_scale' in r]
+    if pyramid_reports:
+        txt = ('{} of {} slice(s) vectorized coarse-to-fine, scales '
+               'from 1/{} to 1/{}.'
+               .format(len(pyramid_reports), len(reports),
+                       min([r['pyramid_scale'] for r in pyramid_reports]),
+                       max([r['pyramid_scale'] for r in pyramid_reports])))
+        log.info(txt)
+    checked_reports = [r for r in reports if 'pyramid_speedup' in r]
+    if checked_reports:
+        txt = ('Pyramid check: mean speedup x{:.2f}, mean fraction of '
+               'matched junctions {:.1%}.'
+               .format(np.mean([r['pyramid_speedup'] 
+                                for r in checked_reports]),
+                       np.mean([r['junctions_matched'] 
+                                for r in checked_reports])))
+        log.info(txt)
+    
+    # Summary of the slices that exceeded their budget
+    if flagged:
+        txt = ('{} slice(s) exceeded their budget (strategy used):'
+               .format(len(flagged)))
+        log.info(txt)
+        for sli_name, strategy in sorted(flagged):
+            txt = '   {}: {}'.format(sli_name, strategy)
+            log.info(txt)
 
     end = time.time()-start
-    txt = ('VECT> DONE in {:.0f} min {:.4f} s.'.format(end // 60,
+    txt = ('DONE in {:.0f} min {:.4f} s.'.format(end // 60,
           end % 60))    
-    log_txt = nu.printAndUpdateLog(txt, log_txt, verbose)
-    
-    # Writing the log    
-    with open(log_path, 'a+') as log:
-        log.write(log_txt)
+    log.info(txt)
+    nu.stopLog()
 
 
 if __name__ == '__main__':
    
-    main_params, vect_params = init()    
-    vectorize(main_params, vect_params)   
+    main_params, vect_params, perf_params = init()    
+    vectorize(main_params, vect_params, **perf_params)   
@@ -48,22 +48,31 @@
 
 
 # Standard imports
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import wait, FIRST_COMPLETED
+import contextlib
+import hashlib
+import importlib
+import itertools
+import json
+import logging
+import logging.handlers
 import math
 import operator
 import os
+import pickle
+import re
+import shutil
+import struct
+import subprocess
 import sys
+import tempfile
 import time
 
 # Dependencies
-import cv2
-import matplotlib.pyplot as plt
 import networkx as nx
 import numpy as np
-import pandas as pd
 from PIL import Image
-import scipy
-import tifffile
-from tqdm import tqdm, trange
 
 # Custom classes and functions from the cythonized helper library
 from C_net_functions import CbuildTriangles, CbruteforcePruning
@@ -71,7 +80,73 @@ from C_net_functions import CcreateTriangleAdjacencyMatrix, Cpoint
 
 # Global switches
 edgesize = 0.5
-plt.ioff() # turn off matplotlib interactive mode, we save everything we plot anyway
+triangle_type_names = ['junction', 'normal', 'end', 'isolated'] # type codes used in triangle arrays
+lazy_modules = set() # names of the modules deferred by LazyImport
+
+
+class LazyImport:
+    """
+    Stand-in for a heavy dependency, that is only imported at its first use.
+    Importing cv2, matplotlib, pandas, scipy... takes about a second, which
+    every worker process and every short run would pay even when it doesn't
+    need them (e.g. matplotlib is only needed with 'plot' or 'debug' on).
+
+    The stand-in forwards the attribute accesses and the calls to the module,
+    or to one of its attributes if 'attribute' is given:
+        plt = LazyImport('matplotlib.pyplot')
+        tqdm = LazyImport('tqdm', 'tqdm') # as from tqdm import tqdm
+    """
+
+    def __init__(self, module, attribute='', setup=None):
+        """
+        :param str module: the full name of the module to import
+        :param str attribute: the name of the object of the module to stand
+            in for, the module itself if empty
+        :param setup: a function called once on the imported object
+        :type setup: function(object)
+        """
+
+        self._module = module
+        self._attribute = attribute
+        self._setup = setup
+        self._target = None
+        lazy_modules.add(module)
+
+    def load(self):
+        """
+        Imports the module if it isn't yet, and returns the object stood in
+        for.
+        """
+
+        if self._target is None:
+            target = importlib.import_module(self._module)
+            if self._attribute:
+                target = getattr(target, self._attribute)
+            if self._setup is not None:
+                self._setup(target)
+            self._target = target
+        return self._target
+
+    def __getattr__(self, name):
+        if name in ('_module', '_attribute', '_setup', '_target'):
+            raise AttributeError(name) # not set yet, e.g. while copying
+        return getattr(self.load(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+
+# Heavy dependencies, imported at their first use (cf LazyImport)
+cv2 = LazyImport('cv2')
+PolyCollection = LazyImport('matplotlib.collections', 'PolyCollection')
+# turn off matplotlib interactive mode, we save everything we plot anyway
+plt = LazyImport('matplotlib.pyplot', setup=lambda plt: plt.ioff())
+pd = LazyImport('pandas')
+sparse = LazyImport('scipy.sparse')
+connected_components = LazyImport('scipy.sparse.csgraph',
+                                  'connected_components')
+tifffile = LazyImport('tifffile')
+tqdm = LazyImport('tqdm', 'tqdm')
 
 
 ########################
@@ -297,6 +372,27 @@ def bruteforcePruning(triangles, order, verbose):
     
     return CbruteforcePruning(np.asarray(triangles), order, verbose)
 
+def trianglesToArrays(triangles):
+    """
+    Extracts the vertices and types of a list of triangles into arrays, which 
+    are cheap to save and do not depend on the cythonized helper library.
+
+    :param triangles: the triangles to convert
+    :type triangles: list(CshapeTriangle)
+
+    :return: the vertices, of shape (triangles number, 3, 2), and the type 
+        code of each triangle (index in 'triangle_type_names')
+    :rtype: (ndarray, ndarray)
+    """
+
+    points = np.zeros((len(triangles), 3, 2))
+    types = np.zeros(len(triangles), dtype=np.int8)
+    for i, t in enumerate(triangles):
+        for j, p in enumerate((t.get_p1(), t.get_p2(), t.get_p3())):
+            points[i, j] = (p.get_x(), p.get_y())
+        types[i] = triangle_type_names.index(t.get_type())
+    return points, types
+
 def createGraph(adjacency_matrix, all_triangles):
     """
     Creates a graph from the adjacency matrix and the radii and euclidean
@@ -367,7 +463,7 @@ def removeRedundantNodes(G, verbose, mode):
     :rtype: nx.Graph
     """
     
-    if (type(G) == scipy.sparse.lil.lil_matrix):
+    if (type(G) == sparse.lil.lil_matrix):
         G = nx.Graph(G)
     order = G.order()
     new_order = 0
@@ -422,14 +518,16 @@ def removeRedundantNodes(G, verbose, mode):
             break
     return G
 
-def drawGraphTriangulation(G, triangles, image_name, dest, distance_map,
-                           figure_format, dpi):
+def drawGraphTriangulation(G, triangle_points, triangle_types, image_name, 
+                           dest, distance_map, figure_format, dpi):
     """
     Draws and saves a graph and its associated triangles.
     
     :param nx.Graph G: graph to draw
-    :param triangle:
-    :type triangles:
+    :param ndarray triangle_points: the vertices of the triangles, of shape 
+        (triangles number, 3, 2), cf trianglesToArrays()
+    :param ndarray triangle_types: the type code of each triangle, cf 
+        trianglesToArrays()
     :param str img_name: the name of the image currently being worked on
     :param str dest_path: the output directory
     :param ndarray distance_map: the distance map of the image
@@ -447,23 +545,23 @@ def drawGraphTriangulation(G, triangles, image_name, dest, distance_map,
     colors = {'junction':['orange', 3], 'normal':['purple', 1], 
               'end':['red', 2]}
 
-    # Normal triangles
-    for i, t in enumerate(triangles):
-            x = [t.get_p1().get_x(), t.get_p2().get_x(), t.get_p3().get_x(),
-                 t.get_p1().get_x()]  
-            y = [t.get_p1().get_y(), t.get_p2().get_y(), 
-                 t.get_p3().get_y(), t.get_p1().get_y()]
-            c = colors[t.get_type()][0]
-            zorder = colors[t.get_type()][1]
-            ax.plot(x, y, 'o', color='black', linewidth=3, zorder=zorder,
-                    markersize=0.3, mew=0, alpha=1.0)
-            ax.fill(x, y, facecolor=c, alpha=0.25,
-                    edgecolor=c, linewidth=0.05)
+    # Triangles, drawn as one collection per type
+    for code, typ in enumerate(triangle_type_names):
+        if typ not in colors:
+            continue
+        points = triangle_points[triangle_types == code]
+        c = colors[typ][0]
+        zorder = colors[typ][1]
+        ax.plot(points[:, :, 0].ravel(), points[:, :, 1].ravel(), 'o', 
+                color='black', linewidth=3, zorder=zorder, markersize=0.3, 
+                mew=0, alpha=1.0)
+        ax.add_collection(PolyCollection(points, facecolor=c, alpha=0.25,
+                                         edgecolor=c, linewidth=0.05))
             
     scale = 1
     pos = {}
-    for k in G.node.keys():
-        pos[k] = (G.node[k]['x']*scale, G.node[k]['y']*scale)
+    for k in G.nodes():
+        pos[k] = (G.nodes[k]['x']*scale, G.nodes[k]['y']*scale)
 
     widths = np.array([G[e[0]][e[1]]['conductivity'] for e in G.edges()])*scale
     widths = 15./(np.amax(widths)*13)*widths
@@ -483,6 +581,7 @@ def drawGraphTriangulation(G, triangles, image_name, dest, distance_map,
             plt.plot(x, y, '+', color=c, markersize=0.3, mec=c)
     plt.savefig(os.path.join(dest, image_name + '_graph_and_triangulation.') + 
                 figure_format, bbox_inches='tight', dpi=dpi)
+    plt.close()
 
 def _drawGraph(G, verbose, n_size, height):
     """
@@ -526,11 +625,52 @@ def _drawGraph(G, verbose, n_size, height):
     if verbose:
         print("\t from _drawGraph: drawing took %1.2f sec"%(time.clock()-start))
 
+def largestComponents(G, components=1, min_size=0):
+    """
+    Keeps only the largest connected components of a graph. The components 
+    are labelled on the array of edges with scipy, so that only the subgraph 
+    of the kept nodes is built.
+    
+    :param nx.Graph G: the graph to filter
+    :param int components: the number of components to keep, starting with 
+        the largest one. 0 to keep all of them.
+    :param int min_size: the minimum number of nodes of a kept component
+    
+    :return: the subgraph of the kept components (a copy)
+    :rtype: nx.Graph
+    """
+    
+    nodes = list(G.nodes())
+    nodes_nb = len(nodes)
+    if nodes_nb == 0:
+        return G.copy()
+    
+    # Labelling the components from the edges, as node indices
+    index = {node:i for i, node in enumerate(nodes)}
+    edges = np.fromiter((index[node] for edge in G.edges() for node in edge), 
+                        dtype=np.int64, count=2*G.number_of_edges())
+    adjacency = sparse.coo_matrix((np.ones(len(edges) // 2, dtype=bool), 
+                                         (edges[0::2], edges[1::2])), 
+                                        shape=(nodes_nb, nodes_nb))
+    labels_nb, labels = connected_components(adjacency, directed=False)
+    
+    # Selecting the components by decreasing size
+    sizes = np.bincount(labels, minlength=labels_nb)
+    kept = np.argsort(-sizes, kind='stable')
+    if components > 0:
+        kept = kept[:components]
+    kept = kept[sizes[kept] >= min_size]
+    
+    keep = np.isin(labels, kept)
+    return G.subgraph([nodes[i] for i in np.flatnonzero(keep)]).copy()
+
 def drawAndSave(G, image_name, dest, parameters, verbose, plot, figure_format,
-                dpi, graph_format, n_size, height):
+                dpi, graph_format, n_size, height, components=1, 
+                min_component_size=0, compressed=True):
     """
     Draws a graph calling the helper function _drawGraph and saves it at
-    destination "dest" with the name "image_name" + "_graph"
+    destination "dest" with the name "image_name" + "_graph". Only the 
+    largest connected component(s) of the graph are drawn and saved.
 
     :param nx.Graph G: graph to be drawn
     :param str image_name: name of the input image,used for saving the plot
@@ -545,12 +685,17 @@ def drawAndSave(G, image_name, dest, parameters, verbose, plot, figure_format,
     :param str graph_format: the wanted format for the graph image output 
     :param int n_size: the size of the nodes in the graph image
     :param int height: the image height
+    :param int components: the number of connected components to keep, 
+        starting with the largest one. 0 to keep all of them.
+    :param int min_component_size: the minimum number of nodes of a kept 
+        component
+    :param bool compressed: True to compress the graph file in the npz 
+        format, cf writeGraphNpz()
     """
     
     start = time.clock()
        
-    Gcc = sorted(nx.connected_component_subgraphs(G), key=len, reverse=True)
-    G = Gcc[0]
+    G = largestComponents(G, components, min_component_size)
         
     graph_name = image_name + '_graph'
     for key, value in zip(parameters.keys(), parameters.values()):
@@ -568,6 +713,9 @@ def drawAndSave(G, image_name, dest, parameters, verbose, plot, figure_format,
         nx.write_gpickle(G, os.path.join(dest, graph_name + '.gpickle'), 
                          protocol=2)
         
+    elif graph_format == 'npz':
+        writeGraphNpz(G, os.path.join(dest, graph_name + '.npz'), compressed)
+        
     else: # these formats have not been tested in Python 3
         save_function_dict = {'adjlist':[nx.write_adjlist,'.adjlist'],
               'gml': [nx.write_gml,'.gml'],
@@ -615,19 +763,20 @@ def _convertNumbers(G):
         e[2]['conductivity'] = float(e[2]['conductivity'])
     return G
 
-def drawTriangulation(triangles, image_name, dest, distance_map, 
+def drawTriangulation(triangle_points, triangle_types, image_name, dest, 
                       figure_format, dpi):
     """
     Draws and saves an illustration of the triangulation. Triangles are
     already classified in end-triangles (red), normal-triangles (purple)
     and junction-triangles (orange).
 
-    :param triangle_classes: list of lists of end-, normal and junction 
-        triangles
+    :param ndarray triangle_points: the vertices of the triangles, of shape 
+        (triangles number, 3, 2), cf trianglesToArrays()
+    :param ndarray triangle_types: the type code of each triangle, cf 
+        trianglesToArrays()
     :param str image_name: image name, used for saving the plot
     :param str dest: path of the ouput directory where the drawing will be 
         saved
-    :param ndarray distance_map: the distance map of the image
     :param str figure_format: the wanted format for the graph and triangulation 
         figure output
     :param int dpi: the wanted resolution for the figure and the graph image
@@ -640,23 +789,23 @@ def drawTriangulation(triangles, image_name, dest, distance_map,
     colors = {"junction":["orange", 3], "normal":["purple", 1], 
               "end":["red", 2]}
 
-    # Normal triangles
-    for i, t in enumerate(triangles):
-            x = [t.get_p1().get_x(), t.get_p2().get_x(),
-                 t.get_p3().get_x(), t.get_p1().get_x()]
-            y = [t.get_p1().get_y(), t.get_p2().get_y(), 
-                 t.get_p3().get_y(), t.get_p1().get_y()]
-
-            c = colors[t.get_type()][0]
-            zorder = colors[t.get_type()][1]
-            ax.plot(x, y, 'o', color=c, linewidth=3, zorder=zorder,
-                     markersize=0.1, mew=0, alpha=1.0)
-            ax.fill(x, y, facecolor=c, alpha=0.45,
-                    edgecolor=c, linewidth=0.05)
-    
+    # Triangles, drawn as one collection per type
+    for code, typ in enumerate(triangle_type_names):
+        if typ not in colors:
+            continue
+        points = triangle_points[triangle_types == code]
+        c = colors[typ][0]
+        zorder = colors[typ][1]
+        ax.plot(points[:, :, 0].ravel(), points[:, :, 1].ravel(), 'o', 
+                color=c, linewidth=3, zorder=zorder, markersize=0.1, mew=0, 
+                alpha=1.0)
+        ax.add_collection(PolyCollection(points, facecolor=c, alpha=0.45,
+                                         edgecolor=c, linewidth=0.05))
+    
+    ax.autoscale_view()
     plt.gca().invert_yaxis() # because nx/plt origin = bottom left and image = top left
-    plt.savefig(os.path.join(dest,image_name + "_triangulation" + '.pdf'), 
-                dpi=dpi)
+    plt.savefig(os.path.join(dest, image_name + "_triangulation." + 
+                             figure_format), dpi=dpi)
     plt.close()
 
 def drawContours(height, contour_list, image_name, dest, figure_format, dpi):
@@ -664,8 +813,8 @@ def drawContours(height, contour_list, image_name, dest, figure_format, dpi):
     Draws and saves the list of contours it is provided with.
 
     :param int height: the image height
-    :param contour_list:
-    :type contour_list: list([int, int])
+    :param contour_list: the contours, as lists of points or (n, 2) arrays
+    :type contour_list: list([int, int]) or list(ndarray)
     :param str image_name: image name, used for saving the plot
     :param str dest: path of the ouput directory where the drawing will be 
         saved
@@ -674,9 +823,6 @@ def drawContours(height, contour_list, image_name, dest, figure_format, dpi):
     :param int dpi: the wanted resolution for the figure and the graph image
     """
     
-    from copy import deepcopy
-    contour_list = deepcopy(contour_list)
-    
     plt.clf()
     plt.title('Contours: ' + image_name)
     ax = plt.gca()
@@ -685,8 +831,8 @@ def drawContours(height, contour_list, image_name, dest, figure_format, dpi):
 
     # Contours represented as circles for every point in the contour, connected by lines
     for c,i in zip(contour_list, range(len(contour_list))):
-        c.append((c[0][0], c[0][1]))
         c = np.asarray(c)
+        c = np.vstack([c, c[:1]]) # closing the contour
         plt.plot(c[0:, 0], height-c[0:, 1], color='black', marker='o', 
                  markersize=2, mfc='FireBrick', mew = 0.1, alpha=0.7, 
                  linewidth=1)
@@ -700,49 +846,358 @@ def drawContours(height, contour_list, image_name, dest, figure_format, dpi):
     plt.savefig(os.path.join(dest, image_name + '_contours' + '.' 
                              + figure_format), dpi=dpi)
     plt.close()
+
+def drawContactSheet(tiles, labels, dest, columns=6, tile_width=256):
+    """
+    Assembles small images into a single contact sheet (a grid of labelled 
+    thumbnails) and saves it.
+
+    :param tiles: the images to assemble (BGR or grayscale)
+    :type tiles: list(ndarray)
+    :param labels: the label written on each tile
+    :type labels: list(str)
+    :param str dest: the absolute path of the image to save
+    :param int columns: the number of tiles per row
+    :param int tile_width: the width of a tile, in pixel
+    """
+
+    thumbnails = []
+    for tile in tiles:
+        if tile.ndim == 2:
+            tile = cv2.cvtColor(tile, cv2.COLOR_GRAY2BGR)
+        tile_height = max(1, tile.shape[0] * tile_width // tile.shape[1])
+        thumbnails.append(cv2.resize(tile, (tile_width, tile_height), 
+                                     interpolation=cv2.INTER_AREA))
+
+    tile_height = max([t.shape[0] for t in thumbnails] + [1])
+    rows = max(1, -(-len(thumbnails) // columns))
+    sheet = np.full((rows*tile_height, columns*tile_width, 3), 255, np.uint8)
+    for i, (thumbnail, label) in enumerate(zip(thumbnails, labels)):
+        y = (i // columns) * tile_height
+        x = (i % columns) * tile_width
+        sheet[y:y+thumbnail.shape[0], x:x+tile_width] = thumbnail
+        cv2.putText(sheet, label, (x+4, y+16), cv2.FONT_HERSHEY_SIMPLEX, 0.45,
+                    (0, 255, 255), 1, cv2.LINE_AA)
+    cv2.imwrite(dest, sheet)
     
     
 ######################
 # PART 2 : utilities #
 ######################
     
-def printAndUpdateLog(txt, log_txt, verbose):
+# Logging: the stages (VECT, SUP, TRACK, DEBUG...) log through the children of
+# the 'net' logger, configured once per run by startLog()
+log_root = 'net'
+log_buffer = 64 # number of records buffered before writing to the files
+quiet_log = {'quiet': True} # extra of the records written to the files only
+
+class StageFormatter(logging.Formatter):
+    """
+    Formats the log records as '[STAGE]> message', the stage being the last 
+    part of the name of the logger ('net.VECT' -> 'VECT').
     """
-    Updates the log string 'log_txt' with the string 'txt'. If verbosity 
-    behaviour is on, also prints 'txt' to the console.
     
-    :param str txt: the string to add to 'log_txt'
-    :param str log_txt: the log string to update
-    :param bool verbose: verbosity switch to print information
-        
-    :return: the updated log string
-    :rtype: str
+    def format(self, record):
+        return '{}> {}'.format(record.name.rsplit('.', 1)[-1], 
+                               record.getMessage())
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    Formats the log records as one JSON object per line, with the keys 
+    'time' (UNIX time), 'level', 'stage', 'process', 'thread' and 'message'.
+    """
+    
+    def format(self, record):
+        return json.dumps({'time':record.created, 'level':record.levelname, 
+                           'stage':record.name.rsplit('.', 1)[-1], 
+                           'process':record.process, 
+                           'thread':record.threadName, 
+                           'message':record.getMessage()})
+
+class _LogCapture(logging.Handler):
+    """
+    Handler keeping the log records of a worker process as dictionaries, to 
+    be sent back to the main process (cf capturedLog()).
+    """
+    
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+    
+    def emit(self, record):
+        data = dict(record.__dict__)
+        data.update(msg=record.getMessage(), args=None, exc_info=None, 
+                    exc_text=None)
+        self.records.append(data)
+
+def getLog(stage):
+    """
+    Returns the logger of a processing stage.
+    
+    :param str stage: the prefix of the stage in the log: 'VECT', 'SUP', 
+        'TRACK', 'DEBUG'...
+    
+    :return: the logger
+    :rtype: logging.Logger
+    """
+    
+    return logging.getLogger(log_root + '.' + stage)
+
+def startLog(log_path, verbose=True, json_path='', debug=False):
     """
+    Configures the log of a run: the records of all the stages are written 
+    to 'log_path' (and as JSON lines to 'json_path'), and printed to the 
+    console if 'verbose'. The files are written incrementally, in batches of 
+    'log_buffer' records, and at once for the errors, so that a crash loses 
+    at most a few lines. The previous configuration, if any, is closed. 
+    The log is thread-safe; the worker processes must capture their records 
+    and send them back instead (cf capturedLog()).
+    
+    :param str log_path: the absolute path of the log file, opened in append 
+        mode
+    :param bool verbose: verbosity switch to print the log to the console
+    :param str json_path: the absolute path of an optional JSON-lines log file
+    :param bool debug: True to also log the debugging records
+    """
+    
+    stopLog()
+    logger = logging.getLogger(log_root)
+    logger.setLevel(logging.DEBUG if debug else logging.INFO)
+    logger.propagate = False
+    
+    sinks = [(log_path, StageFormatter())]
+    if json_path:
+        sinks.append((json_path, JsonLinesFormatter()))
+    for path, formatter in sinks:
+        target = logging.FileHandler(path, mode='a', encoding='utf-8', 
+                                     delay=True)
+        target.setFormatter(formatter)
+        logger.addHandler(logging.handlers.MemoryHandler(
+                log_buffer, flushLevel=logging.ERROR, target=target))
     
-    log_txt += txt + '\n'
     if verbose:
-        print(txt)   
-    return log_txt  
+        console = logging.StreamHandler(sys.stdout)
+        console.setFormatter(StageFormatter())
+        console.addFilter(lambda record: not getattr(record, 'quiet', False))
+        logger.addHandler(console)
+
+def flushLog():
+    """
+    Writes the buffered log records to the log files.
+    """
+    
+    for handler in logging.getLogger(log_root).handlers:
+        handler.flush()
+
+def stopLog():
+    """
+    Writes the buffered log records and closes the log files.
+    """
+    
+    logger = logging.getLogger(log_root)
+    for handler in list(logger.handlers):
+        target = getattr(handler, 'target', None) # file of a MemoryHandler
+        handler.close()
+        if target is not None:
+            target.close()
+        logger.removeHandler(handler)
+
+@contextlib.contextmanager
+def capturedLog():
+    """
+    Context manager capturing the log records of the current process instead 
+    of writing them, for the worker processes: the records are returned to 
+    the main process with the results, and written there by replayLog(). 
+    This avoids both interleaved lines and several processes writing to the 
+    same files.
+    
+    :return: the list of the captured records, filled on exit
+    :rtype: list(dict)
+    """
+    
+    logger = logging.getLogger(log_root)
+    handlers, level = logger.handlers, logger.level
+    capture = _LogCapture()
+    logger.handlers = [capture]
+    logger.setLevel(logging.DEBUG) # filtered by replayLog()
+    try:
+        yield capture.records
+    finally:
+        logger.handlers = handlers
+        logger.setLevel(level)
 
-def writeLogAndExit(log_path, log_txt, txt):
+def replayLog(records):
     """
-    Updates the log string 'log_txt' with the string 'txt' and writes the log
-    string into the log file of path 'log_path'.
+    Logs the records captured in a worker process (cf capturedLog()).
     
-    :param str log_path: the absolute path of the log file
-    :param str log_txt: the log string to update
-    :param str txt: the string to add to 'log_txt'
+    :param records: the captured records
+    :type records: list(dict)
     """
-    log_txt += txt
-    with open(log_path, 'a+') as log:
-        log.write(log_txt)
-    sys.exit(txt)  
     
+    for data in records:
+        logger = logging.getLogger(data['name'])
+        if logger.isEnabledFor(data['levelno']):
+            logger.handle(logging.makeLogRecord(data))
+
+def loggedCall(function, *args):
+    """
+    Calls function(*args) with its log captured, for a worker process.
+    
+    :param function function: the function to call
+    
+    :return: the result of the function and the captured log records
+    :rtype: (any, list(dict))
+    """
+    
+    with capturedLog() as records:
+        result = function(*args)
+    return result, records
+    
+def countSlices(img_path):
+    """
+    Counts the slices of a (multi-page) tif file without loading its data.
+
+    :param str img_path: the absolute path of the tif file
+
+    :return: the number of slices and the shape of the whole image, as it 
+        would be returned by tifffile.imread()
+    :rtype: (int, tuple)
+    """
+
+    with tifffile.TiffFile(img_path) as tif:
+        shape = tif.series[0].shape
+    if len(shape) == 2: # simple tif
+        return 1, shape
+    return shape[0], shape
+
+def _readSeriesSlice(series, index):
+    """
+    Reads the slice 'index' of a tifffile series. Only the matching page is
+    read when the slices are stored one per page, which is the usual case.
+
+    :param tifffile.TiffPageSeries series: the series to read from
+    :param int index: the index of the slice to read
+
+    :return: the slice
+    :rtype: ndarray
+    """
+
+    if len(series.shape) == 2: # simple tif
+        return series.asarray()
+    if len(series.pages) == series.shape[0]: # one page per slice
+        return series.pages[index].asarray()
+    return series.asarray()[index] # slices not stored page by page
+
+def readSlice(img_path, index, invert):
+    """
+    Loads a single slice of a (multi-page) tif file as a uint8 array.
+
+    :param str img_path: the absolute path of the tif file
+    :param int index: the index of the slice to load
+    :param bool invert: True to invert the slice, False otherwise
+
+    :return: the slice
+    :rtype: ndarray
+    """
+
+    with tifffile.TiffFile(img_path) as tif:
+        sli = _readSeriesSlice(tif.series[0], index)
+    sli = np.array(sli, dtype=np.uint8) # dtype safeguard
+    if invert:
+        sli = np.invert(sli)
+    return sli
+
+def iterSlices(img_path, invert, indices=None):
+    """
+    Iterates over the slices of a (multi-page) tif file, loading them one at 
+    a time so that the whole stack never has to be held in memory.
+
+    :param str img_path: the absolute path of the tif file
+    :param bool invert: True to invert the slices, False otherwise
+    :param indices: the indices of the slices to load, in this order 
+        (backward indexing supported), all the slices if None
+    :type indices: list(int)
+
+    :return: a generator of uint8 slices
+    :rtype: generator(ndarray)
+    """
+
+    slices_nb = countSlices(img_path)[0]
+    if indices is None:
+        indices = range(slices_nb)
+    with tifffile.TiffFile(img_path) as tif:
+        series = tif.series[0]
+        for i in indices:
+            sli = _readSeriesSlice(series, int(i) % slices_nb)
+            sli = np.asarray(sli, dtype=np.uint8) # dtype safeguard, no copy if already uint8
+            if invert:
+                sli = np.invert(sli)
+            yield sli
+
+def _saveSlice(sli, path, save_kwargs):
+    """
+    Saves a slice as an individual 8-bit image.
+
+    :param ndarray sli: the slice to save
+    :param str path: the absolute path of the image to write
+    :param save_kwargs: format specific options for PIL's Image.save()
+    :type save_kwargs: dict
+    """
+
+    Image.fromarray(sli, mode='L').save(path, **save_kwargs)
+
+def unstackSlices(img_path, dest_path, ext, invert, verbose, workers=4):
+    """
+    Unstacks a multi-page tif file and saves each slice as an individual 
+    image named [stackname]_[slicenumber][ext], the slice number being left 
+    padded with 0. The pages are read lazily and each slice is written 
+    exactly once by a pool of threads. The number of slices waiting to be 
+    written is bounded, so the memory used stays low whatever the stack size.
+    PNG files are written with a fast compression level.
+
+    :param str img_path: the absolute path of the file to unstack
+    :param str dest_path: the absolute path of the directory in which to save 
+        the slices
+    :param str ext: the wanted format for the unstacked images (like '.png')
+    :param bool invert: True to invert the stack before processing, False 
+        otherwise
+    :param bool verbose: True to display a progress bar, False otherwise
+    :param int workers: the number of writing threads
+
+    :return: the number of slices written
+    :rtype: int
+    """
+
+    img_name = os.path.splitext(os.path.basename(img_path))[0]
+    slices_nb = countSlices(img_path)[0]
+    filling = len(str(slices_nb))
+    save_kwargs = {'compress_level':1} if ext.lower() == '.png' else {}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for i, sli in enumerate(tqdm(iterSlices(img_path, invert), 
+                                     total=slices_nb, unit='img', 
+                                     desc='    Unstacking images', 
+                                     disable=not verbose, dynamic_ncols=True)):
+            sli_name = img_name + '_' + str(i+1).zfill(filling)
+            pending.add(executor.submit(_saveSlice, sli, 
+                                        os.path.join(dest_path, sli_name + ext),
+                                        save_kwargs))
+            if len(pending) >= 2*workers: # bounding the slices in memory
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result() # raising writing errors, if any
+        for future in pending:
+            future.result()
+
+    return slices_nb
+
 def unstackTif(img_path, ext, invert, verbose):
     """
     Unstacks a multi-page tif file and saves each page as an individual image 
-    in the specified format. Confirmed supported formats: '.tif', '.tiff', 
-    '.png', '.jpg', '.jpeg', '.bmp', '.pbm'.
+    in the specified format, in the directory [stackname]_unstacked next to 
+    the stack. Confirmed supported formats: '.tif', '.tiff', '.png', '.jpg', 
+    '.jpeg', '.bmp', '.pbm'.
     
     :param str img_path: the absolute path of the file to unstack
     :param str ext: the wanted format for the unstacked images (like '.tif')
@@ -752,25 +1207,1422 @@ def unstackTif(img_path, ext, invert, verbose):
     
     img_name = os.path.splitext(os.path.basename(img_path))[0]
     dest_path = os.path.join(os.path.dirname(img_path), img_name + '_unstacked')
-    img_name = os.path.splitext(os.path.basename(img_path))[0]
     
     if not os.path.exists(dest_path):
         os.mkdir(dest_path)
     
-    img = tifffile.imread(img_path) # loading the image as a numpy array
-    img = np.array(img, dtype=np.uint8) # safeguard
-    if invert:
-        img = np.invert(img)                                                   
-    slices = [img[i] for i in range(img.shape[0])]
-    
-    for i in trange(len(slices), desc='    Unstacking images', disable=verbose, 
-                         unit='img', dynamic_ncols=True):
-        for i, sli in enumerate(slices):            
-            filling = len(str(len(slices)))
-            sli_name = img_name + '_' + str(i+1).zfill(filling)
-            slimage = Image.fromarray(sli, mode='L')
-            slimage.save(os.path.join(dest_path, sli_name + ext))
-    
+    unstackSlices(img_path, dest_path, ext, invert, verbose)
+
+class StackWriter:
+    """
+    Multi-page tif file written frame by frame, as soon as each frame is 
+    ready, so that the stack never has to be held in memory and the file 
+    grows while it is produced. The file is a BigTIFF when its uncompressed 
+    size could exceed the 4 GB limit of the classic tif format.
+
+    With 'concurrent', the frames are compressed and written by a background 
+    thread (zlib releases the GIL) while the next ones are being prepared, 
+    at most 'queue' frames waiting to be written. The frames are written in 
+    the order they are given either way.
+    """
+
+    bigtiff_limit = 2**32 - 2**25 # 32 bits offsets, minus a margin for the tags
+
+    def __init__(self, path, frame_shape, frames_nb, compress=0, 
+                 concurrent=False, queue=2):
+        """
+        :param str path: the absolute path of the tif file to write
+        :param frame_shape: the shape of a frame, e.g. (height, width, 3)
+        :type frame_shape: tuple(int)
+        :param int frames_nb: the expected number of frames, to choose 
+            between the classic and the BigTIFF formats
+        :param int compress: the zlib compression level, 0-9
+        :param bool concurrent: True to compress and write the frames in a 
+            background thread, False to write them when they are given
+        :param int queue: the maximum number of frames waiting to be 
+            written in concurrent mode
+        """
+
+        self.path = path
+        self.compress = compress
+        self.bigtiff = (frames_nb * int(np.prod(frame_shape)) > 
+                        self.bigtiff_limit)
+        self.frames_written = 0
+        self._tif = tifffile.TiffWriter(path, bigtiff=self.bigtiff)
+        self._queue = queue
+        self._pending = set()
+        self._executor = (ThreadPoolExecutor(max_workers=1) if concurrent 
+                          else None)
+
+    def _save(self, frame):
+        self._tif.save(frame, compress=self.compress)
+        self.frames_written += 1
+
+    def write(self, frame):
+        """
+        Writes a frame, or queues it in concurrent mode. The frame must not 
+        be modified afterwards.
+
+        :param ndarray frame: the frame to write
+        """
+
+        if self._executor is None:
+            self._save(frame)
+            return
+        self._pending.add(self._executor.submit(self._save, frame))
+        if len(self._pending) >= self._queue: # bounding the frames in memory
+            done, self._pending = wait(self._pending, 
+                                       return_when=FIRST_COMPLETED)
+            for future in done:
+                future.result() # raising writing errors, if any
+
+    def close(self):
+        """
+        Writes the queued frames and closes the file.
+        """
+
+        try:
+            if self._executor is not None:
+                for future in self._pending:
+                    future.result()
+                self._executor.shutdown()
+        finally:
+            self._tif.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# ffmpeg encoders of the video codecs and extensions of their files, cf 
+# VideoWriter
+video_codecs = {'h264':('libx264', '.mp4'), 'h265':('libx265', '.mp4'), 
+                'vp9':('libvpx-vp9', '.webm')}
+
+class VideoWriter:
+    """
+    Video written frame by frame. The raw BGR frames are piped to a local 
+    ffmpeg, which encodes them in H.264, H.265 or VP9 at a constant quality 
+    (CRF) in its own process, while the next frames are being prepared. If 
+    ffmpeg can't be found, or with the 'mjpg' codec, the frames are written 
+    by OpenCV's MJPG writer in an avi file instead.
+
+    The extension of the file is given by the codec (cf video_codecs), the 
+    actual path being kept in the 'path' attribute and the writer used in 
+    'backend' ('ffmpeg' or 'opencv').
+    """
+
+    def __init__(self, path, frame_size, fps=4, codec='h264', crf=23, 
+                 preset='medium', scale=1, ffmpeg='ffmpeg'):
+        """
+        :param str path: the absolute path of the video, without extension
+        :param frame_size: the size of the frames, (width, height)
+        :type frame_size: (int, int)
+        :param float fps: the number of frames per second
+        :param str codec: 'h264', 'h265', 'vp9' or 'mjpg'
+        :param int crf: the constant rate factor of the encoder, the lower 
+            the better the quality and the bigger the file (e.g. 23 for 
+            H.264, 28 for H.265 and 31 for VP9 are good defaults)
+        :param str preset: the speed preset of the H.264 and H.265 encoders, 
+            from 'ultrafast' to 'veryslow'
+        :param float scale: the downscaling factor of the frames, 1 to keep 
+            their size
+        :param str ffmpeg: the name or path of the ffmpeg executable
+        """
+
+        self.frame_size = tuple(frame_size)
+        self.scale = scale
+        executable = shutil.which(ffmpeg) if codec in video_codecs else None
+
+        if executable is None:
+            self.backend = 'opencv'
+            self.path = path + '.avi'
+            self._size = (max(1, int(frame_size[0]*scale)), 
+                          max(1, int(frame_size[1]*scale)))
+            self._video = cv2.VideoWriter(self.path, 
+                                          cv2.VideoWriter_fourcc(*'MJPG'), 
+                                          fps, self._size)
+            return
+
+        self.backend = 'ffmpeg'
+        encoder, ext = video_codecs[codec]
+        self.path = path + ext
+        command = [executable, '-y', '-loglevel', 'error', 
+                   '-f', 'rawvideo', '-pix_fmt', 'bgr24', 
+                   '-s', '{}x{}'.format(*frame_size), '-r', str(fps), 
+                   '-i', '-', '-an', 
+                   # even dimensions, required by yuv420p
+                   '-vf', 'scale=trunc(iw*{0}/2)*2:trunc(ih*{0}/2)*2'
+                          .format(scale), 
+                   '-c:v', encoder, '-crf', str(crf)]
+        if codec == 'vp9':
+            command += ['-b:v', '0', '-row-mt', '1'] # constant quality mode
+        else:
+            command += ['-preset', preset]
+        command += ['-pix_fmt', 'yuv420p', self.path]
+        # The messages of ffmpeg go to a temporary file rather than a pipe, 
+        # which would block ffmpeg once full as it is only read at the end
+        self._errors = tempfile.TemporaryFile()
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, 
+                                         stderr=self._errors)
+
+    def _readErrors(self):
+        """
+        Reads the messages written by ffmpeg, once it has stopped.
+
+        :return: the messages
+        :rtype: str
+        """
+
+        if not self._errors.closed:
+            self._errors.seek(0)
+            self._error = self._errors.read().decode(errors='replace')
+            self._errors.close()
+        return self._error
+
+    def write(self, frame):
+        """
+        Writes a frame.
+
+        :param ndarray frame: the BGR frame, of shape (height, width, 3) 
+            matching the frame size
+        """
+
+        if self.backend == 'opencv':
+            if self.scale != 1:
+                frame = cv2.resize(frame, self._size, 
+                                   interpolation=cv2.INTER_AREA)
+            self._video.write(frame)
+            return
+        try:
+            self._process.stdin.write(np.ascontiguousarray(frame, 
+                                                           np.uint8).data)
+        except BrokenPipeError:
+            self._process.wait()
+            raise IOError('ffmpeg stopped: {}'.format(self._readErrors()))
+
+    def close(self):
+        """
+        Ends the video, waiting for ffmpeg to encode the last frames.
+        """
+
+        if self.backend == 'opencv':
+            self._video.release()
+            return
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError: # ffmpeg already stopped, cf its return code
+            pass
+        returncode = self._process.wait()
+        error = self._readErrors()
+        if returncode:
+            raise IOError('ffmpeg failed: {}'.format(error))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def computeOccupancy(img_path, invert):
+    """
+    Computes in one streaming pass the occupancy of every slice of a
+    (multi-page) tif file: whether it holds any foreground pixel, how many,
+    and the bounding box of these pixels.
+
+    :param str img_path: the absolute path of the tif file
+    :param bool invert: True if the slices must be inverted (white
+        background), False otherwise
+
+    :return: a dictionary of arrays indexed by slice: 'foreground' (bool),
+        'count' (int) and 'bbox' (y_min, y_max, x_min, x_max), the bounding
+        box of an empty slice being (-1, -1, -1, -1)
+    :rtype: dict{str: ndarray}
+    """
+
+    slices_nb = countSlices(img_path)[0]
+    foreground = np.zeros(slices_nb, dtype=bool)
+    count = np.zeros(slices_nb, dtype=np.int64)
+    bbox = np.full((slices_nb, 4), -1, dtype=np.int64)
+
+    for i, sli in enumerate(iterSlices(img_path, invert)):
+        foreground[i] = np.any(sli)
+        if foreground[i]:
+            count[i] = np.count_nonzero(sli)
+            rows = np.flatnonzero(np.any(sli, axis=1))
+            cols = np.flatnonzero(np.any(sli, axis=0))
+            bbox[i] = (rows[0], rows[-1], cols[0], cols[-1])
+
+    return {'foreground':foreground, 'count':count, 'bbox':bbox}
+
+def _occupancyHeader(img_path, invert):
+    """
+    Creates the header line identifying the stack a manifest was computed
+    from, so that a manifest is not reused once its stack has changed.
+
+    :param str img_path: the absolute path of the tif file
+    :param bool invert: True if the slices have been inverted, False otherwise
+
+    :return: the header line
+    :rtype: str
+    """
+
+    stat = os.stat(img_path)
+    return ('# source={} size={} mtime={} invert={}'
+            .format(os.path.basename(img_path), stat.st_size,
+                    stat.st_mtime_ns, bool(invert)))
+
+def occupancyPath(img_path, directory):
+    """
+    Gives the path of the occupancy manifest of a tif file.
+
+    :param str img_path: the absolute path of the tif file
+    :param str directory: the directory in which the manifest is kept
+
+    :return: the absolute path of the manifest: [stack name]_occupancy.csv
+    :rtype: str
+    """
+
+    img_name = os.path.splitext(os.path.basename(img_path))[0]
+    return os.path.join(directory, img_name + '_occupancy.csv')
+
+def saveOccupancy(occupancy, manifest_path, img_path, invert):
+    """
+    Saves an occupancy manifest as a small csv sidecar file.
+
+    :param occupancy: the occupancy, cf computeOccupancy()
+    :type occupancy: dict{str: ndarray}
+    :param str manifest_path: the absolute path of the manifest to write
+    :param str img_path: the absolute path of the tif file it describes
+    :param bool invert: True if the slices have been inverted, False otherwise
+    """
+
+    with open(manifest_path, 'w') as manifest:
+        manifest.write(_occupancyHeader(img_path, invert) + '\n')
+        manifest.write('slice,foreground,count,y_min,y_max,x_min,x_max\n')
+        for i in range(len(occupancy['count'])):
+            manifest.write('{},{:d},{},{},{},{},{}\n'
+                           .format(i, occupancy['foreground'][i],
+                                   occupancy['count'][i],
+                                   *occupancy['bbox'][i]))
+
+def loadOccupancy(manifest_path, img_path, invert):
+    """
+    Loads an occupancy manifest if it exists and still matches its tif file.
+
+    :param str manifest_path: the absolute path of the manifest to load
+    :param str img_path: the absolute path of the tif file it describes
+    :param bool invert: True if the slices must be inverted, False otherwise
+
+    :return: the occupancy (cf computeOccupancy()), or None if the manifest
+        is missing or outdated
+    :rtype: dict{str: ndarray} or None
+    """
+
+    if not os.path.isfile(manifest_path):
+        return None
+    with open(manifest_path) as manifest:
+        if manifest.readline().rstrip('\n') != _occupancyHeader(img_path,
+                                                                invert):
+            return None
+    data = np.loadtxt(manifest_path, dtype=np.int64, delimiter=',',
+                      skiprows=2, ndmin=2)
+    return {'foreground':data[:, 1].astype(bool), 'count':data[:, 2],
+            'bbox':data[:, 3:7]}
+
+def getOccupancy(img_path, invert, directory):
+    """
+    Gets the occupancy of the slices of a tif file from its manifest in
+    'directory', computing and saving the manifest first if needed. This
+    way, the stack is scanned only once for all the processing stages.
+
+    :param str img_path: the absolute path of the tif file
+    :param bool invert: True if the slices must be inverted, False otherwise
+    :param str directory: the directory in which the manifest is kept
+
+    :return: the occupancy, cf computeOccupancy()
+    :rtype: dict{str: ndarray}
+    """
+
+    manifest_path = occupancyPath(img_path, directory)
+    occupancy = loadOccupancy(manifest_path, img_path, invert)
+    if occupancy is None:
+        occupancy = computeOccupancy(img_path, invert)
+        saveOccupancy(occupancy, manifest_path, img_path, invert)
+    return occupancy
+
+def cropWindow(occupancy, shape, margin, index=None):
+    """
+    Computes the window holding the foreground of a stack, from its
+    occupancy: the union of the bounding boxes of all its slices, or the
+    bounding box of one slice only, widened by a margin of background.
+
+    :param occupancy: the occupancy of the stack, cf computeOccupancy()
+    :type occupancy: dict{str: ndarray}
+    :param shape: the shape of a slice, (height, width)
+    :type shape: (int, int)
+    :param int margin: the number of background pixels to keep around the
+        foreground
+    :param int index: the index of the slice to crop, or None for the union
+        window of all the slices
+
+    :return: the window (y_min, y_max, x_min, x_max), max bounds excluded,
+        or None if there is no foreground
+    :rtype: (int, int, int, int)
+    """
+
+    if index is None:
+        bbox = occupancy['bbox'][occupancy['foreground']]
+    else:
+        bbox = occupancy['bbox'][index:index+1][occupancy['foreground']
+                                                [index:index+1]]
+    if not len(bbox):
+        return None
+
+    height, width = shape
+    return (max(0, int(bbox[:, 0].min())-margin),
+            min(height, int(bbox[:, 1].max())+1+margin),
+            max(0, int(bbox[:, 2].min())-margin),
+            min(width, int(bbox[:, 3].max())+1+margin))
+
+def uncropArray(array, window, shape):
+    """
+    Puts back a cropped array at its place in an array of the original shape,
+    filled with zeros elsewhere.
+
+    :param ndarray array: the cropped array
+    :param window: the crop window, cf cropWindow()
+    :type window: (int, int, int, int)
+    :param shape: the original shape
+    :type shape: (int, int)
+
+    :return: the array in the original shape
+    :rtype: ndarray
+    """
+
+    full = np.zeros(shape, dtype=array.dtype)
+    full[window[0]:window[1], window[2]:window[3]] = array
+    return full
+
+def shiftGraph(G, dx, dy):
+    """
+    Translates the nodes of a graph, for instance to bring a graph extracted
+    from a cropped image back into the original image space. The nodes are
+    moved in place but the graph is returned nevertheless.
+
+    :param nx.Graph G: the graph to translate
+    :param float dx: the translation along x (columns)
+    :param float dy: the translation along y (rows)
+
+    :return: the translated graph
+    :rtype: nx.Graph
+    """
+
+    for node, data in G.nodes(data=True):
+        data['x'] += dx
+        data['y'] += dy
+    return G
+
+def graphToArrays(G):
+    """
+    Converts a graph into arrays: node coordinates and conductivity, edges as
+    pairs of node indices with their weight and conductivity. Node i of the
+    arrays is the i-th node of G.nodes().
+
+    :param nx.Graph G: the graph to convert
+
+    :return: a dictionary of arrays: 'x', 'y', 'conductivity' (nodes), 
+        'edges' (shape (edges number, 2)), 'weight' and 'edge_conductivity'
+    :rtype: dict{str: ndarray}
+    """
+
+    nodes_nb = G.number_of_nodes()
+    edges_nb = G.number_of_edges()
+    index = {node:i for i, node in enumerate(G.nodes())}
+    
+    arrays = {}
+    for key in ['x', 'y', 'conductivity']:
+        arrays[key] = np.fromiter((value for node, value in G.nodes(data=key)), 
+                                  dtype=float, count=nodes_nb)
+    arrays['edges'] = np.fromiter((index[node] for edge in G.edges() 
+                                   for node in edge), dtype=np.int64, 
+                                  count=2*edges_nb).reshape(-1, 2)
+    arrays['weight'] = np.fromiter((w for u, v, w in G.edges(data='weight')),
+                                   dtype=float, count=edges_nb)
+    arrays['edge_conductivity'] = np.fromiter((c for u, v, c in 
+                                               G.edges(data='conductivity')),
+                                              dtype=float, count=edges_nb)
+    return arrays
+
+def arraysToGraph(arrays):
+    """
+    Rebuilds a graph from the arrays created by graphToArrays(). The nodes 
+    are labelled with successive integers.
+
+    :param arrays: the arrays of the graph, cf graphToArrays()
+    :type arrays: dict{str: ndarray}
+
+    :return: the graph
+    :rtype: nx.Graph
+    """
+
+    G = nx.Graph()
+    G.add_nodes_from((i, {'x':float(x), 'y':float(y), 'conductivity':float(c)}) 
+                     for i, (x, y, c) in enumerate(zip(arrays['x'], 
+                                                       arrays['y'], 
+                                                       arrays['conductivity'])))
+    G.add_edges_from((int(u), int(v), {'weight':float(w), 
+                                       'conductivity':float(c)}) 
+                     for (u, v), w, c in zip(arrays['edges'], arrays['weight'],
+                                             arrays['edge_conductivity']))
+    return G
+
+def _attributeArray(name, values):
+    """
+    Converts the values of an attribute of the nodes (or edges) into an 
+    array for the npz format, cf graphNpzArrays(). The values must all have 
+    the same shape: scalars, or sequences of the same length (e.g. a 'pos' 
+    couple), stored as the rows of a 2-dimensional array.
+
+    :param str name: the name of the attribute, for the error message
+    :param list values: the value of each node, None for the nodes without 
+        the attribute
+
+    :return: the array of the values (zero for the missing ones) and the 
+        mask of the present values (None if they all are), or None if no 
+        node has a value
+    :rtype: (ndarray, ndarray) or None
+
+    :raises ValueError: if the values have different shapes or can't be 
+        stored without pickling (e.g. dictionaries)
+    """
+
+    mask = np.array([value is not None for value in values], dtype=bool)
+    present = [value for value in values if value is not None]
+    if not present:
+        return None
+    shapes = {np.shape(value) for value in present}
+    if len(shapes) > 1:
+        raise ValueError('the values of the attribute {!r} have different '
+                         'shapes: {}'.format(name, sorted(shapes)))
+    present = np.array(present)
+    if present.dtype.hasobject:
+        raise ValueError('the values of the attribute {!r} cannot be saved '
+                         'as an array'.format(name))
+    array = np.zeros((len(values),) + present.shape[1:], dtype=present.dtype)
+    array[mask] = present
+    return array, (None if mask.all() else mask)
+
+def graphNpzArrays(G):
+    """
+    Converts a graph into the arrays saved in the npz format, cf 
+    writeGraphNpz().
+
+    :param nx.Graph G: the graph to convert
+
+    :return: the arrays of the npz file
+    :rtype: dict{str: ndarray}
+
+    :raises ValueError: if an attribute can't be saved as an array, cf 
+        _attributeArray()
+    """
+
+    arrays = graphToArrays(G)
+    for key in ['x', 'y', 'conductivity', 'weight', 'edge_conductivity']:
+        arrays[key] = arrays[key].astype(np.float32)
+    arrays['edges'] = arrays['edges'].astype(np.int32)
+
+    for prefix, elements, known in [('node_', G.nodes(data=True), 
+                                     {'x', 'y', 'conductivity'}), 
+                                    ('edge_', G.edges(data=True), 
+                                     {'weight', 'conductivity'})]:
+        attributes = [element[-1] for element in elements]
+        names = set()
+        for data in attributes:
+            names.update(data)
+        for name in sorted(names - known):
+            converted = _attributeArray(name, [data.get(name) 
+                                               for data in attributes])
+            if converted is None:
+                continue
+            arrays[prefix + name], mask = converted
+            if mask is not None:
+                arrays[prefix + name + '_mask'] = mask
+    for name, value in G.graph.items():
+        arrays['graph_' + name] = np.asarray(value)
+    return arrays
+
+def graphChecksum(arrays):
+    """
+    Computes the SHA-256 checksum of the arrays of a graph: names, dtypes, 
+    shapes and contents, in the order of the names. The 'checksum' array 
+    itself is left out, so that the checksum stored in a npz file can be 
+    compared with the one of its other arrays.
+
+    :param arrays: the arrays of the graph, cf graphNpzArrays()
+    :type arrays: dict{str: ndarray}
+
+    :return: the hexadecimal checksum
+    :rtype: str
+    """
+
+    digest = hashlib.sha256()
+    for key in sorted(arrays):
+        if key == 'checksum':
+            continue
+        array = np.ascontiguousarray(arrays[key])
+        digest.update('{}:{}:{};'.format(key, array.dtype.str, array.shape)
+                      .encode())
+        if array.dtype.hasobject:
+            digest.update(repr(array.tolist()).encode())
+        else:
+            digest.update(array.tobytes())
+    return digest.hexdigest()
+
+def writeGraphNpz(G, path, compressed=True, checksum=False):
+    """
+    Saves a graph in the compact binary npz format: node coordinates and 
+    conductivity as float32, edges as int32 pairs of node indices with their 
+    weight and conductivity as float32, cf graphToArrays(). The other node 
+    attributes (e.g. the tracking 'tag') are saved as 'node_[name]' arrays, 
+    with a 'node_[name]_mask' array when only some nodes have them, the 
+    other edge attributes likewise as 'edge_[name]' arrays, and the graph 
+    attributes (e.g. 'crop') as 'graph_[name]'. The attributes must be 
+    scalars or sequences of the same length, cf _attributeArray(). Unlike 
+    gpickle, the file is safe to load and does not depend on the networkx 
+    or Python versions. The node labels are not kept.
+
+    :param nx.Graph G: the graph to save
+    :param path: the absolute path of the npz file to write, or a file 
+        opened in binary mode
+    :type path: str or file
+    :param bool compressed: True to compress the file (smaller but slower to 
+        write and read), False otherwise
+    :param bool checksum: True to store the checksum of the arrays in the 
+        file, as a 'checksum' array (cf graphChecksum() and 
+        verifyGraphNpz()), False otherwise
+
+    :return: the checksum of the arrays
+    :rtype: str
+    """
+
+    arrays = graphNpzArrays(G)
+    digest = graphChecksum(arrays)
+    if checksum:
+        arrays['checksum'] = np.array(digest)
+
+    if compressed:
+        np.savez_compressed(path, **arrays)
+    else:
+        np.savez(path, **arrays)
+    return digest
+
+def verifyGraphNpz(path, expected=''):
+    """
+    Checks the arrays of a npz graph file against their checksum: the one 
+    given, or else the one stored in the file (cf writeGraphNpz()).
+
+    :param str path: the absolute path of the npz file
+    :param str expected: the expected checksum, the stored one if empty
+
+    :return: True if the checksums match, False otherwise (or if the file 
+        has no checksum to compare with)
+    :rtype: bool
+    """
+
+    with np.load(path) as data: # whatever the extension, e.g. a partial file
+        arrays = {key:data[key] for key in data.files}
+    if not expected:
+        if 'checksum' not in arrays:
+            return False
+        expected = str(arrays['checksum'])
+    return graphChecksum(arrays) == expected
+
+def readGpickle(path):
+    """
+    Reads a gpickle file written by any version of networkx, including the 
+    networkx 1.x graphs pickled with Python 2: their strings are decoded as 
+    latin-1 and the graph is rebuilt from their node and adjacency 
+    dictionaries, which networkx 2 names differently.
+
+    :param str path: the absolute path of the gpickle file
+
+    :return: the graph
+    :rtype: nx.Graph
+    """
+
+    with open(path, 'rb') as file:
+        G = pickle.load(file, encoding='latin1')
+
+    state = G.__dict__
+    if '_adj' in state: # networkx 2 graph
+        return G
+    graph = G.__class__()
+    graph.graph.update(state.get('graph', {}))
+    graph.add_nodes_from(state['node'].items())
+    graph.add_edges_from((u, v, data) for u, neighbors in state['adj'].items()
+                         for v, data in neighbors.items())
+    return graph
+
+def loadGraphArrays(path):
+    """
+    Loads the arrays of a graph file without building the graph, which is 
+    much faster for the processing that only needs the coordinates, the 
+    edges or the degrees. gpickle files are converted with graphToArrays().
+
+    :param str path: the absolute path of the graph file (npz or gpickle)
+
+    :return: the arrays of the graph, cf graphToArrays() and writeGraphNpz()
+    :rtype: dict{str: ndarray}
+    """
+
+    if checkExtension(path, ['.npz']):
+        with np.load(path) as data:
+            return {key:data[key] for key in data.files}
+    return graphToArrays(nx.read_gpickle(path))
+
+class GraphArrays:
+    """
+    Lightweight read-only view of a graph as NumPy arrays, for the consumers 
+    that only need some of its fields (coordinates, degrees, edges, tags) 
+    and not a networkx graph. The fields are loaded on first access only: 
+    straight from the file for the npz format, the other sources being 
+    converted field by field. Node i of the arrays is the i-th node of the 
+    graph, and the edges are pairs of such indices.
+    
+    Fields: 'x', 'y', 'conductivity', 'edges', 'weight', 'edge_conductivity', 
+    'tag' (-1 for the nodes without tag) and 'degree' (computed with 
+    bincount over the edges). They can be read as attributes (view.x) or 
+    items (view['x']).
+    """
+
+    node_fields = ['x', 'y', 'conductivity']
+    edge_fields = {'weight':'weight', 'edge_conductivity':'conductivity'}
+
+    def __init__(self, source):
+        """
+        :param source: the graph: the absolute path of a graph file (npz or 
+            gpickle), a nx.Graph or a dictionary of arrays (cf 
+            graphToArrays())
+        :type source: str or nx.Graph or dict{str: ndarray}
+        """
+
+        self._source = source
+        self._fields = {}
+        self._graph = None # networkx graph, for the non npz sources
+        self._attributes = {} # of its nodes and edges, cf _graphAttributes()
+        if isinstance(source, dict):
+            self._fields.update(source)
+        elif isinstance(source, nx.Graph):
+            self._graph = source
+
+    def __getitem__(self, field):
+        if field not in self._fields:
+            self._fields[field] = self._load(field)
+        return self._fields[field]
+
+    def __getattr__(self, field):
+        if field.startswith('_'):
+            raise AttributeError(field)
+        try:
+            return self[field]
+        except KeyError:
+            raise AttributeError(field)
+
+    def __len__(self):
+        return len(self['x'])
+
+    def attributeTable(self, kind):
+        """
+        Builds a DataFrame of all the attributes of the nodes or of the 
+        edges, one row per node (or edge) in the order of the arrays. As 
+        with pd.DataFrame() on the attribute dictionaries of a graph, there 
+        is a column for each attribute that at least one node has, NaN for 
+        the nodes without it (e.g. the untagged nodes). The columns of the 
+        fields of the view (coordinates, conductivity, weight and tag) are 
+        built from their arrays, the attribute dictionaries of a networkx 
+        graph being only read for its other attributes.
+
+        :param str kind: 'nodes' or 'edges'
+
+        :return: the attributes table
+        :rtype: pd.DataFrame
+        """
+
+        if kind == 'nodes':
+            prefix = 'node_'
+            columns = {field:self[field] for field in self.node_fields}
+        else:
+            prefix = 'edge_'
+            columns = {name:self[field] for field, name in 
+                       self.edge_fields.items()}
+
+        G = self._sourceGraph()
+        if G is None: # npz file or dictionary of arrays
+            if isinstance(self._source, dict):
+                arrays = self._source
+            else:
+                with np.load(self._source) as data:
+                    arrays = {key:data[key] for key in data.files 
+                              if key.startswith(prefix)}
+            for key, value in arrays.items():
+                if (key.startswith(prefix) and not key.endswith('_mask') and 
+                    key != 'edge_conductivity'):
+                    columns[key[len(prefix):]] = _maskedColumn(
+                        value, arrays.get(key + '_mask'))
+            return pd.DataFrame(columns)
+
+        attributes = self._graphAttributes(kind)
+        for name in dict.fromkeys(itertools.chain.from_iterable(attributes)):
+            if name in columns:
+                continue
+            if kind == 'nodes' and name == 'tag':
+                columns[name] = _maskedColumn(self.tag, self.tag >= 0)
+            else:
+                columns[name] = [data.get(name, np.nan) for data in attributes]
+        return pd.DataFrame(columns)
+
+    def _sourceGraph(self):
+        """
+        Gives the networkx graph of the view, read on first use from a 
+        gpickle file.
+
+        :return: the graph, or None for a npz file or a dictionary of arrays
+        :rtype: nx.Graph
+        """
+
+        if (self._graph is None and isinstance(self._source, str) and 
+            not checkExtension(self._source, ['.npz'])):
+            self._graph = nx.read_gpickle(self._source)
+        return self._graph
+
+    def _graphAttributes(self, kind):
+        """
+        Lists the attribute dictionaries of the nodes or of the edges of the 
+        networkx graph of the view. The list is made once and shared by the 
+        fields loaded from the graph, as it is much faster to go through 
+        than the networkx views, and the pass over the edges also gives the 
+        'edges' field. Only the existing dictionaries are kept, not the 
+        tuples of the views: that many new objects would make the garbage 
+        collector go through the whole graph.
+
+        :param str kind: 'nodes' or 'edges'
+
+        :return: the attribute dictionaries
+        :rtype: list(dict)
+        """
+
+        if kind not in self._attributes:
+            G = self._sourceGraph()
+            if kind == 'nodes':
+                attributes = [data for node, data in G.nodes(data=True)]
+            else:
+                index = {node:i for i, node in enumerate(G)}
+                ends, attributes = [], []
+                for u, v, data in G.edges(data=True):
+                    ends += (index[u], index[v])
+                    attributes.append(data)
+                self._fields['edges'] = np.array(ends, dtype=np.int64
+                                                 ).reshape(-1, 2)
+            self._attributes[kind] = attributes
+        return self._attributes[kind]
+
+    def _load(self, field):
+        """
+        Loads one field from the source of the view.
+
+        :param str field: the name of the field
+
+        :return: the field
+        :rtype: ndarray
+        """
+
+        if field == 'degree':
+            return np.bincount(self['edges'].ravel(), minlength=len(self))
+
+        if (isinstance(self._source, str) and 
+            checkExtension(self._source, ['.npz'])):
+            with np.load(self._source) as data:
+                if field == 'tag':
+                    if 'node_tag' not in data.files:
+                        return np.full(len(data['x']), -1, dtype=np.int64)
+                    tag = data['node_tag'].astype(np.int64)
+                    if 'node_tag_mask' in data.files:
+                        tag[~data['node_tag_mask']] = -1
+                    return tag
+                return data[field]
+
+        if self._sourceGraph() is None: # dictionary of arrays
+            raise KeyError(field)
+        if field in self.node_fields:
+            nodes = self._graphAttributes('nodes')
+            return np.fromiter((data.get(field) for data in nodes), 
+                               dtype=float, count=len(nodes))
+        if field == 'tag':
+            nodes = self._graphAttributes('nodes')
+            return np.fromiter((data.get('tag', -1) for data in nodes), 
+                               dtype=np.int64, count=len(nodes))
+        if field == 'edges':
+            self._graphAttributes('edges')
+            return self._fields['edges']
+        if field in self.edge_fields:
+            edges = self._graphAttributes('edges')
+            name = self.edge_fields[field]
+            return np.fromiter((data.get(name) for data in edges), 
+                               dtype=float, count=len(edges))
+        raise KeyError(field)
+
+def _maskedColumn(values, mask):
+    """
+    Turns the array of an attribute into a DataFrame column, cf 
+    GraphArrays.attributeTable(): NaN for the elements without the attribute, 
+    as pd.DataFrame() gives for the missing keys, and tuples for the 
+    non-scalar values (e.g. a 'pos' couple).
+
+    :param ndarray values: the values of the attribute, one per element
+    :param ndarray mask: the mask of the elements with the attribute, or 
+        None if they all have it
+
+    :return: the column
+    :rtype: ndarray
+    """
+
+    if values.ndim > 1:
+        column = np.empty(len(values), dtype=object)
+        column[:] = [tuple(row) for row in values.tolist()]
+    elif mask is not None and not mask.all():
+        column = values.astype(float if values.dtype.kind in 'iuf' 
+                               else object)
+    else:
+        return values
+    if mask is not None:
+        column[~mask] = np.nan
+    return column
+
+def readGraph(path):
+    """
+    Reads a graph file saved by the vectorisation, either in the npz format 
+    (cf writeGraphNpz()) or as a gpickle.
+
+    :param str path: the absolute path of the graph file
+
+    :return: the graph
+    :rtype: nx.Graph
+    """
+
+    if not checkExtension(path, ['.npz']):
+        return nx.read_gpickle(path)
+
+    arrays = loadGraphArrays(path)
+    G = arraysToGraph(arrays)
+    edges = arrays['edges'].tolist()
+    for key, value in arrays.items():
+        if key.startswith('graph_'):
+            G.graph[key[len('graph_'):]] = value.tolist()
+        elif key.endswith('_mask') or key == 'edge_conductivity':
+            continue
+        elif key.startswith('node_') or key.startswith('edge_'):
+            mask = arrays.get(key + '_mask', np.ones(len(value), dtype=bool))
+            name = key[len('node_'):]
+            for i in np.flatnonzero(mask).tolist():
+                item = value[i].tolist()
+                if isinstance(item, list): # e.g. a 'pos' couple
+                    item = tuple(item)
+                if key.startswith('node_'):
+                    G.nodes[i][name] = item
+                else:
+                    G.edges[edges[i]][name] = item
+    return G
+
+def saveGraph(G, path, compressed=True):
+    """
+    Saves a graph in the format given by the extension of 'path': npz (cf 
+    writeGraphNpz()) or gpickle.
+
+    :param nx.Graph G: the graph to save
+    :param str path: the absolute path of the graph file
+    :param bool compressed: True to compress a npz file, False otherwise
+    """
+
+    if checkExtension(path, ['.npz']):
+        writeGraphNpz(G, path, compressed)
+    else:
+        nx.write_gpickle(G, path, protocol=2)
+
+# Layout of the graph movie container, cf writeGraphMovie()
+graph_movie_magic = b'GMOV'
+graph_movie_version = 2
+graph_movie_nodes = np.dtype([('x', '<f4'), ('y', '<f4'), 
+                              ('conductivity', '<f4')])
+graph_movie_edges = np.dtype([('u', '<i4'), ('v', '<i4'), ('weight', '<f4'),
+                              ('conductivity', '<f4')])
+graph_movie_frames = np.dtype([('keyframe', '<i8'), 
+                               ('node_start', '<i8'), ('node_stored', '<i8'),
+                               ('edge_start', '<i8'), ('edge_stored', '<i8'),
+                               ('removed_node_start', '<i8'), 
+                               ('removed_node_count', '<i8'),
+                               ('removed_edge_start', '<i8'), 
+                               ('removed_edge_count', '<i8'),
+                               ('node_count', '<i8'), ('edge_count', '<i8'), 
+                               ('length', '<f8'), ('y_min', '<f4'), 
+                               ('y_max', '<f4'), ('x_min', '<f4'), 
+                               ('x_max', '<f4')])
+
+def _alignFile(file, alignment=64):
+    """
+    Pads an open binary file with zeros up to the next multiple of 
+    'alignment' bytes.
+
+    :param file file: the file, opened for writing
+    :param int alignment: the alignment, in bytes
+
+    :return: the new position in the file
+    :rtype: int
+    """
+
+    padding = -file.tell() % alignment
+    file.write(b'\0' * padding)
+    return file.tell()
+
+def _uniqueMatch(keys_a, keys_b):
+    """
+    Matches two arrays of int64 keys, ignoring the keys that are not unique 
+    within their array.
+
+    :param ndarray keys_a: the first keys
+    :param ndarray keys_b: the second keys
+
+    :return: the indices in 'keys_a' and in 'keys_b' of the matched keys
+    :rtype: (ndarray, ndarray)
+    """
+
+    def uniqueIndices(keys):
+        values, index, counts = np.unique(keys, return_index=True, 
+                                          return_counts=True)
+        return values[counts == 1], index[counts == 1]
+
+    values_a, index_a = uniqueIndices(keys_a)
+    values_b, index_b = uniqueIndices(keys_b)
+    common, in_a, in_b = np.intersect1d(values_a, values_b, assume_unique=True,
+                                        return_indices=True)
+    return index_a[in_a], index_b[in_b]
+
+def _applyGraphDelta(nodes, edges, removed_nodes, removed_edges, added_nodes,
+                     added_edges):
+    """
+    Applies a delta to the node and edge records of a frame of a graph movie: 
+    the removed nodes and edges are dropped, the others keep their order and 
+    the added ones come after them. The edges refer to the nodes by their 
+    index in the frame.
+
+    :param ndarray nodes: the node records of the previous frame
+    :param ndarray edges: the edge records of the previous frame
+    :param ndarray removed_nodes: the indices of the removed nodes
+    :param ndarray removed_edges: the indices of the removed edges
+    :param ndarray added_nodes: the records of the added nodes
+    :param ndarray added_edges: the records of the added edges, with the 
+        node indices of the new frame
+
+    :return: the node and edge records of the new frame
+    :rtype: (ndarray, ndarray)
+    """
+
+    kept_nodes = np.ones(len(nodes), dtype=bool)
+    kept_nodes[removed_nodes] = False
+    remap = np.cumsum(kept_nodes) - 1
+    kept_edges = np.ones(len(edges), dtype=bool)
+    kept_edges[removed_edges] = False
+    edges = edges[kept_edges] # copy
+    edges['u'] = remap[edges['u']]
+    edges['v'] = remap[edges['v']]
+    return (np.concatenate((nodes[kept_nodes], added_nodes)), 
+            np.concatenate((edges, added_edges)))
+
+def _encodeGraphDelta(nodes, edges, new_nodes, new_edges, quantum):
+    """
+    Computes the delta between two frames of a graph movie. A node of the 
+    new frame is the same as a node of the previous frame when they have 
+    the same coordinates, quantised by 'quantum', and the same rounded 
+    conductivity. As the coordinates jitter a little from one frame to the 
+    next, the nodes left unmatched are matched again on quantisation grids 
+    shifted by half a quantum, so that two nodes closer than a quarter of a 
+    quantum along each axis are always matched. As two nodes in neighbouring 
+    cells of a grid can still be almost a quantum apart, the matched nodes 
+    farther than half a quantum along an axis are dropped from the matching 
+    and saved again as new nodes: a kept node is never off by more than 
+    quantum / 2 along each axis. An edge is the same when it links the same 
+    nodes. Nodes with the same quantised coordinates within a frame are not 
+    matched.
+
+    :param ndarray nodes: the node records of the previous frame
+    :param ndarray edges: the edge records of the previous frame
+    :param ndarray new_nodes: the node records of the new frame
+    :param ndarray new_edges: the edge records of the new frame
+    :param float quantum: the quantisation step of the coordinates, in pixel
+
+    :return: the delta: removed node indices, removed edge indices, added 
+        node records and added edge records, cf _applyGraphDelta()
+    :rtype: (ndarray, ndarray, ndarray, ndarray)
+    """
+
+    def nodeKeys(records, shift_x, shift_y): # 21 bits per value
+        keys = np.zeros(len(records), dtype=np.int64)
+        for values in (records['x'] / quantum + shift_x, 
+                       records['y'] / quantum + shift_y,
+                       records['conductivity']):
+            quantised = np.round(values).astype(np.int64)
+            keys = (keys << 21) | ((quantised + 2**20) & (2**21 - 1))
+        return keys
+
+    def edgeKeys(u, v):
+        return np.minimum(u, v).astype(np.int64) << 31 | np.maximum(u, v)
+
+    # Nodes: the matched ones are kept, the others removed or added
+    kept_nodes = np.zeros(len(nodes), dtype=bool)
+    added_nodes = np.ones(len(new_nodes), dtype=bool)
+    matched = np.zeros(0, dtype=np.int64)
+    new_matched = np.zeros(0, dtype=np.int64)
+    for shift_x, shift_y in ((0, 0), (0.5, 0), (0, 0.5), (0.5, 0.5)):
+        left = np.flatnonzero(~kept_nodes)
+        new_left = np.flatnonzero(added_nodes)
+        pairs = _uniqueMatch(nodeKeys(nodes[left], shift_x, shift_y), 
+                             nodeKeys(new_nodes[new_left], shift_x, shift_y))
+        close = np.ones(len(pairs[0]), dtype=bool) # within quantum / 2
+        for axis in ('x', 'y'):
+            close &= (np.abs(nodes[axis][left[pairs[0]]].astype(float) - 
+                             new_nodes[axis][new_left[pairs[1]]]) 
+                      <= quantum / 2)
+        pairs = pairs[0][close], pairs[1][close]
+        kept_nodes[left[pairs[0]]] = True
+        added_nodes[new_left[pairs[1]]] = False
+        matched = np.concatenate((matched, left[pairs[0]]))
+        new_matched = np.concatenate((new_matched, new_left[pairs[1]]))
+    remap = np.cumsum(kept_nodes) - 1
+    new_index = np.empty(len(new_nodes), dtype=np.int64) # in the new frame
+    new_index[new_matched] = remap[matched]
+    new_index[added_nodes] = kept_nodes.sum() + np.arange(added_nodes.sum())
+
+    # Edges: matched in the index space of the new frame
+    candidates = np.flatnonzero(kept_nodes[edges['u']] & 
+                                kept_nodes[edges['v']])
+    keys = edgeKeys(remap[edges['u'][candidates]], 
+                    remap[edges['v'][candidates]])
+    new_keys = edgeKeys(new_index[new_edges['u']], new_index[new_edges['v']])
+    common, in_keys, in_new = np.intersect1d(keys, new_keys, 
+                                             assume_unique=True, 
+                                             return_indices=True)
+    kept_edges = np.zeros(len(edges), dtype=bool)
+    kept_edges[candidates[in_keys]] = True
+    added_edges = np.ones(len(new_edges), dtype=bool)
+    added_edges[in_new] = False
+    added_edges = new_edges[added_edges] # copy
+    added_edges['u'] = new_index[added_edges['u']]
+    added_edges['v'] = new_index[added_edges['v']]
+
+    return (np.flatnonzero(~kept_nodes).astype(np.int32), 
+            np.flatnonzero(~kept_edges).astype(np.int32), 
+            new_nodes[added_nodes], added_edges)
+
+def writeGraphMovie(path, frames, keyframe_interval=0, quantum=1.0):
+    """
+    Saves the graphs of all the frames of a movie in a single container file 
+    which can be memory-mapped (cf openGraphMovie()). The file holds, back to 
+    back: the nodes of all the frames, the edges of all the frames (with 
+    node indices local to their frame), the removed node and edge indices of 
+    the delta frames, a table with the offsets and metadata of each frame 
+    (node and edge counts, total length, bounding box) and the frame names. 
+    A JSON footer gives the layout of these sections. Only the node 
+    coordinates and conductivity and the edge weight and conductivity are 
+    kept.
+    As the consecutive graphs of a growing colony share most of their nodes 
+    and edges, the frames can be delta-encoded: every 'keyframe_interval' 
+    frames, a keyframe is saved in full and in between, only the nodes and 
+    edges added and removed since the previous frame are saved (cf 
+    _encodeGraphDelta()). This encoding is lossy: a node matched with a node 
+    of the previous frame keeps the attributes of the latter, i.e. its 
+    coordinates may be off by up to quantum / 2 along each axis and its 
+    conductivity by less than 1, and a matched edge keeps the weight and 
+    conductivity of the previous frame.
+    The frames are written one by one, the sections being spilled to 
+    temporary files meanwhile, so that the movie never has to be held in 
+    memory.
+
+    :param str path: the absolute path of the container file to write
+    :param frames: the frames, in order, as couples (frame name, arrays of 
+        its graph, cf graphToArrays())
+    :type frames: iterable((str, dict{str: ndarray}))
+    :param int keyframe_interval: the interval between two keyframes. 0 or 1 
+        to save all the frames in full, without delta encoding.
+    :param float quantum: the quantisation step of the node coordinates for 
+        the matching of the delta encoding, in pixel
+    """
+
+    table = []
+    names = []
+    counts = {key:0 for key in ['nodes', 'edges', 'removed_nodes', 
+                                'removed_edges']}
+    
+    with open(path, 'wb') as movie, \
+         tempfile.TemporaryFile(dir=os.path.dirname(path)) as spill_edges, \
+         tempfile.TemporaryFile(dir=os.path.dirname(path)) as spill_nodes, \
+         tempfile.TemporaryFile(dir=os.path.dirname(path)) as spill_removed:
+        spills = {'nodes':movie, 'edges':spill_edges, 
+                  'removed_nodes':spill_nodes, 'removed_edges':spill_removed}
+
+        for t, (name, arrays) in enumerate(frames):
+            new_nodes = np.empty(len(arrays['x']), dtype=graph_movie_nodes)
+            new_nodes['x'] = arrays['x']
+            new_nodes['y'] = arrays['y']
+            new_nodes['conductivity'] = arrays['conductivity']
+            new_edges = np.empty(len(arrays['edges']), 
+                                 dtype=graph_movie_edges)
+            new_edges['u'] = arrays['edges'][:, 0]
+            new_edges['v'] = arrays['edges'][:, 1]
+            new_edges['weight'] = arrays['weight']
+            new_edges['conductivity'] = arrays['edge_conductivity']
+
+            if keyframe_interval <= 1 or t % keyframe_interval == 0:
+                keyframe = t
+                stored = {'nodes':new_nodes, 'edges':new_edges, 
+                          'removed_nodes':np.zeros(0, dtype=np.int32),
+                          'removed_edges':np.zeros(0, dtype=np.int32)}
+                nodes, edges = new_nodes, new_edges
+            else: # delta from the frame as it will be decoded
+                delta = _encodeGraphDelta(nodes, edges, new_nodes, new_edges, 
+                                          quantum)
+                stored = dict(zip(['removed_nodes', 'removed_edges', 'nodes',
+                                   'edges'], delta))
+                nodes, edges = _applyGraphDelta(nodes, edges, *delta)
+
+            starts = dict(counts)
+            for key, records in stored.items():
+                spills[key].write(records.tobytes())
+                counts[key] += len(records)
+
+            if len(nodes):
+                bbox = (nodes['y'].min(), nodes['y'].max(), nodes['x'].min(),
+                        nodes['x'].max())
+            else:
+                bbox = (np.nan,) * 4
+            table.append((keyframe, starts['nodes'], len(stored['nodes']), 
+                          starts['edges'], len(stored['edges']), 
+                          starts['removed_nodes'], 
+                          len(stored['removed_nodes']), 
+                          starts['removed_edges'], 
+                          len(stored['removed_edges']), len(nodes), 
+                          len(edges), edges['weight'].sum(dtype=np.float64))
+                         + bbox)
+            names.append(name)
+
+        sections = {'nodes':{'offset':0, 'count':counts['nodes']}}
+        for key in ['edges', 'removed_nodes', 'removed_edges']:
+            sections[key] = {'offset':_alignFile(movie), 'count':counts[key]}
+            spills[key].seek(0)
+            shutil.copyfileobj(spills[key], movie)
+        
+        table = np.array(table, dtype=graph_movie_frames)
+        sections['frames'] = {'offset':_alignFile(movie), 
+                              'count':len(table)}
+        movie.write(table.tobytes())
+        names = np.array(names, dtype=bytes).reshape(-1)
+        sections['names'] = {'offset':_alignFile(movie), 'count':len(names),
+                             'itemsize':max(1, names.dtype.itemsize)}
+        movie.write(names.astype('S{}'.format(sections['names']['itemsize']))
+                    .tobytes())
+
+        footer = json.dumps({'version':graph_movie_version, 
+                             'keyframe_interval':keyframe_interval,
+                             'quantum':quantum, 'sections':sections}).encode()
+        movie.write(footer)
+        movie.write(struct.pack('<Q', len(footer)) + graph_movie_magic)
+
+def openGraphMovie(path):
+    """
+    Opens a graph movie container written by writeGraphMovie(). The sections 
+    are memory-mapped: nothing is read until it is accessed, so reading one 
+    frame (cf graphMovieFrame()) or a metric of all the frames (e.g. 
+    movie['frames']['length']) costs no per-file overhead.
+
+    :param str path: the absolute path of the container file
+
+    :return: the sections of the container: 'nodes' and 'edges' (structured 
+        arrays of the records stored for all the frames), 'removed_nodes' 
+        and 'removed_edges' (indices for the delta frames), 'frames' 
+        (structured array of the offsets and metadata of each frame, the 
+        metadata being 'node_count', 'edge_count', 'length', 'y_min', 
+        'y_max', 'x_min' and 'x_max') and 'names' (list of the frame names)
+    :rtype: dict
+    """
+
+    with open(path, 'rb') as movie:
+        movie.seek(-12, os.SEEK_END)
+        footer_length, magic = struct.unpack('<Q4s', movie.read(12))
+        if magic != graph_movie_magic:
+            raise ValueError('{} is not a graph movie container.'.format(path))
+        movie.seek(-12-footer_length, os.SEEK_END)
+        footer = json.loads(movie.read(footer_length).decode())
+    if footer['version'] != graph_movie_version:
+        raise ValueError('{} is a graph movie container of version {}, only '
+                         'the version {} is supported.'
+                         .format(path, footer['version'], 
+                                 graph_movie_version))
+
+    sections = footer['sections']
+    names_dtype = np.dtype('S{}'.format(sections['names']['itemsize']))
+    dtypes = {'nodes':graph_movie_nodes, 'edges':graph_movie_edges,
+              'removed_nodes':np.dtype('<i4'), 
+              'removed_edges':np.dtype('<i4'),
+              'frames':graph_movie_frames, 'names':names_dtype}
+    content = {}
+    for key, dtype in dtypes.items():
+        if sections[key]['count']:
+            content[key] = np.memmap(path, dtype=dtype, mode='r', 
+                                     offset=sections[key]['offset'],
+                                     shape=(sections[key]['count'],))
+        else: # empty sections cannot be mapped
+            content[key] = np.zeros(0, dtype=dtype)
+    content['names'] = [name.decode() for name in content['names']]
+    content['cache'] = {} # last decoded frame, for sequential access
+    return content
+
+def _storedRecords(movie, frame, key):
+    """
+    Gets the records of a section stored for one frame of a graph movie.
+
+    :param dict movie: the opened container, cf openGraphMovie()
+    :param frame: the row of the frame in the frame table
+    :type frame: np.void
+    :param str key: the section: 'nodes', 'edges', 'removed_nodes' or 
+        'removed_edges'
+
+    :return: the records (a view on the mapped file)
+    :rtype: ndarray
+    """
+
+    start, count = {'nodes':('node_start', 'node_stored'), 
+                    'edges':('edge_start', 'edge_stored'), 
+                    'removed_nodes':('removed_node_start', 
+                                     'removed_node_count'), 
+                    'removed_edges':('removed_edge_start', 
+                                     'removed_edge_count')}[key]
+    return movie[key][frame[start]:frame[start]+frame[count]]
+
+def graphMovieFrame(movie, t):
+    """
+    Gets the arrays of the graph of one frame of a graph movie container. A 
+    keyframe is read directly from the mapped file. A delta frame is 
+    reconstructed from its keyframe, or from the last frame read if it lies 
+    in between, which makes a sequential reading cheap.
+
+    :param dict movie: the opened container, cf openGraphMovie()
+    :param int t: the index of the frame
+
+    :return: the arrays of the graph, cf graphToArrays()
+    :rtype: dict{str: ndarray}
+    """
+
+    frames = movie['frames']
+    keyframe = int(frames[t]['keyframe'])
+    cache = movie['cache']
+    if (cache and keyframe <= cache['t'] <= t and 
+        frames[cache['t']]['keyframe'] == keyframe):
+        start, nodes, edges = cache['t'], cache['nodes'], cache['edges']
+    else:
+        start = keyframe
+        nodes = _storedRecords(movie, frames[keyframe], 'nodes')
+        edges = _storedRecords(movie, frames[keyframe], 'edges')
+    for i in range(start+1, t+1):
+        nodes, edges = _applyGraphDelta(nodes, edges, *[
+            _storedRecords(movie, frames[i], key) for key in 
+            ['removed_nodes', 'removed_edges', 'nodes', 'edges']])
+    movie['cache'] = {'t':t, 'nodes':nodes, 'edges':edges}
+
+    return {'x':nodes['x'], 'y':nodes['y'], 
+            'conductivity':nodes['conductivity'],
+            'edges':np.stack((edges['u'], edges['v']), axis=1), 
+            'weight':edges['weight'], 
+            'edge_conductivity':edges['conductivity']}
+
+def packGraphMovie(graphs, path, keyframe_interval=0):
+    """
+    Gathers graph files (one per frame) into a graph movie container, cf 
+    writeGraphMovie(). A missing graph file (e.g. a slice that could not be 
+    vectorized) gives an empty frame.
+
+    :param graphs: a list of couples of strings: the absolute path of the 
+        graph file of each frame (gpickle or npz) and the frame name
+    :type graphs: list((str, str))
+    :param str path: the absolute path of the container file to write
+    :param int keyframe_interval: the interval between two keyframes of the 
+        delta encoding, 0 to save all the frames in full
+
+    :return: the number of missing graph files
+    :rtype: int
+    """
+
+    empty = {'x':np.zeros(0), 'y':np.zeros(0), 'conductivity':np.zeros(0),
+             'edges':np.zeros((0, 2), dtype=np.int64), 'weight':np.zeros(0),
+             'edge_conductivity':np.zeros(0)}
+    missing = [graph for graph in graphs if not os.path.exists(graph[0])]
+    writeGraphMovie(path, ((name, loadGraphArrays(graph_path) 
+                                  if os.path.exists(graph_path) else empty)
+                           for graph_path, name in graphs), 
+                    keyframe_interval)
+    return len(missing)
+
+def saveDebugArtifacts(path, artifacts):
+    """
+    Saves the raw debugging data of a slice (source slice, contours, 
+    triangles, graph) as an uncompressed npz file, so that the debugging 
+    figures can be rendered later without slowing the vectorisation down.
+
+    :param str path: the absolute path of the npz file to write
+    :param artifacts: the debugging data. Expected keys: 'source', 'index', 
+        'invert', 'smoothing', 'height', 'contours' (list of contours), 
+        'triangle_points', 'triangle_types' and 'graph' (nx.Graph)
+    :type artifacts: dict
+    """
+
+    contours = [np.asarray(c, dtype=float).reshape(-1, 2) 
+                for c in artifacts['contours']]
+    graph = graphToArrays(artifacts['graph'])
+    np.savez(path, source=artifacts['source'], index=artifacts['index'], 
+             invert=artifacts['invert'], smoothing=int(artifacts['smoothing']),
+             height=artifacts['height'],
+             contour_points=np.concatenate(contours) if contours 
+                            else np.zeros((0, 2)), 
+             contour_lengths=np.array([len(c) for c in contours], 
+                                      dtype=np.int64),
+             triangle_points=artifacts['triangle_points'], 
+             triangle_types=artifacts['triangle_types'],
+             **{'graph_' + key:value for key, value in graph.items()})
+
+def loadDebugArtifacts(path):
+    """
+    Loads the raw debugging data of a slice saved by saveDebugArtifacts().
+
+    :param str path: the absolute path of the npz file to load
+
+    :return: the debugging data, the contours being a list of (n, 2) arrays 
+        and the graph a nx.Graph
+    :rtype: dict
+    """
+
+    with np.load(path) as data:
+        artifacts = {key:data[key] for key in data.files}
+    artifacts['source'] = str(artifacts['source'])
+    artifacts['index'] = int(artifacts['index'])
+    artifacts['invert'] = bool(artifacts['invert'])
+    artifacts['smoothing'] = int(artifacts['smoothing'])
+    artifacts['height'] = int(artifacts['height'])
+    bounds = np.cumsum(artifacts.pop('contour_lengths'))[:-1]
+    artifacts['contours'] = np.split(artifacts.pop('contour_points'), bounds)
+    graph = {key[len('graph_'):]:artifacts.pop(key) for key in list(artifacts)
+             if key.startswith('graph_')}
+    artifacts['graph'] = arraysToGraph(graph)
+    return artifacts
+
 def checkExtension(path, ext):
     """
     Checks if the file of path 'path' has the extension 'ext'.
@@ -789,10 +2641,153 @@ def checkExtension(path, ext):
     else:
         return False
 
+directory_index_name = '.directory_index.json'
+directory_index_version = 1
+directory_indexes = {} # in-process cache of the indexes already read
+
+def naturalKey(name):
+    """
+    Computes the natural sorting key of a file name, so that 'image2.png' 
+    comes before 'image10.png'. The key alternates lowercase text and 
+    integers and is JSON-serialisable, to be stored in the directory indexes.
+    
+    :param str name: the file name
+    
+    :return: the sorting key
+    :rtype: list
+    """
+    
+    parts = re.split(r'(\d+)', name.lower())
+    return [int(p) if i % 2 else p for i, p in enumerate(parts)]
+
+def frameNumber(name):
+    """
+    Parses the frame number of a file name, i.e. its last group of digits 
+    ('image042.png' -> 42).
+    
+    :param str name: the file name
+    
+    :return: the frame number, -1 if the name holds no digits
+    :rtype: int
+    """
+    
+    digits = re.findall(r'\d+', os.path.splitext(name)[0])
+    return int(digits[-1]) if digits else -1
+
+def readDirectoryIndex(path):
+    """
+    Reads the index file of a directory, if any.
+    
+    :param str path: absolute path of the indexed directory
+    
+    :return: the index, or None if there is none or if it can't be used
+    :rtype: dict or None
+    """
+    
+    try:
+        with open(os.path.join(path, directory_index_name)) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get('version') != directory_index_version:
+        return None
+    return index
+
+def writeDirectoryIndex(path, index):
+    """
+    Writes the index file of a directory. The file is rewritten in place, 
+    which doesn't change the modification time of the directory once the file
+    exists: the index stays valid for the next calls. A directory that can't 
+    be written to (read-only share...) simply keeps no index file.
+    
+    :param str path: absolute path of the indexed directory
+    :param dict index: the index to write
+    """
+    
+    index_path = os.path.join(path, directory_index_name)
+    try:
+        created = not os.path.exists(index_path)
+        with open(index_path, 'w') as f:
+            json.dump(index, f)
+        if created: # the creation of the file changed the directory mtime
+            index['mtime'] = os.stat(path).st_mtime_ns
+            with open(index_path, 'w') as f:
+                json.dump(index, f)
+    except OSError:
+        pass
+
+def directoryIndex(path, ext=None, save=True):
+    """
+    Lists the files of a directory in natural order, with their size, 
+    modification time and frame number, through a persistent index.
+    
+    The index is kept in memory and in a '.directory_index.json' file in the 
+    directory itself, so that every stage of the processing (vectorisation, 
+    superposition, tracking...) and every run shares it. It is refreshed 
+    incrementally: if the modification time of the directory didn't change, 
+    the directory is not listed again at all. Otherwise, only the new or 
+    modified files are parsed again, and the list, almost sorted already, is 
+    sorted again in linear time.
+    
+    :param str path: absolute path of the directory to list
+    :param ext: a list of strings of accepted extensions, like 
+        ['.tif', '.tiff']. All the files are listed if None.
+    :type ext: list(str) or None
+    :param bool save: whether to write the index file after a refresh
+    
+    :return: a list of dictionaries with the keys 'name', 'size', 'mtime' 
+        (in ns), 'key' (natural sorting key) and 'frame' (frame number, cf 
+        frameNumber()), sorted in natural order
+    :rtype: list(dict)
+    """
+    
+    path = os.path.abspath(path)
+    dir_mtime = os.stat(path).st_mtime_ns
+    index = directory_indexes.get(path)
+    if index is None:
+        index = readDirectoryIndex(path)
+    
+    if index is None or index['mtime'] != dir_mtime:
+        previous = {}
+        if index is not None:
+            previous = {e['name']: e for e in index['entries']}
+        entries = []
+        with os.scandir(path) as dirIt:
+            for entry in dirIt:
+                if entry.name == directory_index_name or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                known = previous.get(entry.name)
+                if (known is not None and known['size'] == stat.st_size 
+                    and known['mtime'] == stat.st_mtime_ns):
+                    entries.append(known)
+                else:
+                    entries.append({'name': entry.name, 
+                                    'size': stat.st_size, 
+                                    'mtime': stat.st_mtime_ns, 
+                                    'key': naturalKey(entry.name), 
+                                    'frame': frameNumber(entry.name)})
+        
+        # Keeping the previous order makes the sort linear for a folder that 
+        # only grows
+        order = {name: i for i, name in enumerate(previous)}
+        entries.sort(key=lambda e: order.get(e['name'], len(order)))
+        entries.sort(key=operator.itemgetter('key'))
+        index = {'version': directory_index_version, 'mtime': dir_mtime, 
+                 'entries': entries}
+        if save:
+            writeDirectoryIndex(path, index)
+    
+    directory_indexes[path] = index
+    if ext is None:
+        return list(index['entries'])
+    return [e for e in index['entries'] if checkExtension(e['name'], ext)]
+
 def preloadFiles(path, ext, debug=False):
     """
     Browses a directory to find, preload and order all the files with an 
-    expected extension.
+    expected extension. The directory is listed through its persistent index 
+    (cf directoryIndex()), and the files are sorted in natural order.
     
     :param str path: absolute path of the directory to browse
     :param ext: a list of strings of accepted extension, like ['.tif', '.tiff']
@@ -802,58 +2797,136 @@ def preloadFiles(path, ext, debug=False):
     :rtype: list((str, str))
     """
     
-    files = []
     try:
-        with os.scandir(path) as dirIt:
-            for entry in dirIt:
-                if checkExtension(entry, ext):                        
-                    file_name = os.path.splitext(os.path.basename(entry.path))[0]
-                    files.append((entry.path, file_name))
-            if debug:
-                print('preloadFiles> Number of files found: {}'
-                      .format(len(files)))
-        files.sort(key = operator.itemgetter(1)) # sorting the list by file name
+        entries = directoryIndex(path, ext)
     except IOError as e:
         sys.exit('preloadFiles> {}'.format(e))
+    files = [(os.path.join(path, e['name']), os.path.splitext(e['name'])[0]) 
+             for e in entries]
     
     if debug:
+        print('preloadFiles> Number of files found: {}'.format(len(files)))
         print('preloadFiles> {}'.format(files))
     
     return files
+
+def preloadGraphs(path, debug=False):
+    """
+    Browses a directory to find, preload and order all the graph files saved 
+    by the vectorisation (gpickle or npz), leaving out the debugging files. 
+    A slice saved in both formats (e.g. migrated in place, cf 
+    Graphs_migration.py, or vectorized again with another 'graph_format') 
+    is listed once, by its npz file.
     
-def createNodesCSVForTracking(graphs, dest_path, verbose):
+    :param str path: absolute path of the directory to browse
+    
+    :return: a list of tuples: (absolute path of the file, name of the file)
+    :rtype: list((str, str))
+    """
+    
+    graphs = {} # one file by name, in natural order
+    for f in preloadFiles(path, ['.gpickle', '.npz'], debug):
+        if f[1].endswith('_debug'):
+            continue
+        if f[1] not in graphs or checkExtension(f[0], ['.npz']):
+            graphs[f[1]] = f
+    return list(graphs.values())
+    
+def nodeTable(path, degrees=[3]):
+    """
+    Extracts the node table of one graph as arrays: the coordinates and the 
+    degree of the nodes of the selected degrees. Only the arrays of the graph 
+    are read, not the graph itself (cf GraphArrays).
+    
+    :param str path: absolute path of the graph (gpickle or npz)
+    :param degrees: the degrees of the nodes to extract, all if empty
+    :type degrees: list(int)
+    
+    :return: the abscissas, ordinates and degrees of the nodes
+    :rtype: (np.array, np.array, np.array)
+    """
+    
+    view = GraphArrays(path)
+    if degrees:
+        selected = np.isin(view.degree, degrees)
+        return view.x[selected], view.y[selected], view.degree[selected]
+    return view.x, view.y, view.degree
+
+def createNodesCSVForTracking(graphs, dest_path, verbose, workers=1, 
+                              degrees=[3]):
     """
-    Creates and saves a csv file of nodes coordinates (x, y, t) from a list of
-    graphs.
+    Creates and saves a table of nodes coordinates (x, y, t) and degrees from 
+    a list of graphs. The node tables of the graphs are extracted as arrays, 
+    in parallel if 'workers' > 1, and concatenated once.
     
     :param graphs: a list of couples of strings. The first element of the 
         couple is the absolute path of a graph, the second its name.
     :type graphs: list((str, str))
-    :param str dest_path: the path of the csv file to write
+    :param str dest_path: the path of the table to write: a csv file, or a 
+        npz file (much faster to write and read for millions of nodes, cf 
+        readNodesTable())
     :param bool verbose: verbosity switch
+    :param int workers: the number of worker processes reading the graphs
+    :param degrees: the degrees of the nodes to extract, all if empty
+    :type degrees: list(int)
     """
     
-    df = pd.DataFrame() # DataFrame to hold the result
+    paths = [graph[0] for graph in graphs]
     desc = '   UTI> Extracting data from graph'
-    for t, graph in enumerate(tqdm(graphs, total=len(graphs), unit='graph',
-                                   desc=desc, disable=not verbose)):
+    if workers <= 1:
+        tables = map(nodeTable, paths, [degrees]*len(paths))
+        tables = list(tqdm(tables, total=len(paths), unit='graph', desc=desc, 
+                           disable=not verbose))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            tables = executor.map(nodeTable, paths, [degrees]*len(paths), 
+                                  chunksize=max(1, len(paths)//(4*workers)))
+            tables = list(tqdm(tables, total=len(paths), unit='graph', 
+                               desc=desc, disable=not verbose))
+    
+    counts = [len(table[0]) for table in tables]
+    if tables:
+        columns = {'x':np.concatenate([table[0] for table in tables]), 
+                   'y':np.concatenate([table[1] for table in tables]), 
+                   't':np.repeat(np.arange(len(tables)), counts), 
+                   'degree':np.concatenate([table[2] for table in tables])}
+    else:
+        columns = {'x':np.zeros(0), 'y':np.zeros(0), 
+                   't':np.zeros(0, dtype=int), 'degree':np.zeros(0, dtype=int)}
+    
+    if os.path.splitext(dest_path)[1] == '.npz':
+        np.savez(dest_path, **columns)
+    else:
+        pd.DataFrame(columns).to_csv(dest_path, index=False)
         
-        G = nx.read_gpickle(graph[0])
-        if not nx.is_empty(G):
-            dfNodesG = extractDataForCSV(G, extract_edges=False, 
-                   extract_nodes=True, extract_degrees=[3], show_degrees=False)
-            removeColumns(dfNodesG, ['conductivity']) # no need for this column   
-            dfNodesG['t'] = t # adding time column
-            df = pd.concat([df, dfNodesG], ignore_index=True) # updating the DataFrame
+def readNodesTable(path):
+    """
+    Reads a table of nodes written by createNodesCSVForTracking(), as a csv 
+    or a npz file.
+    
+    :param str path: absolute path of the table
     
-    df.to_csv(dest_path, index=False)
+    :return: the table of nodes, with the columns 'x', 'y', 't' and 'degree'
+    :rtype: pd.DataFrame
+    """
+    
+    if os.path.splitext(path)[1] == '.npz':
+        with np.load(path) as data:
+            return pd.DataFrame({key:data[key] for key in data.files})
+    return pd.read_csv(path)
     
 def extractDataForCSV(G, extract_edges=True, extract_nodes=True, 
                       extract_degrees=[], show_degrees=True):
     """
-    Extracts DataFrames from a graph for writing into a csv file.
-    
-    :param nx.Graph G: the graph from which to extract data
+    Extracts DataFrames from a graph for writing into a csv file. The tables 
+    hold all the attributes of the edges and of the nodes (cf 
+    GraphArrays.attributeTable()), the coordinates of the edges ends are 
+    added by fancy indexing and the nodes are selected by degree with a 
+    boolean mask.
+    
+    :param G: the graph from which to extract data, or the absolute path of 
+        a graph file, or a view of its arrays
+    :type G: nx.Graph or str or GraphArrays
     :param bool extract_edges: True to extract edges data, False otherwise
     :param bool extract_nodes: True to extract nodes data, False otherwise
     :param in extract_degrees: a list of the kind of nodes to extract, 
@@ -867,30 +2940,22 @@ def extractDataForCSV(G, extract_edges=True, extract_nodes=True,
     :rtype: pd.DataFrame or (pd.DataFrame, pd.DataFrame)
     """
     
-    # Converting nodes label to successive integers for easier use
-    G = nx.convert_node_labels_to_integers(G, first_label=0, 
-                                               ordering='default', 
-                                               label_attribute=None)   
+    view = G if isinstance(G, GraphArrays) else GraphArrays(G)
+    
     # Edges extraction
     if extract_edges:
         
-        # Creation of a DataFrame from the edges attributes
-        edges = G.edges(data=True)
-        data = [x[2] for x in edges]
-        dfEdges = pd.DataFrame(data)
-        
-        # Preparing data for the nodes coordinates
-        x_node = np.fromiter(nx.get_node_attributes(G, 'x').values(), dtype=int) # list of node abscissa by node id       
-        y_node = np.fromiter(nx.get_node_attributes(G, 'y').values(), dtype=int) # list of node ordinate by node id
-        
-        node1 = [x[0] for x in edges] # list of edges first node id
-        node2 = [x[1] for x in edges] # list of edges second node id      
+        # Nodes coordinates by node index, and edges ends
+        x_node = view.x.astype(int) 
+        y_node = view.y.astype(int)
+        node1 = view.edges[:, 0]
+        node2 = view.edges[:, 1]
         
-        # Adding the nodes coordinates
-        dfEdges['n1_x'] = [x_node[i] for i in node1]
-        dfEdges['n1_y'] = [y_node[i] for i in node1]
-        dfEdges['n2_x'] = [x_node[i] for i in node2]
-        dfEdges['n2_y'] = [y_node[i] for i in node2]
+        dfEdges = view.attributeTable('edges')
+        dfEdges['n1_x'] = x_node[node1]
+        dfEdges['n1_y'] = y_node[node1]
+        dfEdges['n2_x'] = x_node[node2]
+        dfEdges['n2_y'] = y_node[node2]
       
         if not extract_nodes:
             return dfEdges
@@ -898,22 +2963,13 @@ def extractDataForCSV(G, extract_edges=True, extract_nodes=True,
     # Nodes extraction
     if extract_nodes:
         
-        # Creation of a DataFrame from the nodes attributes
-        nodes = G.nodes(data=True)
-        data = [x[1] for x in nodes]       
-        dfNodes = pd.DataFrame(data)
-
-        # Adding the degree column for later selection
-        degrees = np.array([degree for node, degree in nx.degree(G)], dtype=int)
-        dfNodes['degree'] = degrees
+        dfNodes = view.attributeTable('nodes')
+        if show_degrees:
+            dfNodes['degree'] = view.degree
         
         # Extraction of nodes of specified degree
         if len(extract_degrees) > 0: 
-            dfNodes = dfNodes[dfNodes['degree'].isin(extract_degrees)]
-        
-        # Removing the degree column if necessary
-        if not show_degrees:
-            removeColumns(dfNodes, ['degree'])
+            dfNodes = dfNodes[np.isin(view.degree, extract_degrees)]
                 
         if not extract_edges:
             return dfNodes
@@ -961,36 +3017,152 @@ def removeColumns(data, columns):
     for col in columns:
         data.drop(col, axis=1, inplace=True)
 
+def diskOffsets(radius):
+    """
+    Computes the pixel offsets of a filled disk, as drawn by cv2.circle(): 
+    the kernel stamped by stampDisks().
+    
+    :param int radius: the radius of the disk in pixels
+    
+    :return: the row and column offsets of the pixels of the disk
+    :rtype: (ndarray, ndarray)
+    """
+    
+    kernel = np.zeros((2*radius+1, 2*radius+1), dtype=np.uint8)
+    cv2.circle(kernel, (radius, radius), radius, 1, thickness=-1)
+    dy, dx = np.nonzero(kernel)
+    return dy - radius, dx - radius
+
+def stampDisks(img, x_node, y_node, classes, table, radii, loop_nodes=10000):
+    """
+    Draws filled disks on an image at once, as successive cv2.circle() calls 
+    would: the disk of node i has the color table[classes[i]] and the radius 
+    radii[classes[i]], and is drawn over those of the nodes before it. Each 
+    pixel of a canvas covering the bounding box of the disks keeps the 
+    highest index of the nodes whose disk covers it, and the image is then 
+    colored in one pass by the class of these nodes. 
+    
+    The nodes are stamped radius by radius, and offset by offset of the disk: 
+    for one offset, a pixel is only reached by the nodes with the same 
+    center, of which the last one is kept beforehand, so that each pixel is 
+    compared and written once. The temporary arrays hold one value per node. 
+    Below 'loop_nodes' nodes, the disks are simply drawn by cv2.circle(), 
+    which is faster (cf OverlayBenchmark.py).
+    
+    :param ndarray img: the image on which to draw, (height, width, 3)
+    :param ndarray x_node: the columns of the centers, as integers
+    :param ndarray y_node: the rows of the centers, as integers
+    :param ndarray classes: the class of each node, index in 'table'
+    :param table: the color of each class
+    :type table: list((int, int, int)) or ndarray
+    :param radii: the radius in pixels of the disks of each class, or one 
+        radius for all the classes
+    :type radii: list(int) or int
+    :param int loop_nodes: the number of nodes below which the disks are 
+        drawn one by one by cv2.circle()
+    """
+    
+    radii = np.broadcast_to(radii, len(table))
+    if len(classes) < loop_nodes:
+        circle = cv2.circle # resolved once, cf LazyImport
+        colors = [tuple(int(c) for c in color) for color in table]
+        sizes = [int(radius) for radius in radii]
+        for x, y, c in zip(x_node.tolist(), y_node.tolist(), classes.tolist()):
+            circle(img, (x, y), sizes[c], colors[c], thickness=-1)
+        return
+    table = np.asarray(table, dtype=img.dtype)
+    
+    # Nodes whose disk may reach the image, in drawing order
+    height, width = img.shape[:2]
+    largest = int(radii.max())
+    order = np.flatnonzero((x_node >= -largest) & (x_node < width+largest) & 
+                           (y_node >= -largest) & (y_node < height+largest)
+                           ).astype(np.int32)
+    if not len(order):
+        return
+    
+    # Canvas over the bounding box of their disks, with a margin of the 
+    # largest radius on each side so that no disk pixel falls outside
+    top = int(y_node[order].min()) - largest
+    left = int(x_node[order].min()) - largest
+    box_height = int(y_node[order].max()) + largest + 1 - top
+    box_width = int(x_node[order].max()) + largest + 1 - left
+    canvas = np.full(box_height*box_width, -1, dtype=np.int32)
+    center = ((y_node[order] - top) * box_width + 
+              (x_node[order] - left)).astype(np.int32)
+    
+    for radius in set(radii[np.unique(classes[order])].tolist()):
+        
+        # Last node of each center among the disks of this radius
+        group = np.flatnonzero(np.isin(classes[order], 
+                                       np.flatnonzero(radii == radius)))
+        group = group[np.argsort(center[group], kind='stable')]
+        last = np.append(center[group][1:] != center[group][:-1], True)
+        group_center, group_order = center[group][last], order[group][last]
+        
+        dy, dx = diskOffsets(radius)
+        for offset in (dy * box_width + dx).tolist():
+            index = group_center + offset
+            canvas[index] = np.maximum(canvas[index], group_order)
+    
+    # Coloring of the part of the canvas within the image
+    canvas = canvas.reshape(box_height, box_width)[
+        max(-top, 0):height-top, max(-left, 0):width-left]
+    rows, columns = np.nonzero(canvas >= 0)
+    img[rows + max(top, 0), columns + max(left, 0)] = \
+        table[classes[canvas[rows, columns]]]
+
+def drawNodesBatch(graphs, img, size, colors):
+    """
+    Draws the tagged nodes of several graphs on one image at once. The color
+    of each node is given by its tag: the tags not listed in colors are 
+    added and linked with a random color. The nodes of all the graphs are 
+    gathered, their colors looked up in a table of the tags, and the disks 
+    stamped together, the nodes of the last graphs being drawn over those 
+    of the first ones (cf stampDisks()).
+    
+    :param graphs: the graphs containing the nodes to draw
+    :type graphs: list(nx.Graph or GraphArrays or str (path of a graph file))
+    :param ndarray img: the image on which to draw, (height, width, 3)
+    :param int size: the radius of the disks to draw in pixels
+    :param colors: a dictionary assigning a color to each node tag
+    :type colors: dict{int: (int, int, int)}
+    """
+    
+    x_node, y_node, tags = [], [], []
+    for G in graphs:
+        view = G if isinstance(G, GraphArrays) else GraphArrays(G)
+        tagged = view.tag >= 0
+        x_node.append(view.x[tagged].astype(np.int64))
+        y_node.append(view.y[tagged].astype(np.int64))
+        tags.append(view.tag[tagged])
+    if not graphs or not sum(len(t) for t in tags):
+        return
+    x_node = np.concatenate(x_node)
+    y_node = np.concatenate(y_node)
+    
+    # Color table of the tags, the new tags getting random colors
+    unique_tags, tag_index = np.unique(np.concatenate(tags), 
+                                       return_inverse=True)
+    new = [tag for tag in unique_tags.tolist() if tag not in colors]
+    for tag, color in zip(new, np.random.randint(0, 256, (len(new), 3))):
+        colors[tag] = tuple(color.tolist())
+    table = [colors[tag] for tag in unique_tags.tolist()]
+    
+    stampDisks(img, x_node, y_node, tag_index, table, size)
+
 def drawNodesRandomColors(G, img, size, colors):
     """
     Draws the nodes of a graph on an image. The color of each node is given by
     its tag. If the tag is not listed in colors, it is added and linked with a 
-    random color.
+    random color. Cf drawNodesBatch() to draw several graphs at once.
     
-    :param nx.Graph G: the graph containing the nodes to draw
+    :param G: the graph containing the nodes to draw
+    :type G: nx.Graph or GraphArrays or str (path of a graph file)
     :param ndarray img: the image on which to draw
     :param int size: the size of the circles to draw in pixels
     :param colors: a dictionary assigning a color to each node tag
     :type colors: dict{int: (int, int, int)}
     """
     
-    G = nx.convert_node_labels_to_integers(G, first_label=0, 
-                                               ordering='default', 
-                                               label_attribute=None)
-    
-    dict_tag = nx.get_node_attributes(G, 'tag')
-    
-    # Nodes drawing
-    for node_id, node_tag in dict_tag.items():
-        
-        x = int(G.node[node_id]['x'])
-        y = int(G.node[node_id]['y'])
-        
-        if node_tag in colors:
-            color = colors[node_tag]
-        else:
-            color = np.random.choice(range(256), 3)
-            color = (int(color[0]), int(color[1]), int(color[2]))
-            colors[node_tag] = color
-        
-        cv2.circle(img, (x, y), size, color=color, thickness=-1)
+    drawNodesBatch([G], img, size, colors)